@@ -0,0 +1,32 @@
+"""Per-datum cost of `in` tests against literal lists, in the server-side evaluator.
+
+Compares the linear `indexof` search with the constant object lookup, for growing list sizes, with py2vega installed:
+
+    python benchmarks/membership.py
+"""
+
+import timeit
+
+from py2vega import Translator
+from py2vega.evaluator import compile_expression
+
+
+def run(size, number=20000):
+    ids = ['id{}'.format(idx) for idx in range(size)]
+    code = 'value in {}'.format(repr(ids))
+    # Look for the last element, which is the worst case for the linear search
+    variables = {'value': ids[-1]}
+
+    results = []
+    for threshold in (None, 1):
+        evaluate = compile_expression(Translator(['value'], lookup_threshold=threshold).translate_expression(code))
+        seconds = min(timeit.repeat(lambda: evaluate(variables), number=number, repeat=3))
+        results.append(seconds / number * 1e6)
+    return results
+
+
+if __name__ == '__main__':
+    print('{:>8} {:>16} {:>16}'.format('size', 'indexof (us)', 'lookup (us)'))
+    for size in (4, 16, 64, 256, 1024, 4096):
+        search, lookup = run(size)
+        print('{:>8} {:>16.3f} {:>16.3f}'.format(size, search, lookup))
@@ -0,0 +1,33 @@
+"""Translation time of randomly generated functions, of growing size.
+
+The functions are generated from fixed seeds, so that runs can be compared. With py2vega installed:
+
+    python benchmarks/translation.py
+"""
+
+import time
+
+from py2vega import Translator
+from py2vega.generator import ProgramGenerator, default_whitelist
+
+
+def run(size, depth, count=50):
+    generator = ProgramGenerator(seed=size * 100 + depth, size=size, depth=depth)
+    funcs = [generator.function() for _ in range(count)]
+
+    translator = Translator(default_whitelist)
+    # Parsing the sources is cached by the translator, it is not part of what is measured
+    for func in funcs:
+        translator.parse_function(func)
+
+    start = time.perf_counter()
+    length = sum(len(translator.translate(func)) for func in funcs)
+    seconds = time.perf_counter() - start
+    return seconds / count * 1e3, length // count
+
+
+if __name__ == '__main__':
+    print('{:>6} {:>6} {:>16} {:>16}'.format('size', 'depth', 'time (ms)', 'length'))
+    for size, depth in ((5, 2), (10, 3), (20, 4), (40, 4), (80, 5)):
+        milliseconds, length = run(size, depth)
+        print('{:>6} {:>6} {:>16.3f} {:>16}'.format(size, depth, milliseconds, length))
@@ -1 +1 @@
-from .main import py2vega, Variable  # noqa
+from .main import py2vega, Translator, Variable  # noqa
@@ -0,0 +1,129 @@
+"""Static analyses of translated Vega expressions."""
+
+from .cost import CostModel, is_array_literal
+from .expression import (
+    Array, Binary, Call, Conditional, Identifier, Literal, Logical, Member, Object, Parameter, Unary
+)
+
+comparison_operators = frozenset(['==', '!=', '<', '<=', '>', '>=', '===', '!=='])
+
+# Vega functions that always return a boolean
+predicate_functions = frozenset([
+    'isArray', 'isBoolean', 'isDate', 'isDefined', 'isNumber', 'isObject', 'isRegExp', 'isString',
+    'isValid', 'isNaN', 'isFinite', 'inrange', 'test'
+])
+
+# Vega functions that have no side effect, that always return the same value given the same
+# arguments, and that never throw whatever their arguments are
+safe_functions = frozenset([
+    'isArray', 'isBoolean', 'isDate', 'isDefined', 'isNumber', 'isObject', 'isRegExp', 'isString',
+    'isValid', 'isNaN', 'isFinite', 'abs', 'acos', 'asin', 'atan', 'atan2', 'ceil', 'cos', 'exp',
+    'floor', 'log', 'max', 'min', 'pow', 'round', 'sin', 'sqrt', 'tan', 'clamp',
+    'toBoolean', 'toNumber', 'toString',
+    # String functions convert their first argument to a string first
+    'lower', 'upper', 'trim'
+])
+
+
+def is_predicate(expr):
+    """Return True if the expression always evaluates to a boolean."""
+    if isinstance(expr, Literal):
+        return isinstance(expr.value, bool)
+    if isinstance(expr, Binary):
+        return expr.operator in comparison_operators
+    if isinstance(expr, Unary):
+        return expr.operator == '!'
+    if isinstance(expr, Logical):
+        return all(is_predicate(operand) for operand in expr.operands)
+    if isinstance(expr, Conditional):
+        return is_predicate(expr.consequent) and is_predicate(expr.alternate)
+    if isinstance(expr, Call):
+        return expr.callee in predicate_functions
+    return False
+
+
+def is_safe(expr):
+    """Return True if evaluating the expression has no side effect and can never throw.
+
+    Members of whitelisted variables are assumed to be accessible, e.g. `datum.value` is safe
+    while `datum.value.x` is not, as `datum.value` may be null.
+    """
+    if isinstance(expr, (Literal, Identifier, Parameter)):
+        return True
+    if isinstance(expr, Member):
+        return isinstance(expr.object, Identifier)
+    if isinstance(expr, (Binary, Unary, Logical, Conditional, Array, Object)):
+        return all(is_safe(child) for child in expr.children())
+    if isinstance(expr, Call):
+        if expr.callee == 'inrange':
+            return len(expr.arguments) == 2 and is_array_literal(expr.arguments[1]) and is_safe(expr.arguments[0]) and is_safe(expr.arguments[1])
+        return expr.callee in safe_functions and all(is_safe(arg) for arg in expr.arguments)
+    return False
+
+
+def _node_label(expr):
+    """Return what distinguishes a node from another node of the same class with the same children."""
+    if isinstance(expr, Literal):
+        return expr.text
+    if isinstance(expr, (Identifier, Parameter)):
+        return expr.name
+    if isinstance(expr, Member):
+        return expr.property
+    if isinstance(expr, Call):
+        return expr.callee
+    if isinstance(expr, (Unary, Binary, Logical)):
+        return expr.operator
+    if isinstance(expr, Conditional):
+        return expr.function
+    return None
+
+
+class StructureTable(object):
+    """Number translated expressions by structure.
+
+    Two expressions get the same number if and only if they are structurally equal, parentheses
+    put around them aside. Numbers are memoized per node and each node is numbered from the numbers
+    of its children, so numbering an expression is linear in the number of its distinct nodes.
+    """
+
+    def __init__(self):
+        self._numbers = {}
+        # Nodes are kept alive along with their number, so that their ids are never reused
+        self._memo = {}
+
+    def number(self, expr):
+        """Return the structure number of an expression."""
+        memo = self._memo.get(id(expr))
+        if memo is not None:
+            return memo[1]
+
+        key = (expr.__class__, _node_label(expr), tuple(self.number(child) for child in expr.children()))
+        result = self._numbers.setdefault(key, len(self._numbers))
+        self._memo[id(expr)] = (expr, result)
+        return result
+
+
+def order_operands(operands):
+    """Reorder the operands of a `&&` or `||` chain so that the cheapest ones are evaluated first.
+
+    The operands are reordered only if they are all predicates, so that the value of the chain is unchanged.
+    An operand that may throw is never moved before an operand that was preceding it, as this one may be
+    guarding it (e.g. `isValid(datum.a) && datum.a.b > 3`).
+    """
+    if len(operands) < 2 or not all(is_predicate(operand) for operand in operands):
+        return list(operands)
+
+    model = CostModel()
+    costs = [model.measure(operand).cost for operand in operands]
+    safe = [is_safe(operand) for operand in operands]
+
+    ordered = []
+    remaining = list(range(len(operands)))
+    while remaining:
+        # An unsafe operand is available only once all the operands preceding it have been emitted
+        available = [idx for position, idx in enumerate(remaining) if safe[idx] or position == 0]
+        chosen = min(available, key=lambda idx: (costs[idx], idx))
+        ordered.append(operands[chosen])
+        remaining.remove(chosen)
+
+    return ordered
@@ -0,0 +1,327 @@
+"""Compact binary artifacts of translated expressions.
+
+An artifact holds translated expressions in their internal form, so that they can be stored, cached or
+sent to other processes and loaded back without parsing, then analyzed, evaluated or emitted on demand.
+
+Layout, all integers being unsigned LEB128 varints:
+- the `MAGIC` bytes and the format version
+- the table of the strings, names and string literals, each one being stored once: count, then length
+  and UTF-8 bytes of each string
+- the table of the distinct nodes, each node coming after its children: count, then each node as a varint
+  of its tag and flags, followed by its fields, children being given by their index in the table
+- the indices of the root nodes: count, then indices
+"""
+
+import struct
+
+from .expression import Array, Binary, Call, Conditional, Identifier, Index, Literal, Logical, Member, Object, Parameter, Unary
+from .javascript import RegExp
+
+MAGIC = b'P2VG'
+VERSION = 1
+
+# Node tags
+_LITERAL, _IDENTIFIER, _PARAMETER, _MEMBER, _INDEX, _CALL, _UNARY, _BINARY, _LOGICAL, _CONDITIONAL, _ARRAY, _OBJECT = range(12)
+
+_tags = {
+    Literal: _LITERAL, Identifier: _IDENTIFIER, Parameter: _PARAMETER, Member: _MEMBER, Index: _INDEX, Call: _CALL,
+    Unary: _UNARY, Binary: _BINARY, Logical: _LOGICAL, Conditional: _CONDITIONAL, Array: _ARRAY, Object: _OBJECT,
+}
+
+# Node flags, stored in the low bits of the tag varint
+_PARENS = 1
+_FUNCTION = 2
+_LOCATION = 4
+_flag_bits = 3
+
+# Literal value tags
+_NULL, _FALSE, _TRUE, _INTEGER, _FLOAT, _STRING, _LIST, _DICT, _REGEXP = range(9)
+
+_double = struct.Struct('<d')
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class _Writer(object):
+    def __init__(self, locations):
+        self.locations = locations
+        self.strings = []
+        self.string_indices = {}
+        self.nodes = bytearray()
+        self.count = 0
+        self.indices = {}
+        # Index of the node of each encoding, nodes being equal if their fields and children are
+        self.encodings = {}
+
+    def string(self, out, value):
+        idx = self.string_indices.get(value)
+        if idx is None:
+            idx = self.string_indices[value] = len(self.strings)
+            self.strings.append(value)
+        _write_varint(out, idx)
+
+    def value(self, out, value):
+        if value is None:
+            out.append(_NULL)
+        elif isinstance(value, bool):
+            out.append(_TRUE if value else _FALSE)
+        elif isinstance(value, int):
+            out.append(_INTEGER)
+            # Zigzag encoding of signed integers
+            _write_varint(out, 2 * value if value >= 0 else -2 * value - 1)
+        elif isinstance(value, float):
+            out.append(_FLOAT)
+            out.extend(_double.pack(value))
+        elif isinstance(value, str):
+            out.append(_STRING)
+            self.string(out, value)
+        elif isinstance(value, (list, tuple)):
+            out.append(_LIST)
+            _write_varint(out, len(value))
+            for element in value:
+                self.value(out, element)
+        elif isinstance(value, dict):
+            out.append(_DICT)
+            _write_varint(out, len(value))
+            for key, element in value.items():
+                self.value(out, key)
+                self.value(out, element)
+        elif isinstance(value, RegExp):
+            out.append(_REGEXP)
+            self.string(out, value.source)
+            self.string(out, value.flags)
+        else:
+            raise ValueError('Cannot store a literal of type {}'.format(value.__class__.__name__))
+
+    def add(self, expr):
+        """Add the nodes of an expression which are not in the table yet, children first, and return the index of its root."""
+        stack = [(expr, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in self.indices:
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children()) if id(child) not in self.indices)
+                continue
+
+            encoding = self._encode(node)
+            idx = self.encodings.get(encoding)
+            if idx is None:
+                idx = self.encodings[encoding] = self.count
+                self.nodes.extend(encoding)
+                self.count += 1
+            self.indices[id(node)] = (node, idx)
+        return self.indices[id(expr)][1]
+
+    def _encode(self, node):
+        tag = _tags.get(node.__class__)
+        if tag is None:
+            raise ValueError('Cannot store a {} node'.format(node.__class__.__name__))
+        location = node.location if self.locations else None
+        flags = (_PARENS if node.parens else 0) | (_LOCATION if location is not None else 0)
+        if tag == _CONDITIONAL and node.function:
+            flags |= _FUNCTION
+
+        out = bytearray()
+        _write_varint(out, tag << _flag_bits | flags)
+        if tag == _LITERAL:
+            self.value(out, node.value)
+        elif tag in (_IDENTIFIER, _PARAMETER):
+            self.string(out, node.name)
+        elif tag == _MEMBER:
+            _write_varint(out, self.indices[id(node.object)][1])
+            self.string(out, node.property)
+        else:
+            if tag in (_CALL, _UNARY, _BINARY, _LOGICAL):
+                self.string(out, node.callee if tag == _CALL else node.operator)
+            if tag in (_CALL, _LOGICAL, _ARRAY):
+                _write_varint(out, len(node.children()))
+            elif tag == _OBJECT:
+                _write_varint(out, len(node.properties))
+            for child in node.children():
+                _write_varint(out, self.indices[id(child)][1])
+
+        if location is not None:
+            _write_varint(out, location[0])
+            _write_varint(out, location[1])
+        return bytes(out)
+
+    def finish(self, roots):
+        out = bytearray(MAGIC)
+        _write_varint(out, VERSION)
+        _write_varint(out, len(self.strings))
+        for string in self.strings:
+            encoded = string.encode('utf-8')
+            _write_varint(out, len(encoded))
+            out.extend(encoded)
+        _write_varint(out, self.count)
+        out.extend(self.nodes)
+        _write_varint(out, len(roots))
+        for root in roots:
+            _write_varint(out, root)
+        return bytes(out)
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+        self.strings = []
+        self.nodes = []
+
+    def varint(self):
+        # Reading past the end raises an IndexError, reported as a truncated artifact by `read`
+        byte = self.data[self.position]
+        self.position += 1
+        if byte < 0x80:
+            return byte
+        result = byte & 0x7f
+        shift = 7
+        while True:
+            byte = self.data[self.position]
+            self.position += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def bytes(self, size):
+        start = self.position
+        self.position += size
+        if self.position > len(self.data):
+            raise IndexError()
+        return self.data[start:self.position]
+
+    def string(self):
+        return self.strings[self.varint()]
+
+    def ref(self):
+        return self.nodes[self.varint()]
+
+    def refs(self, count):
+        return [self.nodes[self.varint()] for _ in range(count)]
+
+    def value(self):
+        tag = self.varint()
+        if tag == _NULL:
+            return None
+        if tag in (_FALSE, _TRUE):
+            return tag == _TRUE
+        if tag == _INTEGER:
+            value = self.varint()
+            return value >> 1 if not value & 1 else -((value + 1) >> 1)
+        if tag == _FLOAT:
+            return _double.unpack(self.bytes(_double.size))[0]
+        if tag == _STRING:
+            return self.string()
+        if tag == _LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == _DICT:
+            result = {}
+            for _ in range(self.varint()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        if tag == _REGEXP:
+            source = self.string()
+            return RegExp(source, self.string())
+        raise ValueError('Unknown literal tag {} in expression artifact'.format(tag))
+
+    def node(self):
+        header = self.varint()
+        tag = header >> _flag_bits
+        parens = bool(header & _PARENS)
+
+        if tag == _LITERAL:
+            node = Literal(self.value(), parens=parens)
+        elif tag == _IDENTIFIER:
+            node = Identifier(self.string(), parens=parens)
+        elif tag == _PARAMETER:
+            node = Parameter(self.string(), parens=parens)
+        elif tag == _MEMBER:
+            node = self.ref()
+            node = Member(node, self.string(), parens=parens)
+        elif tag == _INDEX:
+            node = Index(self.ref(), self.ref(), parens=parens)
+        elif tag == _CALL:
+            callee = self.string()
+            node = Call(callee, self.refs(self.varint()), parens=parens)
+        elif tag == _UNARY:
+            operator = self.string()
+            node = Unary(operator, self.ref(), parens=parens)
+        elif tag == _BINARY:
+            operator = self.string()
+            node = Binary(operator, self.ref(), self.ref(), parens=parens)
+        elif tag == _LOGICAL:
+            operator = self.string()
+            node = Logical(operator, self.refs(self.varint()), parens=parens)
+        elif tag == _CONDITIONAL:
+            test, consequent, alternate = self.refs(3)
+            node = Conditional(test, consequent, alternate, function=bool(header & _FUNCTION), parens=parens)
+        elif tag == _ARRAY:
+            node = Array(self.refs(self.varint()), parens=parens)
+        elif tag == _OBJECT:
+            children = self.refs(2 * self.varint())
+            node = Object(zip(children[::2], children[1::2]), parens=parens)
+        else:
+            raise ValueError('Unknown node tag {} in expression artifact'.format(tag))
+
+        if header & _LOCATION:
+            line = self.varint()
+            node.location = (line, self.varint())
+        return node
+
+    def read(self):
+        try:
+            return self._read()
+        except IndexError:
+            raise ValueError('Truncated or corrupted expression artifact')
+
+    def _read(self):
+        if self.bytes(len(MAGIC)) != MAGIC:
+            raise ValueError('Not an expression artifact')
+        version = self.varint()
+        if version != VERSION:
+            raise ValueError('Unsupported expression artifact version {}, expected {}'.format(version, VERSION))
+
+        for _ in range(self.varint()):
+            self.strings.append(self.bytes(self.varint()).decode('utf-8'))
+        for _ in range(self.varint()):
+            self.nodes.append(self.node())
+        return self.refs(self.varint())
+
+
+def dump_expressions(expressions, locations=True):
+    """Return the artifact of a list of translated expressions, as bytes.
+
+    Equal nodes, e.g. the same member access used many times or nodes shared by the expressions, are stored
+    once and are shared once loaded.
+    The locations of the nodes in the Python code, used by source maps, are left out if `locations` is False.
+    """
+    writer = _Writer(locations)
+    roots = [writer.add(expr) for expr in expressions]
+    return writer.finish(roots)
+
+
+def load_expressions(data):
+    """Return the list of the translated expressions of an artifact, a `ValueError` being raised if it is not valid."""
+    return _Reader(data).read()
+
+
+def dump_expression(expr, locations=True):
+    """Return the artifact of a translated expression, as bytes."""
+    return dump_expressions([expr], locations)
+
+
+def load_expression(data):
+    """Return the translated expression of an artifact holding a single one."""
+    expressions = load_expressions(data)
+    if len(expressions) != 1:
+        raise ValueError('The artifact holds {} expressions'.format(len(expressions)))
+    return expressions[0]
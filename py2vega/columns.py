@@ -0,0 +1,148 @@
+"""Chunked evaluation of translated Vega expressions over columnar data, e.g. memory-mapped files.
+
+Columns are read one chunk of rows at a time, so that the memory used by an evaluation is proportional
+to the chunk size and not to the number of rows. numpy is needed to read `.npy` files and pyarrow to
+read Arrow IPC files.
+"""
+
+from .evaluator import compile_expression
+from .expression import Identifier, Index, Literal, Member
+from .javascript import truthy
+
+default_chunk_size = 65536
+
+
+def memory_map_columns(source):
+    """Open memory-mapped columns, which are then only read from the disk chunk by chunk.
+
+    `source` is either a mapping of field names to `.npy` file paths, or the path of an Arrow IPC file.
+    Return a mapping of field names to columns.
+    """
+    if isinstance(source, dict):
+        import numpy
+
+        return dict((name, numpy.load(path, mmap_mode='r')) for name, path in source.items())
+
+    import pyarrow
+    import pyarrow.ipc
+
+    table = pyarrow.ipc.open_file(pyarrow.memory_map(source, 'r')).read_all()
+    return dict((name, table.column(name)) for name in table.column_names)
+
+
+def read_chunk(column, start, stop):
+    """Return the values of the rows `start` to `stop` of a column as a list of Python values."""
+    if hasattr(column, 'to_pylist'):
+        # Arrow arrays
+        return column.slice(start, stop - start).to_pylist()
+    chunk = column[start:stop]
+    # numpy scalars are converted to Python values, which the evaluator works with
+    return chunk.tolist() if hasattr(chunk, 'tolist') else list(chunk)
+
+
+def datum_fields(expr, datum='datum'):
+    """Return the set of the fields of the datum read by a translated expression, or None if it uses the whole datum."""
+    fields = set()
+    visited = set()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if id(node) in visited:
+            continue
+        visited.add(id(node))
+
+        if isinstance(node, Identifier) and node.name == datum:
+            return None
+        if isinstance(node, Member) and isinstance(node.object, Identifier) and node.object.name == datum:
+            fields.add(node.property)
+            continue
+        if isinstance(node, Index) and isinstance(node.object, Identifier) and node.object.name == datum and \
+                isinstance(node.index, Literal) and isinstance(node.index.value, str):
+            fields.add(node.index.value)
+            continue
+        stack.extend(node.children())
+    return fields
+
+
+class ChunkedEvaluator(object):
+    """Evaluate a translated expression for every row of columnar data, one chunk of rows at a time.
+
+    The expression is compiled once, and only the columns of the fields it reads are read. Each row
+    is given to the expression as the `datum` variable, a missing column being an undefined field.
+    """
+
+    def __init__(self, expr, chunk_size=default_chunk_size, datum='datum', functions=None, parameters=None):
+        """Construct a ChunkedEvaluator, given additional function implementations and template parameter values."""
+        self.expr = expr
+        self.evaluate = compile_expression(expr, functions, parameters)
+        self.chunk_size = chunk_size
+        self.datum = datum
+        self.fields = datum_fields(expr, datum)
+
+    def read(self, columns, start=0, stop=None):
+        """Yield the field names read by the expression, and the values of these fields for each chunk of rows.
+
+        Only the rows `start` to `stop` are read, `stop` defaulting to the number of rows.
+        """
+        names = sorted(columns if self.fields is None else self.fields.intersection(columns))
+        lengths = set(len(column) for column in columns.values())
+        if len(lengths) > 1:
+            raise ValueError('All the columns must have the same number of rows')
+        length = lengths.pop() if lengths else 0
+        stop = length if stop is None else min(stop, length)
+
+        for chunk_start in range(start, stop, self.chunk_size):
+            chunk_stop = min(chunk_start + self.chunk_size, stop)
+            yield names, chunk_stop - chunk_start, [read_chunk(columns[name], chunk_start, chunk_stop) for name in names]
+
+    def chunks(self, columns, variables=None, start=0, stop=None):
+        """Yield the list of the results of each chunk of rows.
+
+        `columns` is a mapping of field names to columns of the same length, e.g. as returned by
+        `memory_map_columns`, and `variables` a mapping of the values of the other variables.
+        """
+        evaluate = self.evaluate
+        variables = {} if variables is None else dict(variables)
+        for names, size, chunks in self.read(columns, start, stop):
+            results = []
+            for values in zip(*chunks) if chunks else [()] * size:
+                variables[self.datum] = dict(zip(names, values))
+                results.append(evaluate(variables))
+            yield results
+
+    def filter(self, columns, variables=None, start=0, stop=None, zone_map=None):
+        """Yield the list of the indices of the rows of each chunk for which the expression is truthy.
+
+        Given the `ZoneMap` of the columns, chunks of the zone map for which the expression is always
+        falsy are not read, and the rows of chunks for which it is always truthy are not evaluated.
+        """
+        if zone_map is None:
+            for indices in self._filter(columns, variables, start, stop):
+                yield indices
+            return
+
+        from .zonemap import predicate_outcome
+
+        for chunk_start, chunk_stop, statistics in zone_map.chunks(start, stop):
+            outcome = predicate_outcome(self.expr, statistics, variables, self.datum)
+            if outcome is None:
+                for indices in self._filter(columns, variables, chunk_start, chunk_stop):
+                    yield indices
+            else:
+                yield list(range(chunk_start, chunk_stop)) if outcome else []
+
+    def _filter(self, columns, variables, start, stop):
+        offset = start
+        for results in self.chunks(columns, variables, start, stop):
+            yield [offset + idx for idx, result in enumerate(results) if truthy(result)]
+            offset += len(results)
+
+
+def evaluate_chunks(expr, columns, chunk_size=default_chunk_size, variables=None, datum='datum'):
+    """Yield the results of a translated expression for each chunk of `chunk_size` rows of the columns."""
+    return ChunkedEvaluator(expr, chunk_size, datum).chunks(columns, variables)
+
+
+def filter_rows(expr, columns, chunk_size=default_chunk_size, variables=None, datum='datum', zone_map=None):
+    """Yield, chunk by chunk, the indices of the rows of the columns for which a translated expression is truthy."""
+    return ChunkedEvaluator(expr, chunk_size, datum).filter(columns, variables, zone_map=zone_map)
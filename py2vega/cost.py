@@ -0,0 +1,142 @@
+"""Static cost model of translated Vega expressions."""
+
+from collections import namedtuple
+
+from .expression import Array, Call, Conditional, Literal, Logical, Object, Parameter
+
+
+ExpressionCost = namedtuple('ExpressionCost', ['nodes', 'depth', 'length', 'cost'])
+ExpressionCost.__doc__ = """Cost of a translated expression.
+
+nodes: number of nodes of the expression, a node appearing multiple times is counted each time
+depth: depth of the expression tree
+length: length of the emitted Vega-expression string
+cost: estimated cost of evaluating the expression for one datum, in abstract units
+"""
+
+# Estimated evaluation cost of Vega functions, a function that is not listed costs `default_function_weight`
+default_function_weight = 2
+
+function_weights = {
+    # Cheap math and type checking functions
+    'abs': 1, 'ceil': 1, 'floor': 1, 'round': 1, 'sqrt': 1, 'min': 1, 'max': 1, 'clamp': 1,
+    'isArray': 1, 'isBoolean': 1, 'isDate': 1, 'isDefined': 1, 'isNumber': 1, 'isObject': 1,
+    'isRegExp': 1, 'isString': 1, 'isValid': 1, 'isNaN': 1, 'isFinite': 1, 'inrange': 1,
+    'toBoolean': 1, 'toNumber': 1, 'toString': 1,
+    # String functions
+    'indexof': 3, 'lastindexof': 3, 'lower': 4, 'upper': 4, 'pad': 4, 'trim': 4, 'truncate': 4,
+    'slice': 4, 'substring': 4, 'split': 8, 'replace': 12, 'parseFloat': 4, 'parseInt': 4,
+    'sequence': 8, 'span': 4, 'extent': 4, 'join': 6, 'reverse': 4, 'peek': 1,
+    # Regular expressions are compiled when they are constructed
+    'regexp': 30, 'test': 10,
+    # Date and time functions build or inspect Date instances
+    'datetime': 6, 'utc': 6, 'toDate': 8, 'now': 2, 'time': 2,
+    # Formatting functions parse their specifier
+    'format': 20, 'timeFormat': 20, 'utcFormat': 20, 'timeParse': 25, 'utcParse': 25,
+    'monthFormat': 6, 'monthAbbrevFormat': 6, 'dayFormat': 6, 'dayAbbrevFormat': 6,
+    # Color constructors allocate color objects
+    'rgb': 10, 'hsl': 10, 'lab': 15, 'hcl': 15,
+    # Scale functions look up the scale in the scope first
+    'scale': 6, 'invert': 6, 'copy': 20, 'domain': 4, 'range': 4, 'bandwidth': 3, 'bandspace': 4,
+    'gradient': 20, 'merge': 10,
+}
+
+
+def is_array_literal(expr):
+    """Return True if the expression is an array literal."""
+    return isinstance(expr, Array) or (isinstance(expr, Literal) and isinstance(expr.value, (list, tuple)))
+
+
+def array_literal_size(expr):
+    """Return the number of elements of an array literal."""
+    return len(expr.elements) if isinstance(expr, Array) else len(expr.value)
+
+
+class Py2VegaBudgetError(RuntimeError):
+    def __init__(self, message):
+        super(Py2VegaBudgetError, self).__init__(message)
+
+
+class CostModel(object):
+    """Estimate the cost of translated expressions.
+
+    Results are memoized per node, so that measuring a node whose children were already measured only
+    looks at the node itself. This makes it cheap to measure every node of a tree as it is being built.
+    """
+
+    def __init__(self, weights=None):
+        """Construct a CostModel, given the function weights to use."""
+        self.weights = function_weights if weights is None else weights
+        # Nodes are kept alive along with their cost, so that their ids are never reused
+        self._memo = {}
+
+    def measure(self, expr):
+        """Return the `ExpressionCost` of a translated expression."""
+        memo = self._memo.get(id(expr))
+        if memo is not None:
+            return memo[1]
+
+        children = [self.measure(child) for child in expr.children()]
+
+        result = ExpressionCost(
+            nodes=1 + sum(child.nodes for child in children),
+            depth=1 + max([child.depth for child in children] or [0]),
+            length=expr.overhead() + (2 if expr.parens else 0) + sum(child.length for child in children),
+            cost=self._evaluation_cost(expr, children)
+        )
+
+        self._memo[id(expr)] = (expr, result)
+        return result
+
+    def _evaluation_cost(self, expr, children):
+        if isinstance(expr, Literal):
+            # Array and object literals are allocated each time they are evaluated
+            return 1 + len(expr.value) if isinstance(expr.value, (list, tuple, dict)) else 0
+        if isinstance(expr, Parameter):
+            return 0
+        if isinstance(expr, Conditional):
+            # Only one of the branches is evaluated, assume the most expensive one
+            return 1 + children[0].cost + max(children[1].cost, children[2].cost)
+        if isinstance(expr, Call):
+            weight = self.weights.get(expr.callee, default_function_weight)
+            # Searching in an array literal is linear in its size
+            if expr.callee == 'indexof' and expr.arguments and is_array_literal(expr.arguments[0]):
+                weight += array_literal_size(expr.arguments[0])
+            return weight + sum(child.cost for child in children)
+        if isinstance(expr, (Array, Object)):
+            # Array and object literals are allocated each time they are evaluated
+            return 1 + len(children) + sum(child.cost for child in children)
+        if isinstance(expr, Logical):
+            # Assume the worst case, where no operand short-circuits the evaluation
+            return len(children) - 1 + sum(child.cost for child in children)
+        return 1 + sum(child.cost for child in children)
+
+
+class Budget(object):
+    """Limits on the size and the cost of a translated expression.
+
+    The budget is checked for every node as soon as it is built, so that the translation fails before
+    emitting an expression that is too large.
+    """
+
+    def __init__(self, max_cost=None, max_length=None, weights=None):
+        """Construct a Budget, given the maximum estimated cost and the maximum length of the expression."""
+        self.max_cost = max_cost
+        self.max_length = max_length
+        self.model = CostModel(weights)
+
+    def check(self, expr):
+        """Raise a `Py2VegaBudgetError` if the given node exceeds the budget."""
+        cost = self.model.measure(expr)
+
+        if self.max_length is not None and cost.length > self.max_length:
+            raise Py2VegaBudgetError('The translated expression exceeds the maximum length of {} characters, at least {} characters would be emitted'.format(
+                self.max_length, cost.length))
+        if self.max_cost is not None and cost.cost > self.max_cost:
+            raise Py2VegaBudgetError('The translated expression exceeds the maximum cost of {}, its estimated cost is at least {}'.format(
+                self.max_cost, cost.cost))
+
+
+def estimate_cost(expr, weights=None):
+    """Return the `ExpressionCost` of a translated expression."""
+    return CostModel(weights).measure(expr)
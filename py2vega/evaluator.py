@@ -0,0 +1,548 @@
+"""Server-side evaluation of translated Vega expressions.
+
+Translated expressions are compiled once into a tree of Python closures, which can then be evaluated
+for many data. The evaluation follows JavaScript semantics, and Vega functions are implemented by the
+`vega_function_implementations` mapping.
+"""
+
+import math
+import random as _random
+import re
+
+from .expression import (
+    Array, Binary, Call, Conditional, Identifier, Index, Literal, Logical, Member, Object, Parameter, Unary
+)
+from .javascript import (
+    NaN, RegExp, add, divide, inf, is_nullish, is_number, less_equal, less_than, loose_equals,
+    modulo, power, property_key, strict_equals, to_integer, to_number, to_string, truthy, undefined
+)
+
+constant_values = {
+    'NaN': NaN, 'E': math.e, 'LN2': math.log(2), 'LN10': math.log(10), 'LOG2E': 1 / math.log(2),
+    'LOG10E': 1 / math.log(10), 'PI': math.pi, 'SQRT1_2': math.sqrt(0.5), 'SQRT2': math.sqrt(2),
+    'MIN_VALUE': 5e-324, 'MAX_VALUE': 1.7976931348623157e+308
+}
+
+
+def _math(func):
+    """Wrap a `math` function so that it behaves like its JavaScript counterpart."""
+    def impl(*args):
+        args = [to_number(arg) for arg in args]
+        if any(arg != arg for arg in args):
+            return NaN
+        try:
+            return func(*args)
+        except OverflowError:
+            return inf
+        except ValueError:
+            return NaN
+    return impl
+
+
+def _log(value):
+    value = to_number(value)
+    if value == 0:
+        return -inf
+    if value != value or value < 0:
+        return NaN
+    return math.log(value)
+
+
+def _floor(value):
+    value = to_number(value)
+    if value != value or math.isinf(value):
+        return value
+    return math.floor(value)
+
+
+def _ceil(value):
+    value = to_number(value)
+    if value != value or math.isinf(value):
+        return value
+    return math.ceil(value)
+
+
+def _round(value):
+    value = to_number(value)
+    if value != value or math.isinf(value):
+        return value
+    return math.floor(value + 0.5)
+
+
+def _max(*values):
+    values = [to_number(value) for value in values]
+    if any(value != value for value in values):
+        return NaN
+    return max(values) if values else -inf
+
+
+def _min(*values):
+    values = [to_number(value) for value in values]
+    if any(value != value for value in values):
+        return NaN
+    return min(values) if values else inf
+
+
+def _clamp(value, lower, upper):
+    return _max(lower, _min(value, upper))
+
+
+def _is_valid(value):
+    return not is_nullish(value) and value == value
+
+
+def _coerce(func):
+    """Coercion functions map null, undefined and empty strings to null."""
+    def impl(value):
+        if is_nullish(value) or value == '':
+            return None
+        return func(value)
+    return impl
+
+
+def _to_boolean(value):
+    if value == 'false' or value == '0':
+        return False
+    return truthy(value)
+
+
+def _check_sequence(name, value):
+    if not isinstance(value, (list, str)):
+        raise TypeError('{}: argument is not an array or a string'.format(name))
+
+
+def _indexof(sequence, value):
+    _check_sequence('indexof', sequence)
+    if isinstance(sequence, str):
+        return sequence.find(to_string(value))
+    for idx, elt in enumerate(sequence):
+        if strict_equals(elt, value):
+            return idx
+    return -1
+
+
+def _lastindexof(sequence, value):
+    _check_sequence('lastindexof', sequence)
+    if isinstance(sequence, str):
+        return sequence.rfind(to_string(value))
+    for idx in range(len(sequence) - 1, -1, -1):
+        if strict_equals(sequence[idx], value):
+            return idx
+    return -1
+
+
+def _length(value):
+    if is_nullish(value):
+        raise TypeError('Cannot read property \'length\' of {}'.format(to_string(value)))
+    if isinstance(value, (list, str)):
+        return len(value)
+    return undefined
+
+
+def _slice_bounds(size, start, end):
+    start = to_integer(start) if start is not undefined else 0
+    end = size if end is undefined else to_integer(end)
+    start = max(size + start, 0) if start < 0 else min(start, size)
+    end = max(size + end, 0) if end < 0 else min(end, size)
+    return int(start), int(end)
+
+
+def _slice(sequence, start=undefined, end=undefined):
+    _check_sequence('slice', sequence)
+    start, end = _slice_bounds(len(sequence), start, end)
+    return sequence[start:end]
+
+
+def _substring(string, start=undefined, end=undefined):
+    string = to_string(string)
+    start = min(max(to_integer(start), 0), len(string)) if start is not undefined else 0
+    end = len(string) if end is undefined else min(max(to_integer(end), 0), len(string))
+    start, end = int(min(start, end)), int(max(start, end))
+    return string[start:end]
+
+
+def _pad(string, length, character=' ', align='right'):
+    string = to_string(string)
+    missing = int(to_integer(length)) - len(string)
+    if missing <= 0:
+        return string
+    if align == 'left':
+        return character * missing + string
+    if align == 'center':
+        return character * (missing // 2) + string + character * (missing - missing // 2)
+    return string + character * missing
+
+
+def _truncate(string, length, align='right', ellipsis=u'…'):
+    string = to_string(string)
+    length = int(to_integer(length))
+    size = len(string)
+    kept = max(0, length - len(ellipsis))
+    if size <= length:
+        return string
+    if align == 'left':
+        return ellipsis + string[size - kept:]
+    if align == 'center':
+        return string[:int(math.ceil(kept / 2.0))] + ellipsis + string[size - kept // 2:]
+    return string[:kept] + ellipsis
+
+
+_float_prefix_re = re.compile(r'^[+-]?(Infinity|(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?)')
+
+
+def _parse_float(string):
+    match = _float_prefix_re.match(to_string(string).lstrip())
+    if match is None:
+        return NaN
+    return to_number(match.group(0))
+
+
+def _parse_int(string, radix=undefined):
+    string = to_string(string).strip()
+    explicit = radix is not undefined and to_number(radix)
+    radix = int(to_integer(radix)) if explicit else 10
+    sign = 1
+    if string[:1] in ('-', '+'):
+        sign = -1 if string[0] == '-' else 1
+        string = string[1:]
+    if (radix == 16 or not explicit) and string[:2].lower() == '0x':
+        radix = 16
+        string = string[2:]
+    digits = ''
+    for char in string:
+        try:
+            int(char, radix)
+        except ValueError:
+            break
+        digits += char
+    return sign * int(digits, radix) if digits else NaN
+
+
+def _replacement(replacement):
+    """Turn a JavaScript replacement string into a Python replacement function."""
+    def impl(match):
+        result = []
+        idx = 0
+        while idx < len(replacement):
+            char = replacement[idx]
+            following = replacement[idx + 1:idx + 2]
+            if char == '$' and following == '$':
+                result.append('$')
+                idx += 2
+            elif char == '$' and following == '&':
+                result.append(match.group(0))
+                idx += 2
+            elif char == '$' and following.isdigit() and 0 < int(following) <= len(match.groups()):
+                result.append(match.group(int(following)) or '')
+                idx += 2
+            else:
+                result.append(char)
+                idx += 1
+        return ''.join(result)
+    return impl
+
+
+def _replace(string, pattern, replacement):
+    string = to_string(string)
+    if isinstance(pattern, RegExp):
+        return pattern.compiled.sub(_replacement(to_string(replacement)), string, count=0 if pattern.is_global else 1)
+    pattern = to_string(pattern)
+    idx = string.find(pattern)
+    if idx == -1:
+        return string
+    return string[:idx] + to_string(replacement) + string[idx + len(pattern):]
+
+
+def _split(string, separator=undefined, limit=undefined):
+    string = to_string(string)
+    if separator is undefined:
+        result = [string]
+    elif isinstance(separator, RegExp):
+        result = separator.compiled.split(string)
+    elif to_string(separator) == '':
+        result = list(string)
+    else:
+        result = string.split(to_string(separator))
+    return result if limit is undefined else result[:int(to_integer(limit))]
+
+
+def _extent(array):
+    values = [value for value in array if not is_nullish(value) and to_number(value) == to_number(value)]
+    if not values:
+        return [undefined, undefined]
+    return [min(values, key=to_number), max(values, key=to_number)]
+
+
+def _inrange(value, range, left=undefined, right=undefined):
+    r0 = range[0]
+    r1 = range[-1]
+    if less_than(r1, r0):
+        r0, r1 = r1, r0
+    left = True if left is undefined else truthy(left)
+    right = True if right is undefined else truthy(right)
+    return (less_equal(r0, value) if left else less_than(r0, value)) and \
+        (less_equal(value, r1) if right else less_than(value, r1))
+
+
+def _join(array, separator=','):
+    return to_string(separator).join('' if is_nullish(elt) else to_string(elt) for elt in array)
+
+
+def _peek(array):
+    return array[-1] if array else undefined
+
+
+def _sequence(start, stop=undefined, step=1):
+    if stop is undefined:
+        start, stop = 0, start
+    start, stop, step = to_number(start), to_number(stop), to_number(step)
+    count = max(0, int(math.ceil((stop - start) / step))) if step else 0
+    return [start + idx * step for idx in range(count)]
+
+
+def _span(array):
+    return to_number(array[-1]) - to_number(array[0]) if array else NaN
+
+
+def _lerp(array, fraction):
+    return to_number(array[0]) + to_number(fraction) * (to_number(array[-1]) - to_number(array[0]))
+
+
+def _clamp_range(range, lower, upper):
+    lower, upper = to_number(lower), to_number(upper)
+    r0, r1 = to_number(range[0]), to_number(range[1])
+    span = r1 - r0
+    if span > upper - lower:
+        return [lower, upper]
+    if r0 < lower:
+        return [lower, lower + span]
+    if r1 > upper:
+        return [upper - span, upper]
+    return [r0, r1]
+
+
+def _merge(*objects):
+    result = {}
+    for obj in objects:
+        if isinstance(obj, dict):
+            result.update(obj)
+    return result
+
+
+def _regexp(pattern, flags=undefined):
+    return RegExp(to_string(pattern), '' if flags is undefined else to_string(flags))
+
+
+def _test(regexp, string=undefined):
+    if not isinstance(regexp, RegExp):
+        raise TypeError('test: the first argument is not a regular expression')
+    return regexp.test(string)
+
+
+vega_function_implementations = {
+    # Math functions
+    'isNaN': lambda value: to_number(value) != to_number(value),
+    'isFinite': lambda value: not math.isinf(to_number(value)) and to_number(value) == to_number(value),
+    'abs': _math(abs), 'acos': _math(math.acos), 'asin': _math(math.asin), 'atan': _math(math.atan),
+    'atan2': _math(math.atan2), 'ceil': _ceil, 'cos': _math(math.cos), 'exp': _math(math.exp),
+    'floor': _floor, 'log': _log, 'max': _max, 'min': _min, 'pow': power,
+    'random': lambda: _random.random(), 'round': _round, 'sin': _math(math.sin), 'sqrt': _math(math.sqrt),
+    'tan': _math(math.tan), 'clamp': _clamp,
+    # Type checking functions
+    'isArray': lambda value: isinstance(value, list),
+    'isBoolean': lambda value: isinstance(value, bool),
+    'isDate': lambda value: False,
+    'isDefined': lambda value: value is not undefined,
+    'isNumber': is_number,
+    'isObject': lambda value: isinstance(value, (list, dict, RegExp)),
+    'isRegExp': lambda value: isinstance(value, RegExp),
+    'isString': lambda value: isinstance(value, str),
+    'isValid': _is_valid,
+    # Type coercing functions
+    'toBoolean': _coerce(_to_boolean),
+    'toNumber': _coerce(to_number),
+    'toString': _coerce(to_string),
+    # String and array functions
+    'indexof': _indexof, 'lastindexof': _lastindexof, 'length': _length,
+    'lower': lambda string: to_string(string).lower(), 'upper': lambda string: to_string(string).upper(),
+    'pad': _pad, 'parseFloat': _parse_float, 'parseInt': _parse_int, 'replace': _replace,
+    'slice': _slice, 'split': _split, 'substring': _substring, 'trim': lambda string: to_string(string).strip(),
+    'truncate': _truncate, 'extent': _extent, 'clampRange': _clamp_range, 'inrange': _inrange,
+    'join': _join, 'lerp': _lerp, 'peek': _peek, 'reverse': lambda array: list(reversed(array)),
+    'sequence': _sequence, 'span': _span,
+    # Regular expression functions
+    'regexp': _regexp, 'test': _test,
+    # Object functions
+    'merge': _merge,
+}
+
+
+def to_value(value):
+    """Convert a Python literal value to the value the evaluator works with."""
+    if isinstance(value, tuple):
+        value = list(value)
+    if isinstance(value, list):
+        return [to_value(elt) for elt in value]
+    if isinstance(value, dict):
+        return dict((property_key(key), to_value(elt)) for key, elt in value.items())
+    return value
+
+
+def _member(value, key):
+    if isinstance(value, dict):
+        return value.get(key, undefined)
+    if is_nullish(value):
+        raise TypeError('Cannot read property \'{}\' of {}'.format(key, to_string(value)))
+    if isinstance(value, (list, str)):
+        if key == 'length':
+            return len(value)
+        try:
+            idx = int(key)
+        except ValueError:
+            return undefined
+        if str(idx) == key and 0 <= idx < len(value):
+            return value[idx]
+    return undefined
+
+
+def _index(value, key):
+    if isinstance(value, (list, str)) and is_number(key) and not math.isinf(key) and key == int(key) and 0 <= key < len(value):
+        return value[int(key)]
+    return _member(value, property_key(key))
+
+
+_binary_operators = {
+    '+': add,
+    '-': lambda a, b: to_number(a) - to_number(b),
+    '*': lambda a, b: to_number(a) * to_number(b),
+    '/': divide,
+    '%': modulo,
+    '==': loose_equals,
+    '!=': lambda a, b: not loose_equals(a, b),
+    '===': strict_equals,
+    '!==': lambda a, b: not strict_equals(a, b),
+    '<': less_than,
+    '<=': less_equal,
+    '>': lambda a, b: less_than(b, a),
+    '>=': lambda a, b: less_equal(b, a),
+}
+
+_unary_operators = {
+    '!': lambda value: not truthy(value),
+    '-': lambda value: -to_number(value),
+    '+': to_number,
+}
+
+
+class Compiler(object):
+    """Compile translated expressions to Python closures.
+
+    Each node is compiled only once, even if it appears multiple times in the expression.
+    """
+
+    def __init__(self, functions=None, parameters=None):
+        """Construct a Compiler, given additional function implementations and template parameter values."""
+        self.functions = dict(vega_function_implementations)
+        if functions is not None:
+            self.functions.update(functions)
+        self.parameters = {} if parameters is None else parameters
+        self._compiled = {}
+
+    def compile(self, expr):
+        """Return a function evaluating the expression, given a mapping of variable values."""
+        compiled = self._compiled.get(id(expr))
+        if compiled is None:
+            compiled = (expr, self._compile(expr))
+            self._compiled[id(expr)] = compiled
+        return compiled[1]
+
+    def _compile(self, expr):
+        if isinstance(expr, Literal):
+            value = to_value(expr.value)
+            return lambda variables: value
+
+        if isinstance(expr, Parameter):
+            value = to_value(self.parameters[expr.name])
+            return lambda variables: value
+
+        if isinstance(expr, Identifier):
+            name = expr.name
+            if name in constant_values:
+                value = constant_values[name]
+                return lambda variables: value
+            return lambda variables: variables.get(name, undefined)
+
+        if isinstance(expr, Member):
+            obj = self.compile(expr.object)
+            key = expr.property
+            return lambda variables: _member(obj(variables), key)
+
+        if isinstance(expr, Index):
+            obj = self.compile(expr.object)
+            index = self.compile(expr.index)
+            return lambda variables: _index(obj(variables), index(variables))
+
+        if isinstance(expr, Unary):
+            operator = _unary_operators[expr.operator]
+            argument = self.compile(expr.argument)
+            return lambda variables: operator(argument(variables))
+
+        if isinstance(expr, Binary):
+            operator = _binary_operators[expr.operator]
+            left = self.compile(expr.left)
+            right = self.compile(expr.right)
+            return lambda variables: operator(left(variables), right(variables))
+
+        if isinstance(expr, Logical):
+            return self._compile_logical(expr)
+
+        if isinstance(expr, Conditional):
+            test = self.compile(expr.test)
+            consequent = self.compile(expr.consequent)
+            alternate = self.compile(expr.alternate)
+            return lambda variables: consequent(variables) if truthy(test(variables)) else alternate(variables)
+
+        if isinstance(expr, Array):
+            elements = [self.compile(elt) for elt in expr.elements]
+            return lambda variables: [elt(variables) for elt in elements]
+
+        if isinstance(expr, Object):
+            properties = [(self.compile(key), self.compile(value)) for key, value in expr.properties]
+            return lambda variables: dict((property_key(key(variables)), value(variables)) for key, value in properties)
+
+        if isinstance(expr, Call):
+            if expr.callee not in self.functions:
+                raise NotImplementedError('The `{}` function is not supported by the evaluator'.format(expr.callee))
+            func = self.functions[expr.callee]
+            arguments = [self.compile(arg) for arg in expr.arguments]
+            return lambda variables: func(*[arg(variables) for arg in arguments])
+
+        raise NotImplementedError('Unsupported {} node'.format(expr.__class__.__name__))
+
+    def _compile_logical(self, expr):
+        operands = [self.compile(operand) for operand in expr.operands]
+        conjunction = expr.operator == '&&'
+
+        def evaluate(variables):
+            for operand in operands:
+                value = operand(variables)
+                if truthy(value) != conjunction:
+                    return value
+            return value
+
+        return evaluate
+
+
+def compile_expression(expr, functions=None, parameters=None):
+    """Compile a translated expression to a function evaluating it, given a mapping of variable values.
+
+    >>> evaluate = compile_expression(Translator(['value']).translate_expression('value * 2 if value > 3 else 0'))
+    >>> evaluate({'value': 4})
+    8
+    """
+    return Compiler(functions, parameters).compile(expr)
+
+
+def evaluate(expr, variables, functions=None, parameters=None):
+    """Evaluate a translated expression for the given mapping of variable values."""
+    return compile_expression(expr, functions, parameters)(variables)
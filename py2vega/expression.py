@@ -0,0 +1,436 @@
+"""Translated form of the Vega expressions produced by py2vega.
+
+The visitor builds a tree of the following nodes, which is turned into a string only at the very end.
+Nodes are never mutated once built, a node can then appear multiple times in a tree (e.g. when an
+assigned variable is used more than once).
+"""
+
+from .javascript import RegExp, is_finite
+
+
+def format_literal(value):
+    """Format a Python literal value as a Vega-expression literal."""
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, RegExp):
+        return value.literal
+    if isinstance(value, float) and not is_finite(value):
+        # Vega has no Infinity constant
+        return 'NaN' if value != value else '(1 / 0)' if value > 0 else '(-1 / 0)'
+    if isinstance(value, (list, tuple)) and _is_homogeneous(value):
+        # The repr of a list of strings or numbers is already a valid array literal
+        return repr(value if isinstance(value, list) else list(value))
+    if isinstance(value, dict) and _is_homogeneous(value) and _is_homogeneous(value.values()):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return '[{}]'.format(', '.join([format_literal(elt) for elt in value]))
+    if isinstance(value, dict):
+        return '{{{}}}'.format(', '.join([
+            '{}: {}'.format(format_literal(key), format_literal(elt)) for key, elt in value.items()
+        ]))
+    return repr(value)
+
+
+def _is_homogeneous(values):
+    """Return True if the values are all strings or all numbers, which are formatted the same way by `repr`."""
+    kinds = set(value.__class__ for value in values)
+    return kinds <= set([str]) or kinds <= set([int, float]) and all(is_finite(value) for value in values)
+
+
+class Expression(object):
+    """Base class for the translated expression nodes.
+
+    `location` is the (line, column) of the Python code the node was translated from, if known.
+    """
+
+    __slots__ = ('parens', 'location')
+
+    def __init__(self, parens=False):
+        self.parens = parens
+        self.location = None
+
+    def children(self):
+        """Return the child nodes of this node."""
+        return ()
+
+    def with_children(self, children):
+        """Return this node with its children replaced, the node itself being returned if they are unchanged."""
+        children = tuple(children)
+        if all(new is old for new, old in zip(children, self.children())):
+            return self
+        rebuilt = self._rebuild(children)
+        rebuilt.location = self.location
+        return rebuilt
+
+    def _rebuild(self, children):
+        return self
+
+    def overhead(self):
+        """Return the number of characters emitted by this node itself, excluding its children."""
+        raise NotImplementedError()
+
+    def write(self, out):
+        """Append the Vega-expression string pieces of this node to the `out` list.
+
+        `out` may also be a list subclass with `enter` and `exit` methods, called around the pieces of each node.
+        """
+        tracked = out.__class__ is not list
+        if tracked:
+            out.enter(self)
+
+        if self.parens:
+            out.append('(')
+            self._write(out)
+            out.append(')')
+        else:
+            self._write(out)
+
+        if tracked:
+            out.exit(self)
+
+    def _write(self, out):
+        raise NotImplementedError()
+
+    def __str__(self):
+        return emit(self)
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, emit(self))
+
+
+class Literal(Expression):
+    """A string, number, boolean, null or regular expression literal, or a container of literals."""
+
+    __slots__ = ('value', 'text')
+
+    def __init__(self, value, parens=False):
+        super(Literal, self).__init__(parens)
+        self.value = value
+        self.text = format_literal(value)
+
+    def overhead(self):
+        return len(self.text)
+
+    def _write(self, out):
+        out.append(self.text)
+
+
+class Identifier(Expression):
+    """A variable or constant name."""
+
+    __slots__ = ('name', )
+
+    def __init__(self, name, parens=False):
+        super(Identifier, self).__init__(parens)
+        self.name = name
+
+    def overhead(self):
+        return len(self.name)
+
+    def _write(self, out):
+        out.append(self.name)
+
+
+class Parameter(Expression):
+    """A template parameter, substituted by a literal value once the expression is emitted."""
+
+    __slots__ = ('name', )
+
+    def __init__(self, name, parens=False):
+        super(Parameter, self).__init__(parens)
+        self.name = name
+
+    def overhead(self):
+        return 0
+
+    def _write(self, out):
+        # The parameter itself is written, it is up to the caller to substitute it
+        out.append(self)
+
+
+class Member(Expression):
+    """A static member access, e.g. `datum.value`."""
+
+    __slots__ = ('object', 'property')
+
+    def __init__(self, object, property, parens=False):
+        super(Member, self).__init__(parens)
+        self.object = object
+        self.property = property
+
+    def children(self):
+        return (self.object, )
+
+    def overhead(self):
+        return 1 + len(self.property)
+
+    def _write(self, out):
+        self.object.write(out)
+        out.append('.')
+        out.append(self.property)
+
+    def _rebuild(self, children):
+        return Member(children[0], self.property, parens=self.parens)
+
+
+class Index(Expression):
+    """A computed member access, e.g. `value[0]`."""
+
+    __slots__ = ('object', 'index')
+
+    def __init__(self, object, index, parens=False):
+        super(Index, self).__init__(parens)
+        self.object = object
+        self.index = index
+
+    def children(self):
+        return (self.object, self.index)
+
+    def overhead(self):
+        return 2
+
+    def _write(self, out):
+        self.object.write(out)
+        out.append('[')
+        self.index.write(out)
+        out.append(']')
+
+    def _rebuild(self, children):
+        return Index(children[0], children[1], parens=self.parens)
+
+
+class Call(Expression):
+    """A call to a Vega function."""
+
+    __slots__ = ('callee', 'arguments')
+
+    def __init__(self, callee, arguments, parens=False):
+        super(Call, self).__init__(parens)
+        self.callee = callee
+        self.arguments = tuple(arguments)
+
+    def children(self):
+        return self.arguments
+
+    def overhead(self):
+        return len(self.callee) + 2 + 2 * max(len(self.arguments) - 1, 0)
+
+    def _write(self, out):
+        out.append(self.callee)
+        out.append('(')
+        _write_sequence(self.arguments, out)
+        out.append(')')
+
+    def _rebuild(self, children):
+        return Call(self.callee, children, parens=self.parens)
+
+
+class Unary(Expression):
+    """A unary operation, the operand of the `!` operator is always parenthesized."""
+
+    __slots__ = ('operator', 'argument')
+
+    def __init__(self, operator, argument, parens=False):
+        super(Unary, self).__init__(parens)
+        self.operator = operator
+        self.argument = argument
+
+    def children(self):
+        return (self.argument, )
+
+    def overhead(self):
+        return 3 if self.operator == '!' else len(self.operator)
+
+    def _write(self, out):
+        if self.operator == '!':
+            out.append('!(')
+            self.argument.write(out)
+            out.append(')')
+        else:
+            out.append(self.operator)
+            self.argument.write(out)
+
+    def _rebuild(self, children):
+        return Unary(self.operator, children[0], parens=self.parens)
+
+
+class Binary(Expression):
+    """A binary operation."""
+
+    __slots__ = ('operator', 'left', 'right')
+
+    def __init__(self, operator, left, right, parens=False):
+        super(Binary, self).__init__(parens)
+        self.operator = operator
+        self.left = left
+        self.right = right
+
+    def children(self):
+        return (self.left, self.right)
+
+    def overhead(self):
+        return len(self.operator) + 2
+
+    def _write(self, out):
+        self.left.write(out)
+        out.append(' {} '.format(self.operator))
+        self.right.write(out)
+
+    def _rebuild(self, children):
+        return Binary(self.operator, children[0], children[1], parens=self.parens)
+
+
+class Logical(Expression):
+    """A chain of operands joined by the same `&&` or `||` operator."""
+
+    __slots__ = ('operator', 'operands')
+
+    def __init__(self, operator, operands, parens=False):
+        super(Logical, self).__init__(parens)
+        self.operator = operator
+        self.operands = tuple(operands)
+
+    def children(self):
+        return self.operands
+
+    def overhead(self):
+        return (len(self.operator) + 2) * (len(self.operands) - 1)
+
+    def _write(self, out):
+        separator = ' {} '.format(self.operator)
+        for idx, operand in enumerate(self.operands):
+            if idx:
+                out.append(separator)
+            operand.write(out)
+
+    def _rebuild(self, children):
+        return Logical(self.operator, children, parens=self.parens)
+
+
+class Conditional(Expression):
+    """A conditional expression, emitted as a ternary or as a call to the `if` function."""
+
+    __slots__ = ('test', 'consequent', 'alternate', 'function')
+
+    def __init__(self, test, consequent, alternate, function=False, parens=False):
+        super(Conditional, self).__init__(parens)
+        self.test = test
+        self.consequent = consequent
+        self.alternate = alternate
+        self.function = function
+
+    def children(self):
+        return (self.test, self.consequent, self.alternate)
+
+    def overhead(self):
+        return 8 if self.function else 6
+
+    def _write(self, out):
+        if self.function:
+            out.append('if(')
+            self.test.write(out)
+            out.append(', ')
+            self.consequent.write(out)
+            out.append(', ')
+            self.alternate.write(out)
+            out.append(')')
+        else:
+            self.test.write(out)
+            out.append(' ? ')
+            self.consequent.write(out)
+            out.append(' : ')
+            self.alternate.write(out)
+
+    def _rebuild(self, children):
+        return Conditional(children[0], children[1], children[2], function=self.function, parens=self.parens)
+
+
+class Array(Expression):
+    """An array literal."""
+
+    __slots__ = ('elements', )
+
+    def __init__(self, elements, parens=False):
+        super(Array, self).__init__(parens)
+        self.elements = tuple(elements)
+
+    def children(self):
+        return self.elements
+
+    def overhead(self):
+        return 2 + 2 * max(len(self.elements) - 1, 0)
+
+    def _write(self, out):
+        out.append('[')
+        _write_sequence(self.elements, out)
+        out.append(']')
+
+    def _rebuild(self, children):
+        return Array(children, parens=self.parens)
+
+
+class Object(Expression):
+    """An object literal, given as a sequence of (key, value) node pairs."""
+
+    __slots__ = ('properties', )
+
+    def __init__(self, properties, parens=False):
+        super(Object, self).__init__(parens)
+        self.properties = tuple(properties)
+
+    def children(self):
+        return tuple(node for prop in self.properties for node in prop)
+
+    def overhead(self):
+        return 2 + 4 * len(self.properties) - 2 * min(len(self.properties), 1)
+
+    def _write(self, out):
+        out.append('{')
+        for idx, (key, value) in enumerate(self.properties):
+            if idx:
+                out.append(', ')
+            key.write(out)
+            out.append(': ')
+            value.write(out)
+        out.append('}')
+
+    def _rebuild(self, children):
+        return Object(zip(children[::2], children[1::2]), parens=self.parens)
+
+
+def _write_sequence(nodes, out):
+    for idx, node in enumerate(nodes):
+        if idx:
+            out.append(', ')
+        node.write(out)
+
+
+def emit(expr):
+    """Turn a translated expression into its Vega-expression string."""
+    out = []
+    expr.write(out)
+    return ''.join(out)
+
+
+def replace_nodes(expr, replacement):
+    """Return the expression with nodes replaced, `replacement(node)` returning the new node or None to keep it.
+
+    Nodes are looked at from the root down, the children of a replaced node are not visited. Nodes that
+    are shared in the expression are rewritten only once and stay shared.
+    """
+    memo = {}
+
+    def rewrite(node):
+        result = memo.get(id(node))
+        if result is None:
+            result = replacement(node)
+            if result is None:
+                result = node.with_children([rewrite(child) for child in node.children()])
+            memo[id(node)] = result
+        return result
+
+    return rewrite(expr)
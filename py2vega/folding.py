@@ -0,0 +1,272 @@
+"""Compile-time folding of Vega function calls with constant arguments."""
+
+import datetime as _datetime
+import math
+
+from .expression import Call, Literal, Unary
+from .javascript import is_finite, number_to_string
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+# Largest absolute timestamp of a valid JavaScript Date
+max_timestamp = 8.64e15
+
+_epoch = _datetime.datetime(1970, 1, 1)
+_ms_per_day = 86400000
+
+# Date field extractors, as the Date getter they call
+_local_extractors = {
+    'date': 'day', 'day': 'weekday', 'year': 'year', 'month': 'month', 'hours': 'hour',
+    'minutes': 'minute', 'seconds': 'second', 'milliseconds': 'millisecond'
+}
+_utc_extractors = dict(('utc' + name, field) for name, field in _local_extractors.items())
+
+
+def resolve_timezone(timezone):
+    """Return the tzinfo of a timezone given as a tzinfo instance or as an IANA name like 'Europe/Paris'."""
+    if timezone is None or isinstance(timezone, _datetime.tzinfo):
+        return timezone
+    if timezone == 'UTC':
+        return _UTC
+    if ZoneInfo is None:
+        raise ValueError('Timezone names require the zoneinfo module, give a tzinfo instance instead')
+    return ZoneInfo(timezone)
+
+
+class _FixedOffset(_datetime.tzinfo):
+    def __init__(self, offset):
+        self.offset = offset
+
+    def utcoffset(self, dt):
+        return self.offset
+
+    def dst(self, dt):
+        return _datetime.timedelta(0)
+
+
+_UTC = _FixedOffset(_datetime.timedelta(0))
+
+
+def _number(expr):
+    """Return the value of a number literal, or None."""
+    if isinstance(expr, Unary) and expr.operator == '-':
+        value = _number(expr.argument)
+        return None if value is None else -value
+    if isinstance(expr, Literal) and isinstance(expr.value, (int, float)) and not isinstance(expr.value, bool):
+        return expr.value
+    return None
+
+
+def _days_from_civil(year, month):
+    """Return the number of days from the epoch to the first day of a month of the proleptic Gregorian calendar."""
+    year -= month <= 2
+    era = (year if year >= 0 else year - 399) // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def make_date(fields):
+    """Return the timestamp of the given year, month, day, hours, minutes, seconds and milliseconds.
+
+    Fields overflow into each other and two-digit years are in the 20th century, the way JavaScript's
+    `Date.UTC` does. Return None if the date is invalid.
+    """
+    if not all(is_finite(field) for field in fields):
+        return None
+    year, month, day, hours, minutes, seconds, ms = [int(field) for field in fields]
+    if 0 <= year <= 99:
+        year += 1900
+
+    year += month // 12
+    month = month % 12
+    timestamp = (_days_from_civil(year, month + 1) + day - 1) * _ms_per_day + \
+        ((hours * 60 + minutes) * 60 + seconds) * 1000 + ms
+    return timestamp if abs(timestamp) <= max_timestamp else None
+
+
+def _date_fields(args, defaults):
+    values = [_number(arg) for arg in args]
+    if any(value is None for value in values):
+        return None
+    return values + defaults[len(values):]
+
+
+def _to_utc(local_timestamp, tz):
+    """Convert a timestamp of the local wall clock time of a timezone to a UTC timestamp."""
+    try:
+        wall = _epoch + _datetime.timedelta(milliseconds=local_timestamp)
+    except OverflowError:
+        return None
+    # Times skipped by a DST change are moved forward, and repeated times are taken in the first occurrence
+    offset = wall.replace(tzinfo=tz).utcoffset()
+    timestamp = local_timestamp - (offset.days * _ms_per_day + offset.seconds * 1000 + offset.microseconds // 1000)
+    return timestamp if abs(timestamp) <= max_timestamp else None
+
+
+def _extract(field, timestamp, tz):
+    try:
+        moment = _epoch + _datetime.timedelta(milliseconds=timestamp)
+    except OverflowError:
+        return None
+    if tz is not None:
+        moment = moment.replace(tzinfo=_UTC).astimezone(tz)
+    if field == 'weekday':
+        return (moment.weekday() + 1) % 7
+    if field == 'month':
+        return moment.month - 1
+    if field == 'millisecond':
+        return moment.microsecond // 1000
+    return getattr(moment, field)
+
+
+def date_timestamp(expr, timezone=None):
+    """Return the timestamp of a `datetime` call with constant arguments, computed in a `timezone` tzinfo, or None."""
+    if not isinstance(expr, Call) or expr.callee != 'datetime' or not 2 <= len(expr.arguments) <= 7 or timezone is None:
+        return None
+    fields = _date_fields(expr.arguments, [None, 0, 1, 0, 0, 0, 0])
+    local = None if fields is None else make_date(fields)
+    return None if local is None else _to_utc(local, timezone)
+
+
+def fold_date_operand(expr, timezone=None):
+    """Return the timestamp literal of a constant `datetime` call, for operands which convert the date to a number."""
+    timestamp = date_timestamp(expr, timezone)
+    return expr if timestamp is None else Literal(int(timestamp))
+
+
+def _timestamp(expr, timezone):
+    value = _number(expr)
+    return date_timestamp(expr, timezone) if value is None else value
+
+
+def fold_date_call(func_name, args, timezone=None):
+    """Fold a call to a Vega date function with constant arguments into a number literal, or return None.
+
+    `utc` and the `utc*` field extractors are always folded. `datetime` calls return Date objects and
+    are not folded, but the local time field extractors and the `utc*` ones are folded on them if a
+    `timezone` tzinfo is given, and so are the local time extractors on timestamps.
+    """
+    if func_name == 'utc' and 1 <= len(args) <= 7:
+        fields = _date_fields(args, [None, 0, 1, 0, 0, 0, 0])
+        timestamp = None if fields is None else make_date(fields)
+    elif func_name == 'time' and len(args) == 1:
+        timestamp = _timestamp(args[0], timezone)
+        if timestamp is not None and (not is_finite(timestamp) or abs(timestamp) > max_timestamp):
+            timestamp = None
+    elif len(args) == 1 and (func_name in _utc_extractors or (func_name in _local_extractors and timezone is not None)):
+        timestamp = _timestamp(args[0], timezone)
+        if timestamp is None or not is_finite(timestamp) or abs(timestamp) > max_timestamp:
+            return None
+        field = _utc_extractors.get(func_name) or _local_extractors[func_name]
+        value = _extract(field, int(timestamp), None if func_name in _utc_extractors else timezone)
+        return None if value is None else Literal(value)
+    else:
+        return None
+
+    return None if timestamp is None else Literal(int(timestamp))
+
+
+def _js_round(value):
+    """JavaScript's `Math.round`, rounding halves up."""
+    return int(math.floor(value + 0.5))
+
+
+def format_rgb(r, g, b, opacity=1):
+    """Format an RGB color the way d3-color's `formatRgb` does, which is what color objects are converted to."""
+    opacity = 1 if opacity != opacity else max(0, min(1, opacity))
+    channels = ', '.join(str(max(0, min(255, _js_round(value) if value == value else 0))) for value in (r, g, b))
+    if opacity == 1:
+        return 'rgb({})'.format(channels)
+    return 'rgba({}, {})'.format(channels, number_to_string(opacity))
+
+
+def _hsl2rgb(h, m1, m2):
+    if h < 60:
+        value = m1 + (m2 - m1) * h / 60
+    elif h < 180:
+        value = m2
+    elif h < 240:
+        value = m1 + (m2 - m1) * (240 - h) / 60
+    else:
+        value = m1
+    return value * 255
+
+
+def hsl_to_rgb(h, s, lightness):
+    """Convert an HSL color to RGB channels, the way d3-color does."""
+    h = math.fmod(h, 360) + (360 if h < 0 else 0)
+    m2 = lightness + (lightness if lightness < 0.5 else 1 - lightness) * s
+    m1 = 2 * lightness - m2
+    return (
+        _hsl2rgb(h - 240 if h >= 240 else h + 120, m1, m2),
+        _hsl2rgb(h, m1, m2),
+        _hsl2rgb(h + 240 if h < 120 else h - 120, m1, m2)
+    )
+
+
+# Constants of d3-color's CIE LAB color space, which uses the D50 white point
+_t0 = 4.0 / 29
+_t1 = 6.0 / 29
+_t2 = 3 * _t1 * _t1
+_Xn = 0.96422
+_Zn = 0.82521
+
+
+def _lab2xyz(t):
+    return t * t * t if t > _t1 else _t2 * (t - _t0)
+
+
+def _lrgb2rgb(x):
+    return 255 * (12.92 * x if x <= 0.0031308 else 1.055 * math.pow(x, 1 / 2.4) - 0.055)
+
+
+def lab_to_rgb(lightness, a, b):
+    """Convert a CIE LAB color to RGB channels, the way d3-color does."""
+    y = (lightness + 16) / 116.0
+    x = _Xn * _lab2xyz(y + a / 500.0)
+    z = _Zn * _lab2xyz(y - b / 200.0)
+    y = _lab2xyz(y)
+    return (
+        _lrgb2rgb(3.1338561 * x - 1.6168667 * y - 0.4906146 * z),
+        _lrgb2rgb(-0.9787684 * x + 1.9161415 * y + 0.0334540 * z),
+        _lrgb2rgb(0.0719453 * x - 0.2289914 * y + 1.4052427 * z)
+    )
+
+
+def hcl_to_rgb(h, c, lightness):
+    """Convert a CIE HCL color to RGB channels, the way d3-color does."""
+    h = math.radians(h)
+    return lab_to_rgb(lightness, math.cos(h) * c, math.sin(h) * c)
+
+
+_color_conversions = {
+    'rgb': lambda r, g, b: (r, g, b),
+    'hsl': hsl_to_rgb,
+    'lab': lab_to_rgb,
+    'hcl': hcl_to_rgb,
+}
+
+
+def fold_color_call(func_name, args):
+    """Fold a call to a Vega color function with constant channels into its CSS color string, or return None.
+
+    Vega converts color objects to this string when they are used as a mark color.
+    """
+    if func_name not in _color_conversions or len(args) not in (3, 4):
+        return None
+    values = [_number(arg) for arg in args]
+    if any(value is None or not is_finite(value) for value in values):
+        return None
+
+    channels = _color_conversions[func_name](*[float(value) for value in values[:3]])
+    return Literal(format_rgb(*channels, opacity=values[3] if len(values) == 4 else 1))
+
+
+def fold_call(func_name, args, timezone=None):
+    """Fold a call to a Vega function with constant arguments into a literal, or return None."""
+    return fold_date_call(func_name, args, timezone) or fold_color_call(func_name, args)
@@ -1,18 +1,26 @@
 # noqa
-from .math import math_functions
-from .type_checking import type_checking_functions
-from .type_coercing import type_coercing_functions
-from .date_time import date_time_functions
-from .array import array_functions
-from .string import string_functions
-from .formatting import formatting_functions
-from .regexp import regexp_functions
-from .color import color_functions
-from .object import object_functions
-from .scale import scale_functions
+from .math import math_functions, math_function_types
+from .type_checking import type_checking_functions, type_checking_function_types
+from .type_coercing import type_coercing_functions, type_coercing_function_types
+from .date_time import date_time_functions, date_time_function_types
+from .array import array_functions, array_function_types
+from .string import string_functions, string_function_types
+from .formatting import formatting_functions, formatting_function_types
+from .regexp import regexp_functions, regexp_function_types
+from .color import color_functions, color_function_types
+from .object import object_functions, object_function_types
+from .scale import scale_functions, scale_function_types
 
 vega_functions = (
     math_functions + type_checking_functions + type_coercing_functions +
     date_time_functions + array_functions + string_functions + formatting_functions +
     regexp_functions + color_functions + object_functions + scale_functions
 )
+
+# Return types of the Vega functions, a trailing `?` meaning that null may be returned
+vega_function_types = {}
+for function_types in (
+        math_function_types, type_checking_function_types, type_coercing_function_types,
+        date_time_function_types, array_function_types, string_function_types, formatting_function_types,
+        regexp_function_types, color_function_types, object_function_types, scale_function_types):
+    vega_function_types.update(function_types)
@@ -3,6 +3,13 @@
 array_functions = ['extent', 'clampRange', 'indexof', 'inrange', 'join', 'lastindexof',
                    'length', 'lerp', 'peek', 'reverse', 'sequence', 'slice', 'span']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+array_function_types = {
+    'extent': 'array', 'clampRange': 'array', 'indexof': 'number', 'inrange': 'boolean', 'join': 'string',
+    'lastindexof': 'number', 'length': 'number', 'lerp': 'number', 'reverse': 'array', 'sequence': 'array',
+    'span': 'number'
+}
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
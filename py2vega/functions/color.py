@@ -2,6 +2,9 @@
 
 color_functions = ['rgb', 'hsl', 'lab', 'hcl']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+color_function_types = dict((name, 'object') for name in color_functions)
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
@@ -15,7 +18,7 @@ def rgb(r, g, b, opacity):
     raise RuntimeError('rgb' + error_message)
 
 
-def hsl(h, s, l, opacity):
+def hsl(h, s, l, opacity):  # noqa: E741, the parameters are named like in the Vega documentation
     """Construct a new HSL color.
 
     If h, s and l are specified, these represent the channel values of the returned color;
@@ -25,7 +28,7 @@ def hsl(h, s, l, opacity):
     raise RuntimeError('hsl' + error_message)
 
 
-def lab(l, a, b, opacity):
+def lab(l, a, b, opacity):  # noqa: E741, the parameters are named like in the Vega documentation
     """Construct a new CIE LAB color.
 
     If l, a and b are specified, these represent the channel values of the returned color;
@@ -35,7 +38,7 @@ def lab(l, a, b, opacity):
     raise RuntimeError('lab' + error_message)
 
 
-def hcl(h, c, l, opacity):
+def hcl(h, c, l, opacity):  # noqa: E741, the parameters are named like in the Vega documentation
     """Construct a new HCL (hue, chroma, luminance) color.
 
     If h, c and l are specified, these represent the channel values of the returned color;
@@ -7,6 +7,10 @@ date_time_functions = [
     'utcminutes', 'utcseconds', 'utcmilliseconds'
 ]
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+date_time_function_types = dict((name, 'number') for name in date_time_functions)
+date_time_function_types['datetime'] = 'date'
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
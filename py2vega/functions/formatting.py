@@ -5,6 +5,10 @@ formatting_functions = [
     'monthAbbrevFormat', 'timeFormat', 'timeParse', 'utcFormat', 'utcParse'
 ]
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+formatting_function_types = dict((name, 'string') for name in formatting_functions)
+formatting_function_types.update(timeParse='date?', utcParse='date?')
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
@@ -3,6 +3,10 @@
 math_functions = ['isNaN', 'isFinite', 'abs', 'acos', 'asin', 'atan', 'atan2', 'ceil', 'cos', 'exp',
                   'floor', 'log', 'max', 'min', 'pow', 'random', 'round', 'sin', 'sqrt', 'tan', 'clamp']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+math_function_types = dict((name, 'number') for name in math_functions)
+math_function_types.update(isNaN='boolean', isFinite='boolean')
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
@@ -2,6 +2,9 @@
 
 object_functions = ['merge']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+object_function_types = {'merge': 'object'}
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
@@ -2,6 +2,9 @@
 
 regexp_functions = ['regexp', 'test']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+regexp_function_types = {'regexp': 'regexp', 'test': 'boolean'}
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
@@ -5,6 +5,10 @@ scale_functions = [
     'panLinear', 'panLog', 'panPow', 'panSymlog', 'zoomLinear', 'zoomLog', 'zoomPow', 'zoomSymlog'
 ]
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+scale_function_types = dict((name, 'array') for name in scale_functions if name.startswith(('pan', 'zoom')))
+scale_function_types.update(copy='object?', domain='array', range='array', bandwidth='number', bandspace='number', gradient='object')
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
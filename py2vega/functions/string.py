@@ -3,6 +3,13 @@
 string_functions = ['indexof', 'lastindexof', 'length', 'lower', 'pad', 'parseFloat', 'parseInt',
                     'replace', 'slice', 'split', 'substring', 'trim', 'truncate', 'upper']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+string_function_types = {
+    'indexof': 'number', 'lastindexof': 'number', 'length': 'number', 'lower': 'string', 'pad': 'string',
+    'parseFloat': 'number', 'parseInt': 'number', 'replace': 'string', 'split': 'array', 'substring': 'string',
+    'trim': 'string', 'truncate': 'string', 'upper': 'string'
+}
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
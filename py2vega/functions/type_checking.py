@@ -3,6 +3,9 @@
 type_checking_functions = ['isArray', 'isBoolean', 'isDate', 'isDefined', 'isNumber',
                            'isObject', 'isRegExp', 'isString', 'isValid']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+type_checking_function_types = dict((name, 'boolean') for name in type_checking_functions)
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
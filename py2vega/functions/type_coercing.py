@@ -2,6 +2,9 @@
 
 type_coercing_functions = ['toBoolean', 'toDate', 'toNumber', 'toString']
 
+# Return types of the functions, a trailing `?` meaning that null may be returned
+type_coercing_function_types = {'toBoolean': 'boolean?', 'toDate': 'date?', 'toNumber': 'number?', 'toString': 'string?'}
+
 error_message = ' is a mocking function that is not supposed to be called directly'
 
 
@@ -0,0 +1,413 @@
+"""Block-wise NumPy evaluation of translated Vega expressions over number and boolean columns.
+
+Evaluating an expression with NumPy operators over whole columns allocates a column-sized temporary
+for every operator. Expressions are instead evaluated one block of rows at a time, each operator
+writing into the temporary of one of its operands when it owns it, so that the temporary memory is
+proportional to the block size. numpy is needed.
+"""
+
+import math
+
+from .expression import Binary, Call, Conditional, Identifier, Literal, Logical, Member, Unary
+
+default_block_size = 8192
+
+_number = 'number'
+_boolean = 'boolean'
+
+_constants = {
+    'NaN': float('nan'), 'E': math.e, 'LN2': math.log(2), 'LN10': math.log(10), 'LOG2E': 1 / math.log(2),
+    'LOG10E': 1 / math.log(10), 'PI': math.pi, 'SQRT1_2': math.sqrt(0.5), 'SQRT2': math.sqrt(2),
+    'MIN_VALUE': 5e-324, 'MAX_VALUE': 1.7976931348623157e+308
+}
+
+
+def _numpy():
+    import numpy
+
+    return numpy
+
+
+class FusedUnsupportedError(NotImplementedError):
+    """Error raised when an expression uses values or functions the fused evaluator does not support."""
+
+
+def _parents(expr):
+    """Count the parents of each node of an expression, a node shared by many parents being evaluated once."""
+    parents = {id(expr): 1}
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        for child in node.children():
+            if id(child) not in parents:
+                parents[id(child)] = 0
+                stack.append(child)
+            parents[id(child)] += 1
+    return parents
+
+
+class _Plan(object):
+    """Expression compiled for given column kinds, to functions evaluating a block of rows.
+
+    Each function takes the evaluation context of the block, and returns a value, which is an array or
+    a scalar, and whether the caller owns it and may then overwrite it.
+    """
+
+    def __init__(self, expr, kinds, variables, datum, scales):
+        self.np = _numpy()
+        self.kinds = kinds
+        self.variables = variables
+        self.datum = datum
+        self.scales = scales
+        self.parents = _parents(expr)
+        self._memo = {}
+        self.kind, self.evaluate = self.compile(expr)
+
+    def compile(self, expr):
+        memo = self._memo.get(id(expr))
+        if memo is not None:
+            return memo[1]
+
+        kind, func = self._compile(expr)
+        if self.parents[id(expr)] > 1:
+            func = self._shared(expr, func)
+
+        self._memo[id(expr)] = (expr, (kind, func))
+        return kind, func
+
+    @staticmethod
+    def _shared(expr, func):
+        """Evaluate a node used by many parents once per block, none of them owning its value."""
+        key = id(expr)
+
+        def evaluate(context):
+            if key not in context:
+                context[key] = func(context)[0]
+            return context[key], False
+        return evaluate
+
+    def _compile(self, expr):
+        if isinstance(expr, Literal):
+            if isinstance(expr.value, bool):
+                return _boolean, self._constant(expr.value)
+            if isinstance(expr.value, (int, float)):
+                return _number, self._constant(float(expr.value))
+            raise FusedUnsupportedError('Only number and boolean literals are supported')
+
+        if isinstance(expr, Identifier):
+            if expr.name in _constants:
+                return _number, self._constant(_constants[expr.name])
+            value = self.variables.get(expr.name)
+            if isinstance(value, bool):
+                return _boolean, self._constant(value)
+            if isinstance(value, (int, float)):
+                return _number, self._constant(float(value))
+            raise FusedUnsupportedError('The `{}` variable must be given as a number or a boolean'.format(expr.name))
+
+        if isinstance(expr, Member) and isinstance(expr.object, Identifier) and expr.object.name == self.datum:
+            return self._column(expr.property)
+
+        if isinstance(expr, Unary):
+            return self._compile_unary(expr)
+        if isinstance(expr, Binary):
+            return self._compile_binary(expr)
+        if isinstance(expr, Logical):
+            return self._compile_logical(expr)
+        if isinstance(expr, Conditional):
+            return self._compile_conditional(expr)
+        if isinstance(expr, Call):
+            return self._compile_call(expr)
+
+        raise FusedUnsupportedError('Unsupported {} node'.format(expr.__class__.__name__))
+
+    def _constant(self, value):
+        return lambda context: (value, False)
+
+    def _column(self, name):
+        if name not in self.kinds:
+            raise FusedUnsupportedError('No column for the `{}` field'.format(name))
+        return self.kinds[name], lambda context: (context['columns'][name], False)
+
+    def _apply(self, ufunc, operands, dtype):
+        """Apply a ufunc, writing into the first owned operand of the result type if there is one."""
+        values = [value for value, _ in operands]
+        shape = self.np.broadcast(*values).shape
+        for value, owned in operands:
+            if owned and isinstance(value, self.np.ndarray) and value.dtype == dtype and value.shape == shape:
+                return ufunc(*values, out=value), True
+        return ufunc(*values), True
+
+    def _as_number(self, func, kind):
+        """Convert booleans to numbers, the way JavaScript arithmetic does."""
+        if kind == _number:
+            return func
+        np = self.np
+
+        def evaluate(context):
+            value, _ = func(context)
+            if isinstance(value, np.ndarray):
+                return value.astype(np.float64), True
+            return float(value), False
+        return evaluate
+
+    def _truthy(self, func, kind):
+        """Convert numbers to booleans, zero and NaN being falsy."""
+        if kind == _boolean:
+            return func
+
+        def evaluate(context):
+            value, _ = func(context)
+            return (value != 0) & (value == value), True
+        return evaluate
+
+    def _numbers(self, args):
+        numbers = []
+        for arg in args:
+            kind, func = self.compile(arg)
+            numbers.append(self._as_number(func, kind))
+        return numbers
+
+    def _compile_unary(self, expr):
+        kind, argument = self.compile(expr.argument)
+        np = self.np
+        if expr.operator == '!':
+            truthy = self._truthy(argument, kind)
+            return _boolean, lambda context: self._apply(np.logical_not, [truthy(context)], np.bool_)
+
+        argument = self._as_number(argument, kind)
+        if expr.operator == '-':
+            return _number, lambda context: self._apply(np.negative, [argument(context)], np.float64)
+        return _number, argument
+
+    def _compile_binary(self, expr):
+        np = self.np
+        arithmetic = {
+            '+': np.add, '-': np.subtract, '*': np.multiply, '/': np.true_divide,
+            # The JavaScript remainder has the sign of the dividend, like `fmod`
+            '%': np.fmod,
+        }
+        comparisons = {
+            '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+            '==': np.equal, '!=': np.not_equal, '===': np.equal, '!==': np.not_equal,
+        }
+
+        if expr.operator in arithmetic:
+            ufunc = arithmetic[expr.operator]
+            left, right = self._numbers([expr.left, expr.right])
+            return _number, lambda context: self._apply(ufunc, [left(context), right(context)], np.float64)
+
+        if expr.operator in comparisons:
+            left_kind, left = self.compile(expr.left)
+            right_kind, right = self.compile(expr.right)
+            if left_kind != right_kind and expr.operator in ('===', '!=='):
+                # A number is never strictly equal to a boolean
+                value = expr.operator == '!=='
+                return _boolean, self._constant(value)
+            left = self._as_number(left, left_kind)
+            right = self._as_number(right, right_kind)
+            ufunc = comparisons[expr.operator]
+            return _boolean, lambda context: self._apply(ufunc, [left(context), right(context)], np.bool_)
+
+        raise FusedUnsupportedError('Unsupported {} operator'.format(expr.operator))
+
+    def _compile_logical(self, expr):
+        np = self.np
+        compiled = [self.compile(operand) for operand in expr.operands]
+        kind = compiled[0][0]
+        if any(operand_kind != kind for operand_kind, _ in compiled):
+            raise FusedUnsupportedError('Operands of `{}` must all be numbers or all be booleans'.format(expr.operator))
+        operands = [func for _, func in compiled]
+        conjunction = expr.operator == '&&'
+
+        if kind == _boolean:
+            ufunc = np.logical_and if conjunction else np.logical_or
+
+            def evaluate(context):
+                result = operands[0](context)
+                for operand in operands[1:]:
+                    result = self._apply(ufunc, [result, operand(context)], np.bool_)
+                return result
+            return _boolean, evaluate
+
+        # `a && b` is `b` if `a` is truthy, `a` otherwise
+        def evaluate_numbers(context):
+            result, _ = operands[-1](context)
+            for operand in reversed(operands[:-1]):
+                value, _ = operand(context)
+                truthy = (value != 0) & (value == value)
+                result = np.where(truthy, result, value) if conjunction else np.where(truthy, value, result)
+            return result, True
+        return _number, evaluate_numbers
+
+    def _compile_conditional(self, expr):
+        np = self.np
+        test_kind, test = self.compile(expr.test)
+        test = self._truthy(test, test_kind)
+        kind, consequent = self.compile(expr.consequent)
+        alternate_kind, alternate = self.compile(expr.alternate)
+        if kind != alternate_kind:
+            raise FusedUnsupportedError('Both branches of a condition must be numbers or booleans')
+
+        # Both branches are evaluated, which never throws for numbers and booleans
+        return kind, lambda context: (np.where(test(context)[0], consequent(context)[0], alternate(context)[0]), True)
+
+    def _compile_call(self, expr):
+        np = self.np
+        name = expr.callee
+        unary = {
+            'abs': np.abs, 'ceil': np.ceil, 'floor': np.floor, 'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log,
+            'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan,
+        }
+
+        if name in unary and len(expr.arguments) == 1:
+            ufunc = unary[name]
+            argument, = self._numbers(expr.arguments)
+            return _number, lambda context: self._apply(ufunc, [argument(context)], np.float64)
+
+        if name == 'round' and len(expr.arguments) == 1:
+            # JavaScript rounds halves up
+            argument, = self._numbers(expr.arguments)
+
+            def evaluate_round(context):
+                value = self._apply(np.add, [argument(context), (0.5, False)], np.float64)
+                return self._apply(np.floor, [value], np.float64)
+            return _number, evaluate_round
+
+        if name in ('pow', 'atan2') and len(expr.arguments) == 2:
+            base, exponent = self._numbers(expr.arguments)
+            if name == 'atan2':
+                return _number, lambda context: self._apply(np.arctan2, [base(context), exponent(context)], np.float64)
+
+            def evaluate_pow(context):
+                base_value = base(context)[0]
+                exponent_value = exponent(context)[0]
+                result, _ = self._apply(np.power, [(base_value, False), (exponent_value, False)], np.float64)
+                # 1 ** Infinity is NaN in JavaScript
+                return np.where((np.abs(base_value) == 1) & np.isinf(exponent_value), np.nan, result), True
+            return _number, evaluate_pow
+
+        if name in ('min', 'max') and expr.arguments:
+            ufunc = np.minimum if name == 'min' else np.maximum
+            arguments = self._numbers(expr.arguments)
+
+            def evaluate_extremum(context):
+                result = arguments[0](context)
+                for argument in arguments[1:]:
+                    result = self._apply(ufunc, [result, argument(context)], np.float64)
+                return result
+            return _number, evaluate_extremum
+
+        if name == 'clamp' and len(expr.arguments) == 3:
+            value, lower, upper = self._numbers(expr.arguments)
+
+            def evaluate_clamp(context):
+                result = self._apply(np.maximum, [value(context), lower(context)], np.float64)
+                return self._apply(np.minimum, [result, upper(context)], np.float64)
+            return _number, evaluate_clamp
+
+        if name in ('isNaN', 'isFinite', 'isValid', 'isNumber', 'isBoolean', 'toNumber', 'toBoolean') and len(expr.arguments) == 1:
+            kind, argument = self.compile(expr.arguments[0])
+            if name in ('isNumber', 'isBoolean'):
+                return _boolean, self._constant((kind == _number) == (name == 'isNumber'))
+            if name == 'toNumber':
+                return _number, self._as_number(argument, kind)
+            if name == 'toBoolean':
+                return _boolean, self._truthy(argument, kind)
+            if kind == _boolean:
+                return _boolean, self._constant(name != 'isNaN')
+            if name == 'isNaN':
+                return _boolean, lambda context: self._apply(np.isnan, [argument(context)], np.bool_)
+            if name == 'isFinite':
+                return _boolean, lambda context: self._apply(np.isfinite, [argument(context)], np.bool_)
+            return _boolean, lambda context: self._apply(np.equal, [argument(context), argument(context)], np.bool_)
+
+        if name in ('scale', 'invert', 'bandwidth') and expr.arguments and isinstance(expr.arguments[0], Literal) and \
+                isinstance(expr.arguments[0].value, str) and expr.arguments[0].value in self.scales:
+            return self._compile_scale(expr)
+
+        raise FusedUnsupportedError('The `{}` function is not supported by the fused evaluator'.format(name))
+
+    def _compile_scale(self, expr):
+        name = expr.arguments[0].value
+        scale = self.scales[name]
+        if expr.callee == 'bandwidth':
+            return _number, self._constant(float(scale.bandwidth()))
+
+        invert = expr.callee == 'invert'
+        if len(expr.arguments) < 2 or not scale.returns_numbers(invert):
+            raise FusedUnsupportedError('The `{}` call of the `{}` scale does not return numbers'.format(expr.callee, name))
+        # Scales convert their input like Vega does, undefined results being NaN
+        kind, argument = self.compile(expr.arguments[1])
+        func = scale.invert_array if invert else scale.apply
+        return _number, lambda context: (func(argument(context)[0]), True)
+
+
+class FusedEvaluator(object):
+    """Evaluate a translated expression over number and boolean columns, one block of rows at a time.
+
+    Columns are given as a mapping of field names to arrays of the same length, like `numpy.load` memory-mapped
+    arrays. Each row is the `datum` variable, and the values of the other variables, which must be numbers
+    or booleans, are given as `variables`, and the scales the expression calls, e.g. from `scales.parse_scales`,
+    as `scales`. A `FusedUnsupportedError` is raised if the expression uses other values or functions that have
+    no NumPy implementation.
+    """
+
+    def __init__(self, expr, block_size=default_block_size, datum='datum', variables=None, scales=None):
+        self.expr = expr
+        self.block_size = block_size
+        self.datum = datum
+        self.variables = {} if variables is None else variables
+        self.scales = {} if scales is None else scales
+        self._plans = {}
+
+    def plan(self, columns):
+        """Return the expression compiled for the types of the columns."""
+        kinds = {}
+        for name, column in columns.items():
+            if column.dtype.kind == 'b':
+                kinds[name] = _boolean
+            elif column.dtype.kind in 'iuf':
+                kinds[name] = _number
+        key = tuple(sorted(kinds.items()))
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = _Plan(self.expr, kinds, self.variables, self.datum, self.scales)
+        return plan
+
+    def blocks(self, columns):
+        """Yield the start row and the result of each block of rows."""
+        np = _numpy()
+        plan = self.plan(columns)
+        length = len(next(iter(columns.values()))) if columns else 0
+        names = [name for name in columns if name in plan.kinds]
+
+        with np.errstate(all='ignore'):
+            for start in range(0, length, self.block_size):
+                stop = min(start + self.block_size, length)
+                block = {}
+                for name in names:
+                    values = columns[name][start:stop]
+                    # Numbers are computed as doubles, like in JavaScript
+                    block[name] = values if plan.kinds[name] == _boolean else values.astype(np.float64, copy=False)
+                yield start, stop, plan.evaluate({'columns': block})[0]
+
+    def evaluate(self, columns, out=None):
+        """Return the array of the results of every row, written into `out` if given."""
+        np = _numpy()
+        plan = self.plan(columns)
+        length = len(next(iter(columns.values()))) if columns else 0
+        if out is None:
+            out = np.empty(length, dtype=np.bool_ if plan.kind == _boolean else np.float64)
+        for start, stop, result in self.blocks(columns):
+            out[start:stop] = result
+        return out
+
+    def filter(self, columns):
+        """Return the array of the indices of the rows for which the expression is truthy."""
+        np = _numpy()
+        indices = []
+        for start, stop, result in self.blocks(columns):
+            result = np.broadcast_to(result, (stop - start, ))
+            truthy = result if result.dtype == np.bool_ else (result != 0) & (result == result)
+            indices.append(np.flatnonzero(truthy) + start)
+        return np.concatenate(indices) if indices else np.empty(0, dtype=np.intp)
@@ -0,0 +1,276 @@
+"""Random generation of valid py2vega functions, for stress-testing and profiling the translator."""
+
+import inspect
+import linecache
+import random
+
+from . import functions
+from .constants import constants
+from .main import Variable
+
+default_whitelist = [
+    'value',
+    Variable('datum', ['count', 'name', 'date', Variable('position', ['x', 'y'])]),
+]
+
+# Function modules, with the list of the functions they implement
+function_modules = [
+    (functions.math, functions.math_functions),
+    (functions.type_checking, functions.type_checking_functions),
+    (functions.type_coercing, functions.type_coercing_functions),
+    (functions.date_time, functions.date_time_functions),
+    (functions.array, functions.array_functions),
+    (functions.string, functions.string_functions),
+    (functions.formatting, functions.formatting_functions),
+    (functions.regexp, functions.regexp_functions),
+    (functions.color, functions.color_functions),
+    (functions.object, functions.object_functions),
+    (functions.scale, functions.scale_functions),
+]
+
+builtin_arities = {'bool': 1, 'float': 1, 'int': 1, 'len': 1, 'str': 1}
+
+# Patterns used for `regexp` calls, which are validated at translation time
+regexp_patterns = ['^a', '\\d+', '[a-z]+$', '(foo|bar)', '^\\w+@\\w+\\.com$']
+
+_binary_operators = ['+', '-', '*', '/', '%', '**']
+_comparison_operators = ['==', '!=', '<', '<=', '>', '>=']
+_words = ['a', 'b', 'foo', 'bar', 'red', 'green', 'blue', 'x', 'y', 'z']
+
+
+def _function_arities():
+    arities = {}
+    for module, names in function_modules:
+        for name in names:
+            if name not in arities:
+                arities[name] = len(inspect.getfullargspec(getattr(module, name)).args)
+    return arities
+
+
+def _variable_paths(whitelist):
+    """Return the access paths of the whitelisted variables and of their members."""
+    paths = []
+
+    def add(prefix, member):
+        if isinstance(member, Variable):
+            path = prefix + member.name
+            paths.append(path)
+            for child in member.members:
+                add(path + '.', child)
+        else:
+            paths.append(prefix + member)
+
+    for entry in whitelist:
+        add('', entry)
+    return paths
+
+
+# Number of arguments of the Vega functions, as declared by their Python mock
+function_arities = _function_arities()
+
+
+class ProgramGenerator(object):
+    """Generate random py2vega functions, the same seed always giving the same functions.
+
+    Generated functions are made of assignments, `if`/`elif`/`else` ladders and `return` statements,
+    using literals, nested containers, subscripts, member accesses of the whitelisted variables, and calls
+    to the built-in coercions and to the functions of every `py2vega.functions` module. `size` is the
+    number of assignments of a function and `depth` the maximum nesting depth of its expressions and
+    of its `if` statements.
+    """
+
+    def __init__(self, seed=0, size=20, depth=4, whitelist=default_whitelist, max_inlined=50):
+        """Construct a ProgramGenerator.
+
+        Assigned variables are inlined by the translator, a variable is then only used if its inlined
+        expression has at most `max_inlined` nodes, so that the translated expressions stay reasonably sized.
+        """
+        self.random = random.Random(seed)
+        self.size = size
+        self.depth = depth
+        self.whitelist = whitelist
+        self.max_inlined = max_inlined
+        self.paths = _variable_paths(whitelist)
+        self.function_names = sorted(function_arities)
+        self._count = 0
+
+    def source(self, name=None):
+        """Return the source code of a new function."""
+        if name is None:
+            name = 'generated_{}'.format(self._count)
+        self._count += 1
+        self._variables = 0
+
+        lines = ['def {}():'.format(name)]
+        self._block(lines, 1, {}, self.size, self.depth)
+        return '\n'.join(lines) + '\n'
+
+    def function(self, name=None):
+        """Return a new function, whose source code can be retrieved with `inspect.getsource`."""
+        source = self.source(name)
+        name = source[4:source.index('(')]
+        filename = '<py2vega-generated {}>'.format(name)
+
+        # Registering the source the way IPython does, so that `inspect.getsource` finds it
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        namespace = {}
+        exec(compile(source, filename, 'exec'), namespace)
+        return namespace[name]
+
+    def _block(self, lines, indent, scope, assignments, depth):
+        """Append a function or `if` body, made of assignments followed by a `return` or an `if` statement."""
+        scope = dict(scope)
+        prefix = '    ' * indent
+        for _ in range(assignments):
+            target = 'v{}'.format(self._variables)
+            self._variables += 1
+            expr, weight = self.expression(scope, self.random.randint(0, self.depth))
+            lines.append('{}{} = {}'.format(prefix, target, expr))
+            scope[target] = weight
+
+        if depth > 0 and self.random.random() < 0.6:
+            branches = self.random.randint(1, 4)
+            for idx in range(branches):
+                test, _ = self.expression(scope, self.random.randint(0, self.depth))
+                lines.append('{}{} {}:'.format(prefix, 'if' if idx == 0 else 'elif', test))
+                self._block(lines, indent + 1, scope, self.random.randint(0, 2), depth - 1)
+            lines.append('{}else:'.format(prefix))
+            self._block(lines, indent + 1, scope, self.random.randint(0, 2), depth - 1)
+        else:
+            expr, _ = self.expression(scope, self.depth)
+            lines.append('{}return {}'.format(prefix, expr))
+
+    def expression(self, scope, depth):
+        """Return the source of a random expression using the given local variables, and its inlined node count."""
+        if depth <= 0:
+            return self._leaf(scope)
+
+        kind = self.random.choice([
+            'binary', 'unary', 'compare', 'membership', 'boolean', 'ternary', 'call', 'call', 'builtin',
+            'list', 'dict', 'subscript', 'slice', 'leaf'
+        ])
+        if kind == 'leaf':
+            return self._leaf(scope)
+        return getattr(self, '_' + kind)(scope, depth - 1)
+
+    def _expressions(self, scope, depth, count):
+        results = [self.expression(scope, depth) for _ in range(count)]
+        return [expr for expr, _ in results], 1 + sum(weight for _, weight in results)
+
+    def _literal(self):
+        kind = self.random.randint(0, 4)
+        if kind == 0:
+            return repr(self.random.randint(-10, 100))
+        if kind == 1:
+            return repr(round(self.random.uniform(-10, 10), 2))
+        if kind == 2:
+            return repr(self.random.choice(_words))
+        return self.random.choice(['True', 'False', 'None'])
+
+    def _leaf(self, scope):
+        choice = self.random.random()
+        locals_ = [name for name, weight in scope.items() if weight <= self.max_inlined]
+        if choice < 0.3 and locals_:
+            name = self.random.choice(sorted(locals_))
+            return name, scope[name]
+        if choice < 0.6:
+            return self.random.choice(self.paths), 1
+        if choice < 0.65:
+            return self.random.choice(constants), 1
+        return self._literal(), 1
+
+    def _variable(self, scope):
+        """Return a local or whitelisted variable, which can be subscripted unlike literals."""
+        locals_ = [name for name, weight in scope.items() if weight <= self.max_inlined]
+        if locals_ and self.random.random() < 0.5:
+            name = self.random.choice(sorted(locals_))
+            return name, scope[name]
+        return self.random.choice(self.paths), 1
+
+    def _binary(self, scope, depth):
+        (left, right), weight = self._expressions(scope, depth, 2)
+        return '({} {} {})'.format(left, self.random.choice(_binary_operators), right), weight
+
+    def _unary(self, scope, depth):
+        operand, weight = self.expression(scope, depth)
+        return '({}{})'.format(self.random.choice(['not ', '-', '+']), operand), weight + 1
+
+    def _compare(self, scope, depth):
+        operands, weight = self._expressions(scope, depth, self.random.randint(2, 3))
+        pieces = [operands[0]]
+        for operand in operands[1:]:
+            pieces.append(self.random.choice(_comparison_operators))
+            pieces.append(operand)
+        return '({})'.format(' '.join(pieces)), weight
+
+    def _membership(self, scope, depth):
+        value, weight = self.expression(scope, depth)
+        # Large lists are lowered to object lookups
+        size = self.random.choice([2, 3, 5, 20])
+        if self.random.random() < 0.5:
+            elements = [repr('{}{}'.format(self.random.choice(_words), idx)) for idx in range(size)]
+        else:
+            elements = [repr(idx * 3) for idx in range(size)]
+        container = '[{}]' if self.random.random() < 0.7 else '{{{}}}'
+        operator = self.random.choice(['in', 'not in'])
+        return '({} {} {})'.format(value, operator, container.format(', '.join(elements))), weight + 1
+
+    def _boolean(self, scope, depth):
+        operands, weight = self._expressions(scope, depth, self.random.randint(2, 4))
+        return '({})'.format(' {} '.format(self.random.choice(['and', 'or'])).join(operands)), weight
+
+    def _ternary(self, scope, depth):
+        (test, body, orelse), weight = self._expressions(scope, depth, 3)
+        return '({} if {} else {})'.format(body, test, orelse), weight
+
+    def _call(self, scope, depth):
+        name = self.random.choice(self.function_names)
+        if name == 'regexp':
+            return 'regexp({}, {})'.format(repr(self.random.choice(regexp_patterns)), repr(self.random.choice(['', 'g', 'i']))), 1
+        args, weight = self._expressions(scope, depth, function_arities[name])
+        return '{}({})'.format(name, ', '.join(args)), weight
+
+    def _builtin(self, scope, depth):
+        name = self.random.choice(sorted(builtin_arities))
+        args, weight = self._expressions(scope, depth, builtin_arities[name])
+        return '{}({})'.format(name, ', '.join(args)), weight
+
+    def _list(self, scope, depth):
+        elements, weight = self._expressions(scope, depth, self.random.randint(0, 4))
+        return '[{}]'.format(', '.join(elements)), weight
+
+    def _dict(self, scope, depth):
+        keys = self.random.sample(_words, self.random.randint(1, 3))
+        values = []
+        weight = 1
+        for _ in keys:
+            # Nested dicts
+            value, value_weight = self._dict(scope, depth - 1) if depth > 0 and self.random.random() < 0.3 else self.expression(scope, depth)
+            values.append(value)
+            weight += value_weight
+        return '{{{}}}'.format(', '.join('{}: {}'.format(repr(key), value) for key, value in zip(keys, values))), weight
+
+    def _subscript(self, scope, depth):
+        if self.random.random() < 0.5:
+            elements, weight = self._expressions(scope, depth, self.random.randint(1, 4))
+            index = self.random.randint(0, len(elements) - 1)
+            return '[{}][{}]'.format(', '.join(elements), index), weight + 1
+        value, weight = self._variable(scope)
+        index, index_weight = self.expression(scope, depth)
+        return '{}[{}]'.format(value, index), weight + index_weight + 1
+
+    def _slice(self, scope, depth):
+        value, weight = self._variable(scope)
+        lower = self.random.choice(['', '1', '-2'])
+        upper = self.random.choice(['', '3', '-1'])
+        return '{}[{}:{}]'.format(value, lower, upper), weight + 1
+
+
+def generate_source(seed=0, size=20, depth=4, whitelist=default_whitelist):
+    """Return the source code of a random py2vega function, the same seed always giving the same source."""
+    return ProgramGenerator(seed, size, depth, whitelist).source()
+
+
+def generate_function(seed=0, size=20, depth=4, whitelist=default_whitelist):
+    """Return a random py2vega function, the same seed always giving the same function."""
+    return ProgramGenerator(seed, size, depth, whitelist).function()
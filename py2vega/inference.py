@@ -0,0 +1,243 @@
+"""Static type inference over translated Vega expressions."""
+
+from collections import namedtuple
+
+from .analysis import comparison_operators
+from .constants import constants
+from .expression import (
+    Array, Binary, Call, Conditional, Identifier, Literal, Logical, Member, Object, Unary
+)
+from .functions import vega_function_types
+from .javascript import RegExp, inf, to_number, to_string, truthy, undefined
+
+VegaType = namedtuple('VegaType', ['kind', 'nullable'])
+VegaType.__doc__ = """Inferred type of an expression.
+
+kind: one of 'number', 'string', 'boolean', 'array', 'object', 'date', 'regexp' or 'null'
+nullable: whether the expression may evaluate to null
+"""
+
+arithmetic_operators = frozenset(['-', '*', '/', '%'])
+
+
+def parse_type(text):
+    """Parse a type declaration like 'number' or 'string?', a trailing `?` meaning that the value may be null."""
+    if text is None:
+        return None
+    if text.endswith('?'):
+        return VegaType(text[:-1], True)
+    return VegaType(text, False)
+
+
+def variable_type(variable):
+    """Return the `VegaType` declared by a whitelisted `Variable`, or the one implied by its domain."""
+    declared = parse_type(variable.type)
+    if declared is not None:
+        return declared
+    if variable.range is not None:
+        return VegaType('number', False)
+    if variable.values:
+        result = literal_type(variable.values[0])
+        for value in variable.values[1:]:
+            result = _join(result, literal_type(value))
+        return result
+    return None
+
+
+def _join(first, second):
+    if first is None or second is None:
+        return None
+    if first.kind == 'null':
+        return VegaType(second.kind, True)
+    if second.kind == 'null':
+        return VegaType(first.kind, True)
+    if first.kind != second.kind:
+        return None
+    return VegaType(first.kind, first.nullable or second.nullable)
+
+
+def literal_type(value):
+    """Return the type of a Python literal value."""
+    if value is None:
+        return VegaType('null', True)
+    if isinstance(value, bool):
+        return VegaType('boolean', False)
+    if isinstance(value, (int, float)):
+        return VegaType('number', False)
+    if isinstance(value, str):
+        return VegaType('string', False)
+    if isinstance(value, (list, tuple)):
+        return VegaType('array', False)
+    if isinstance(value, dict):
+        return VegaType('object', False)
+    if isinstance(value, RegExp):
+        return VegaType('regexp', False)
+    return None
+
+
+class TypeInference(object):
+    """Infer the types of translated expressions.
+
+    Types come from literals, from the return types of the Vega functions, and from the types declared
+    on whitelisted `Variable` instances. Results are memoized per node.
+    """
+
+    def __init__(self, whitelist):
+        """Construct a TypeInference, given a `Whitelist` index."""
+        self.whitelist = whitelist
+        # Nodes are kept alive along with their type, so that their ids are never reused
+        self._memo = {}
+
+    def infer(self, expr):
+        """Return the `VegaType` of an expression, or None if it is unknown."""
+        memo = self._memo.get(id(expr))
+        if memo is not None:
+            return memo[1]
+
+        result = self._infer(expr)
+        self._memo[id(expr)] = (expr, result)
+        return result
+
+    def variable(self, expr):
+        """Return the whitelisted `Variable` an identifier or a member access refers to, if any."""
+        if isinstance(expr, Identifier):
+            return self.whitelist.variables.get(expr.name)
+        if isinstance(expr, Member):
+            parent = self.variable(expr.object)
+            if parent is not None:
+                for member in parent.members:
+                    if getattr(member, 'name', None) == expr.property:
+                        return member
+        return None
+
+    def _infer(self, expr):
+        if isinstance(expr, Literal):
+            return literal_type(expr.value)
+
+        if isinstance(expr, Identifier):
+            if expr.name in constants:
+                return VegaType('number', False)
+            variable = self.variable(expr)
+            return None if variable is None else variable_type(variable)
+
+        if isinstance(expr, Member):
+            variable = self.variable(expr)
+            if variable is not None:
+                return variable_type(variable)
+            parent = self.infer(expr.object)
+            if expr.property == 'length' and parent is not None and parent.kind in ('string', 'array') and not parent.nullable:
+                return VegaType('number', False)
+            return None
+
+        if isinstance(expr, Unary):
+            if expr.operator == '!':
+                return VegaType('boolean', False)
+            return VegaType('number', False)
+
+        if isinstance(expr, Binary):
+            if expr.operator in comparison_operators or expr.operator in arithmetic_operators:
+                return VegaType('boolean' if expr.operator in comparison_operators else 'number', False)
+            left = self.infer(expr.left)
+            right = self.infer(expr.right)
+            if left is None or right is None:
+                return None
+            if 'string' in (left.kind, right.kind):
+                return VegaType('string', False)
+            if left.kind in ('number', 'boolean', 'null') and right.kind in ('number', 'boolean', 'null'):
+                return VegaType('number', False)
+            return None
+
+        if isinstance(expr, Logical):
+            result = self.infer(expr.operands[0])
+            for operand in expr.operands[1:]:
+                result = _join(result, self.infer(operand))
+            return result
+
+        if isinstance(expr, Conditional):
+            return _join(self.infer(expr.consequent), self.infer(expr.alternate))
+
+        if isinstance(expr, Array):
+            return VegaType('array', False)
+
+        if isinstance(expr, Object):
+            return VegaType('object', False)
+
+        if isinstance(expr, Call):
+            return parse_type(vega_function_types.get(expr.callee))
+
+        return None
+
+    def is_a(self, expr, kind, nullable=True):
+        """Return True if the expression is known to be of the given kind, and not null unless `nullable` is True."""
+        inferred = self.infer(expr)
+        return inferred is not None and inferred.kind == kind and (nullable or not inferred.nullable)
+
+
+def _literal(value):
+    """Return the node of a folded value, or None if it cannot be written as a literal."""
+    if value is undefined or value in (inf, -inf):
+        return None
+    if isinstance(value, float):
+        if value != value:
+            return Identifier('NaN')
+        if value.is_integer() and abs(value) < 2 ** 53:
+            value = int(value)
+    return Literal(value)
+
+
+def _fold_coercion(func_name, value):
+    """Compute a built-in coercion of a literal the way the Vega expression would."""
+    if func_name == 'len':
+        # Lengths are counted in UTF-16 code units, characters outside of the BMP take two of them
+        return len(value.encode('utf-16-le')) // 2 if isinstance(value, str) else undefined
+    if func_name == 'bool':
+        # isValid(value) ? toBoolean(value) : false
+        if value is None or value != value:
+            return False
+        if value == '':
+            return None
+        return value not in ('false', '0') and truthy(value)
+    if func_name == 'int':
+        # floor(null) is 0
+        number = 0 if value is None or value == '' else to_number(value)
+        if number != number or number in (inf, -inf):
+            return number
+        # Integers beyond 2 ** 53 stay doubles, like in Vega
+        return float(number) // 1
+    # toNumber and toString map null and empty strings to null
+    if value is None or value == '':
+        return None
+    if func_name == 'float':
+        return to_number(value)
+    if func_name == 'str':
+        return to_string(value)
+    return undefined
+
+
+def lower_builtin(func_name, args, types):
+    """Lower a call to a Python built-in coercion function given the types of its arguments.
+
+    Return None if the default lowering must be used. Coercions of literals are computed, and coercions
+    of values which already have the target type are dropped.
+    """
+    if len(args) != 1:
+        return None
+    arg = args[0]
+
+    if isinstance(arg, Literal) and not isinstance(arg.value, (list, tuple, dict)):
+        return _literal(_fold_coercion(func_name, arg.value))
+
+    if func_name == 'float' and types.is_a(arg, 'number'):
+        # toNumber leaves numbers and null unchanged
+        return arg
+    if func_name == 'int' and types.is_a(arg, 'number'):
+        return Call('floor', [arg])
+    if func_name == 'bool':
+        if types.is_a(arg, 'boolean', nullable=False):
+            return arg
+        if types.is_a(arg, 'boolean'):
+            return Binary('===', arg, Literal(True), parens=True)
+        if types.is_a(arg, 'number', nullable=False):
+            # toBoolean maps NaN to false, as the isValid check would
+            return Call('toBoolean', [arg])
+    return None
@@ -0,0 +1,86 @@
+"""Interning of the translations of structurally equal Python subtrees."""
+
+import ast
+
+_no_names = frozenset()
+
+
+class InternTable(object):
+    """Share the translation of Python expression subtrees across many translations.
+
+    Python subtrees are numbered by structure, line numbers aside, and their translation is stored
+    along with the scope variables they read. A structurally equal subtree reading the same scope
+    variables is then translated once, all the translations sharing the same expression nodes.
+
+    Structure numbers are memoized per node and each node is numbered from the numbers of its children,
+    so numbering a tree is linear in its number of nodes. A table must only be used by translations
+    sharing the same whitelist and options, and interned nodes keep the location of their first translation.
+    """
+
+    def __init__(self):
+        self._numbers = {}
+        # Nodes are kept alive along with their number, so that their ids are never reused
+        self._memo = {}
+        self._translations = {}
+        self.hits = 0
+
+    def number(self, node):
+        """Return the structure number of a Python subtree and the names it reads."""
+        memo = self._memo.get(id(node))
+        if memo is not None:
+            return memo[1]
+
+        fields = []
+        names = _no_names
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, ast.AST):
+                if not value._fields:
+                    # Operators and expression contexts
+                    fields.append(value.__class__)
+                    continue
+                number, child_names = self.number(value)
+                fields.append(number)
+                if child_names:
+                    names = names | child_names
+            elif isinstance(value, list):
+                items = []
+                for item in value:
+                    if isinstance(item, ast.AST):
+                        number, child_names = self.number(item)
+                        items.append(number)
+                        if child_names:
+                            names = names | child_names
+                    else:
+                        items.append((item.__class__, item))
+                fields.append(tuple(items))
+            else:
+                # 1, 1.0 and True are equal but are not translated the same way
+                fields.append((value.__class__, value))
+        if isinstance(node, ast.Name):
+            names = names | frozenset([node.id])
+
+        key = (node.__class__, tuple(fields))
+        result = (self._numbers.setdefault(key, len(self._numbers)), names)
+        self._memo[id(node)] = (node, result)
+        return result
+
+    def key(self, node, scope, parameters):
+        """Return the key of the translation of a Python expression node in the given scope."""
+        number, names = self.number(node)
+        # Scope variables are themselves interned, their identity then tells if they are the same
+        bindings = tuple(sorted((name, id(scope[name])) for name in names if name in scope))
+        return (number, bindings, parameters)
+
+    def get(self, key):
+        """Return the translation stored for a key, or None."""
+        entry = self._translations.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def add(self, key, expr, scope):
+        """Store the translation for a key, keeping the scope variables it was translated with alive."""
+        names = [name for name, _ in key[1]]
+        self._translations[key] = (expr, [scope[name] for name in names])
@@ -0,0 +1,425 @@
+"""Intervals of the values of numbers and booleans, and their computation over translated expressions.
+
+Zone maps compute them from the minimum and maximum values of columns over chunks of rows, and the
+simplification of expressions from the domains declared on the whitelist.
+"""
+
+import math
+from collections import namedtuple
+
+from .expression import Array, Binary, Call, Conditional, Identifier, Index, Literal, Logical, Member, Unary
+from .fused import _constants
+from .javascript import number_to_string
+
+Interval = namedtuple('Interval', ['low', 'high', 'nan', 'boolean'])
+Interval.__doc__ = """Values a number or a boolean may take.
+
+low, high: bounds of the values that are not NaN, `low` being greater than `high` if there are none
+nan: whether the value may be NaN
+boolean: whether the value is a boolean, false and true being 0 and 1
+"""
+
+inf = float('inf')
+
+# Values of an unknown number, and of NaN
+any_number = Interval(-inf, inf, True, False)
+not_a_number = Interval(inf, -inf, True, False)
+
+_comparison_operators = frozenset(['<', '<=', '>', '>=', '==', '!=', '===', '!=='])
+
+
+def point(value):
+    """Return the interval of a number or boolean value, or None."""
+    if isinstance(value, bool):
+        return Interval(float(value), float(value), False, True)
+    if isinstance(value, (int, float)):
+        value = float(value)
+        return not_a_number if value != value else Interval(value, value, False, False)
+    return None
+
+
+def truth_interval(truth):
+    """Return the interval of a boolean, given whether it is always true, always false, or None if unknown."""
+    if truth is None:
+        return Interval(0.0, 1.0, False, True)
+    return point(truth)
+
+
+def _is_empty(interval):
+    return interval.low > interval.high
+
+
+def _truthy(interval):
+    """Return whether the values of an interval are always truthy, always falsy, or None if unknown."""
+    if _is_empty(interval) or interval.low == interval.high == 0:
+        return False
+    if not interval.nan and (interval.low > 0 or interval.high < 0):
+        return True
+    return None
+
+
+def join(a, b):
+    """Return the interval of a value which is either in `a` or in `b`, or None if unknown."""
+    if a is None or b is None or a.boolean != b.boolean:
+        return None
+    return Interval(min(a.low, b.low), max(a.high, b.high), a.nan or b.nan, a.boolean)
+
+
+def _number(interval):
+    return interval._replace(boolean=False)
+
+
+def _arithmetic(operation, a, b):
+    if _is_empty(a) or _is_empty(b):
+        return not_a_number
+    # Sums, differences and products reach their bounds on the bounds of their operands, only them may give NaN
+    candidates = [operation(x, y) for x in (a.low, a.high) for y in (b.low, b.high)]
+    if any(value != value for value in candidates):
+        return any_number
+    return Interval(min(candidates), max(candidates), a.nan or b.nan, False)
+
+
+def _multiply(a, b):
+    result = _arithmetic(lambda x, y: x * y, a, b)
+    # Zero times an infinity is NaN, zero may be inside an interval and not only one of its bounds
+    if not result.nan and (_unbounded_zero(a, b) or _unbounded_zero(b, a)):
+        return result._replace(nan=True)
+    return result
+
+
+def _unbounded_zero(a, b):
+    return a.low <= 0 <= a.high and (math.isinf(b.low) or math.isinf(b.high))
+
+
+def _divide(a, b):
+    if b.low <= 0 <= b.high:
+        return any_number
+    return _arithmetic(lambda x, y: x / y, a, b)
+
+
+def _modulo(a, b):
+    if _is_empty(a) or _is_empty(b):
+        return not_a_number
+    nan = a.nan or b.nan or b.low <= 0 <= b.high or math.isinf(a.low) or math.isinf(a.high)
+    # The remainder has the sign of the dividend, and is smaller than the divisor in magnitude
+    bound = max(abs(b.low), abs(b.high))
+    low = max(a.low, -bound) if a.low < 0 else 0.0
+    high = min(a.high, bound) if a.high > 0 else 0.0
+    return Interval(low, high, nan, False)
+
+
+def _less(a, b, equal):
+    """Return whether `a < b`, or `a <= b` if `equal` is True, is always true, always false, or None if unknown."""
+    if _is_empty(a) or _is_empty(b):
+        return False
+    if a.high < b.low or (equal and a.high == b.low):
+        return None if a.nan or b.nan else True
+    if a.low > b.high or (not equal and a.low == b.high):
+        return False
+    return None
+
+
+def _equals(a, b, strict):
+    if strict and a.boolean != b.boolean:
+        return False
+    if _is_empty(a) or _is_empty(b) or a.high < b.low or b.high < a.low:
+        return False
+    if a.low == a.high == b.low == b.high and not a.nan and not b.nan:
+        return True
+    return None
+
+
+def _monotonic(func, interval):
+    """Apply a non-decreasing function to the bounds of an interval, infinities and NaN being left as is."""
+    if _is_empty(interval):
+        return not_a_number
+    bounds = [bound if math.isinf(bound) else func(bound) for bound in (interval.low, interval.high)]
+    return Interval(bounds[0], bounds[1], interval.nan, False)
+
+
+def _extremum(func, intervals):
+    """Return the interval of the minimum or maximum of values, `func` being `min` or `max`."""
+    if any(_is_empty(interval) for interval in intervals):
+        return not_a_number
+    low = func(interval.low for interval in intervals)
+    high = func(interval.high for interval in intervals)
+    return Interval(low, high, any(interval.nan for interval in intervals), False)
+
+
+def _negate(truth):
+    return None if truth is None else not truth
+
+
+def _conjunction(truths):
+    if any(truth is False for truth in truths):
+        return False
+    if all(truth is True for truth in truths):
+        return True
+    return None
+
+
+def _elements(expr):
+    """Return the element nodes of an array expression, or None."""
+    if isinstance(expr, Array):
+        return expr.elements
+    if isinstance(expr, Literal) and isinstance(expr.value, (list, tuple)):
+        return [Literal(value) for value in expr.value]
+    return None
+
+
+class IntervalAnalysis(object):
+    """Compute the interval of the values of the nodes of an expression, given the intervals of the fields.
+
+    Nodes whose values are not known to be numbers or booleans, e.g. strings or objects, have no interval.
+    """
+
+    def __init__(self, statistics, variables, datum):
+        self.statistics = statistics
+        self.variables = variables
+        self.datum = datum
+        self._intervals = {}
+        self._truths = {}
+
+    def interval(self, expr):
+        """Return the interval of an expression, or None if unknown."""
+        memo = self._intervals.get(id(expr))
+        if memo is None:
+            memo = self._intervals[id(expr)] = (expr, self._interval(expr))
+        return memo[1]
+
+    def truth(self, expr):
+        """Return whether an expression is always truthy, always falsy, or None if unknown."""
+        memo = self._truths.get(id(expr))
+        if memo is None:
+            memo = self._truths[id(expr)] = (expr, self._truth(expr))
+        return memo[1]
+
+    def _truth(self, expr):
+        if isinstance(expr, Logical):
+            truths = [self.truth(operand) for operand in expr.operands]
+            if expr.operator == '&&':
+                return _conjunction(truths)
+            return _negate(_conjunction([_negate(truth) for truth in truths]))
+
+        if isinstance(expr, Unary) and expr.operator == '!':
+            return _negate(self.truth(expr.argument))
+
+        if isinstance(expr, Conditional):
+            test = self.truth(expr.test)
+            if test is not None:
+                return self.truth(expr.consequent if test else expr.alternate)
+            consequent = self.truth(expr.consequent)
+            return consequent if consequent == self.truth(expr.alternate) else None
+
+        interval = self.interval(expr)
+        return None if interval is None else _truthy(interval)
+
+    def _interval(self, expr):
+        if isinstance(expr, Literal):
+            return point(expr.value)
+
+        if isinstance(expr, Identifier):
+            if expr.name in self.variables:
+                return point(self.variables[expr.name])
+            if expr.name in _constants:
+                return point(_constants[expr.name])
+            return None
+
+        if isinstance(expr, Member):
+            if isinstance(expr.object, Identifier) and expr.object.name == self.datum:
+                return self.statistics.get(expr.property)
+            return None
+
+        if isinstance(expr, Unary):
+            argument = self.interval(expr.argument)
+            if expr.operator == '!':
+                return truth_interval(self.truth(expr))
+            if argument is None:
+                return None
+            if expr.operator == '-':
+                return Interval(-argument.high, -argument.low, argument.nan, False)
+            return _number(argument) if expr.operator == '+' else None
+
+        if isinstance(expr, Binary):
+            return self._binary(expr)
+
+        if isinstance(expr, Logical):
+            # `a && b` is `a` if `a` is falsy, `b` otherwise, and `a || b` is `a` if `a` is truthy
+            values = []
+            for idx, operand in enumerate(expr.operands):
+                truth = self.truth(operand)
+                last = idx == len(expr.operands) - 1
+                if not last and truth is (expr.operator == '&&'):
+                    continue
+                values.append(self.interval(operand))
+                if truth is (expr.operator == '||'):
+                    break
+            result = values[0]
+            for value in values[1:]:
+                result = join(result, value)
+            return result
+
+        if isinstance(expr, Conditional):
+            test = self.truth(expr.test)
+            if test is not None:
+                return self.interval(expr.consequent if test else expr.alternate)
+            return join(self.interval(expr.consequent), self.interval(expr.alternate))
+
+        if isinstance(expr, Call):
+            return self._call(expr)
+
+        return None
+
+    def _binary(self, expr):
+        operator = expr.operator
+        if operator == '===' and isinstance(expr.left, Index):
+            return truth_interval(self._lookup(expr.left, expr.right))
+
+        left = self.interval(expr.left)
+        right = self.interval(expr.right)
+        if left is None or right is None:
+            # Strings are concatenated and compared differently, comparisons give booleans all the same
+            return truth_interval(None) if operator in _comparison_operators else None
+
+        if operator == '+':
+            return _arithmetic(lambda x, y: x + y, left, right)
+        if operator == '-':
+            return _arithmetic(lambda x, y: x - y, left, right)
+        if operator == '*':
+            return _multiply(left, right)
+        if operator == '/':
+            return _divide(left, right)
+        if operator == '%':
+            return _modulo(left, right)
+
+        if operator == '<':
+            return truth_interval(_less(left, right, False))
+        if operator == '<=':
+            return truth_interval(_less(left, right, True))
+        if operator == '>':
+            return truth_interval(_less(right, left, False))
+        if operator == '>=':
+            return truth_interval(_less(right, left, True))
+        if operator in ('==', '==='):
+            return truth_interval(_equals(left, right, operator == '==='))
+        if operator in ('!=', '!=='):
+            return truth_interval(_negate(_equals(left, right, operator == '!==')))
+        return None
+
+    def _lookup(self, index, expected):
+        """Return whether a lookup of a value in a constant object, `{'1': 1}[value] === 1`, always succeeds or fails."""
+        if not isinstance(index.object, Literal) or not isinstance(index.object.value, dict) or \
+                not isinstance(expected, Literal) or expected.value != 1:
+            return None
+        value = self.interval(index.index)
+        if value is None or value.boolean:
+            return None
+
+        keys = [key for key, item in index.object.value.items() if item == 1 and isinstance(item, int)]
+        numbers = []
+        for key in keys:
+            try:
+                number = float(key)
+            except ValueError:
+                continue
+            # Only keys which are the string of a number match it
+            if number_to_string(number) == key:
+                numbers.append(number)
+
+        if not any(value.low <= number <= value.high for number in numbers):
+            return False
+        if value.low == value.high and not value.nan:
+            return True
+        return None
+
+    def _call(self, expr):
+        name = expr.callee
+        args = expr.arguments
+
+        if name == 'indexof' and len(args) == 2:
+            return self._indexof(args[0], args[1])
+        if name == 'inrange' and len(args) in (2, 3, 4):
+            return truth_interval(self._inrange(args))
+        if name == 'toBoolean' and len(args) == 1:
+            return truth_interval(self.truth(args[0]))
+
+        intervals = [self.interval(arg) for arg in args]
+        if not args or any(interval is None for interval in intervals):
+            return None
+        value = intervals[0]
+
+        if name in ('min', 'max'):
+            return _extremum(min if name == 'min' else max, intervals)
+        if name == 'clamp' and len(args) == 3:
+            return _extremum(max, [intervals[1], _extremum(min, [value, intervals[2]])])
+        if len(args) != 1:
+            return None
+
+        if name == 'abs':
+            if value.low >= 0 or _is_empty(value):
+                return _number(value)
+            if value.high <= 0:
+                return Interval(-value.high, -value.low, value.nan, False)
+            return Interval(0.0, max(-value.low, value.high), value.nan, False)
+        if name == 'floor':
+            return _monotonic(lambda x: float(math.floor(x)), value)
+        if name == 'ceil':
+            return _monotonic(lambda x: float(math.ceil(x)), value)
+        if name == 'round':
+            return _monotonic(lambda x: float(math.floor(x + 0.5)), value)
+        if name == 'toNumber':
+            return _number(value)
+        if name in ('isNumber', 'isBoolean'):
+            return point(value.boolean == (name == 'isBoolean'))
+        if name in ('isNaN', 'isValid'):
+            # Numbers and booleans are only invalid if they are NaN
+            if value.boolean or not value.nan:
+                is_nan = False
+            else:
+                is_nan = True if _is_empty(value) else None
+            return truth_interval(is_nan if name == 'isNaN' else _negate(is_nan))
+        return None
+
+    def _indexof(self, container, value):
+        """Return the interval of the index of a value in a constant array, compared with strict equality."""
+        elements = _elements(container)
+        interval = self.interval(value)
+        if elements is None or interval is None:
+            return None
+
+        found = []
+        for idx, element in enumerate(elements):
+            element = self.interval(element)
+            if element is None:
+                return None
+            equals = _equals(interval, element, True)
+            if equals is True:
+                return Interval(float(found[0] if found else idx), float(idx), False, False)
+            if equals is None:
+                found.append(idx)
+
+        if not found:
+            return point(-1)
+        return Interval(-1.0, float(found[-1]), False, False)
+
+    def _inrange(self, args):
+        bounds = _elements(args[1])
+        value = self.interval(args[0])
+        if bounds is None or len(bounds) < 1 or value is None:
+            return None
+
+        flags = []
+        for arg in args[2:]:
+            if not isinstance(arg, Literal) or not isinstance(arg.value, bool):
+                return None
+            flags.append(arg.value)
+        left, right = flags + [True] * (2 - len(flags))
+
+        first = self.interval(bounds[0])
+        last = self.interval(bounds[-1])
+        if first is None or last is None or first.nan or last.nan or _is_empty(first) or _is_empty(last):
+            return None
+        # The bounds are swapped if they are in decreasing order
+        lower = _extremum(min, [first, last])
+        upper = _extremum(max, [first, last])
+        return _conjunction([_less(lower, value, left), _less(value, upper, right)])
@@ -0,0 +1,373 @@
+"""JavaScript semantics needed to evaluate or fold Vega expressions in Python."""
+
+import math
+import re
+
+
+class _Undefined(object):
+    """The JavaScript `undefined` value."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'undefined'
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+
+undefined = _Undefined()
+
+NaN = float('nan')
+inf = float('inf')
+
+
+def is_number(value):
+    """Return True if the value is a JavaScript number."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_finite(value):
+    """Return True if a number is neither infinite nor NaN, like `math.isfinite` which Python 2 does not have."""
+    return not (math.isinf(value) or math.isnan(value))
+
+
+def is_nullish(value):
+    """Return True if the value is null or undefined."""
+    return value is None or value is undefined
+
+
+def number_to_string(value):
+    """Format a number the way JavaScript's `String(number)` does."""
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return 'Infinity' if value > 0 else '-Infinity'
+    if value == 0:
+        return '0'
+
+    sign = '-' if value < 0 else ''
+
+    # Python and JavaScript both use the shortest digits representing the number exactly
+    mantissa, _, exponent = repr(abs(value)).partition('e')
+    integer, _, fraction = mantissa.partition('.')
+    digits = integer + fraction
+    point = len(integer) + int(exponent or 0)
+
+    stripped = digits.lstrip('0')
+    point -= len(digits) - len(stripped)
+    digits = stripped.rstrip('0')
+
+    k = len(digits)
+    if k <= point <= 21:
+        return sign + digits + '0' * (point - k)
+    if 0 < point <= 21:
+        return sign + digits[:point] + '.' + digits[point:]
+    if -6 < point <= 0:
+        return sign + '0.' + '0' * -point + digits
+    exponent = point - 1
+    return '{}{}{}e{}{}'.format(
+        sign, digits[0], '.' + digits[1:] if k > 1 else '', '+' if exponent > 0 else '-', abs(exponent))
+
+
+def to_primitive(value):
+    """Convert arrays and objects to their primitive value."""
+    if isinstance(value, (list, dict)):
+        return to_string(value)
+    return value
+
+
+def to_string(value):
+    """Convert a value to a string, the way JavaScript's `String(value)` does."""
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return 'null'
+    if value is undefined:
+        return 'undefined'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if is_number(value):
+        return number_to_string(value)
+    if isinstance(value, list):
+        return ','.join('' if is_nullish(elt) else to_string(elt) for elt in value)
+    if isinstance(value, dict):
+        return '[object Object]'
+    if isinstance(value, RegExp):
+        return value.literal
+    return str(value)
+
+
+_decimal_re = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+_infinity_re = re.compile(r'^[+-]?Infinity$')
+_radix_re = re.compile(r'^0([xXoObB])([0-9a-fA-F]+)$')
+
+
+def to_number(value):
+    """Convert a value to a number, the way JavaScript's `Number(value)` does."""
+    if is_number(value):
+        return value
+    if value is None or value is False:
+        return 0
+    if value is True:
+        return 1
+    if isinstance(value, str):
+        text = value.strip()
+        if text == '':
+            return 0
+        if _decimal_re.match(text):
+            return float(text)
+        if _infinity_re.match(text):
+            return -inf if text[0] == '-' else inf
+        match = _radix_re.match(text)
+        if match is not None:
+            try:
+                return int(match.group(2), {'x': 16, 'o': 8, 'b': 2}[match.group(1).lower()])
+            except ValueError:
+                return NaN
+        return NaN
+    if isinstance(value, list):
+        return to_number(to_string(value))
+    return NaN
+
+
+def to_integer(value):
+    """Convert a value to an integer, the way JavaScript does for indices."""
+    number = to_number(value)
+    if math.isnan(number):
+        return 0
+    if math.isinf(number):
+        return number
+    return int(number)
+
+
+def truthy(value):
+    """Return the JavaScript truthiness of a value."""
+    if value is None or value is undefined or value is False:
+        return False
+    if value is True:
+        return True
+    if is_number(value):
+        return value == value and value != 0
+    if isinstance(value, str):
+        return value != ''
+    return True
+
+
+def strict_equals(a, b):
+    """JavaScript `===` operator."""
+    if is_number(a) and is_number(b):
+        return a == b
+    if isinstance(a, str) and isinstance(b, str):
+        return a == b
+    if isinstance(a, bool) and isinstance(b, bool):
+        return a == b
+    return a is b
+
+
+def loose_equals(a, b):
+    """JavaScript `==` operator."""
+    if is_nullish(a) or is_nullish(b):
+        return is_nullish(a) and is_nullish(b)
+    if type(a) is type(b) or (is_number(a) and is_number(b)):
+        return strict_equals(a, b)
+    if isinstance(a, bool):
+        return loose_equals(to_number(a), b)
+    if isinstance(b, bool):
+        return loose_equals(a, to_number(b))
+    if is_number(a) and isinstance(b, str):
+        return a == to_number(b)
+    if isinstance(a, str) and is_number(b):
+        return to_number(a) == b
+    if isinstance(a, (list, dict)) and not isinstance(b, (list, dict)):
+        return loose_equals(to_primitive(a), b)
+    if isinstance(b, (list, dict)) and not isinstance(a, (list, dict)):
+        return loose_equals(a, to_primitive(b))
+    return False
+
+
+def less_than(a, b):
+    """JavaScript `<` operator."""
+    a = to_primitive(a)
+    b = to_primitive(b)
+    if isinstance(a, str) and isinstance(b, str):
+        return a < b
+    a = to_number(a)
+    b = to_number(b)
+    return a < b
+
+
+def less_equal(a, b):
+    """JavaScript `<=` operator."""
+    a = to_primitive(a)
+    b = to_primitive(b)
+    if isinstance(a, str) and isinstance(b, str):
+        return a <= b
+    a = to_number(a)
+    b = to_number(b)
+    return a <= b
+
+
+def add(a, b):
+    """JavaScript `+` operator."""
+    a = to_primitive(a)
+    b = to_primitive(b)
+    if isinstance(a, str) or isinstance(b, str):
+        return to_string(a) + to_string(b)
+    return to_number(a) + to_number(b)
+
+
+def divide(a, b):
+    """JavaScript `/` operator."""
+    a = to_number(a)
+    b = to_number(b)
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return NaN
+        return math.copysign(inf, a) * math.copysign(1, b)
+    return a / b
+
+
+def modulo(a, b):
+    """JavaScript `%` operator."""
+    a = to_number(a)
+    b = to_number(b)
+    if b == 0 or math.isinf(a) or math.isnan(a) or math.isnan(b):
+        return NaN
+    if math.isinf(b):
+        return a
+    result = math.fmod(a, b)
+    return int(result) if isinstance(a, int) and isinstance(b, int) else result
+
+
+def power(a, b):
+    """JavaScript `Math.pow` function."""
+    a = to_number(a)
+    b = to_number(b)
+    if math.isnan(b) or (abs(a) == 1 and math.isinf(b)):
+        return NaN
+    try:
+        return a ** b if isinstance(a, int) and isinstance(b, int) and b >= 0 else math.pow(a, b)
+    except OverflowError:
+        return inf
+    except (ValueError, ZeroDivisionError):
+        return inf if a == 0 else NaN
+
+
+def property_key(value):
+    """Convert a value to an object property key."""
+    return value if isinstance(value, str) else to_string(value)
+
+
+# JavaScript syntax that Python's `re` module does not support, or does not check the same way: unicode
+# property and control escapes, `\A` and `\Z` which are plain letters in JavaScript, and look-behinds
+# which may have a variable width in JavaScript
+unsupported_regexp_syntax = re.compile(r'\\[pPu]\{|\\c[a-zA-Z]|\\[AZ]|\(\?<[=!]')
+
+# Python-only groups, which are invalid in JavaScript: named groups and backreferences, comments,
+# conditionals, atomic groups and inline flags
+_python_only_groups = re.compile(r'\(\?(P|#|\(|>|[aiLmsux-]+[:)])')
+_counted_quantifier = re.compile(r'\{\d+(,\d*)?\}')
+
+
+def has_python_only_syntax(source):
+    """Return True if a regular expression uses Python-only groups or possessive quantifiers.
+
+    Escaped characters and the characters of `[...]` classes are literal, they are skipped.
+    """
+    idx = 0
+    in_class = False
+    while idx < len(source):
+        char = source[idx]
+        if char == '\\':
+            idx += 2
+            continue
+        if in_class or char == '[':
+            # Classes end at the first unescaped `]`, `[]` being the empty class in JavaScript
+            in_class = char != ']' if in_class else True
+            idx += 1
+            continue
+
+        if char == '(':
+            if _python_only_groups.match(source, idx) is not None:
+                return True
+            # The `?` of a group is not a quantifier
+            idx += 2 if source.startswith('(?', idx) else 1
+            continue
+
+        stop = None
+        if char in '*+?':
+            stop = idx + 1
+        elif char == '{':
+            counted = _counted_quantifier.match(source, idx)
+            stop = None if counted is None else counted.end()
+        if stop is None:
+            idx += 1
+            continue
+        if source.startswith('+', stop):
+            return True
+        # Lazy quantifiers
+        idx = stop + 1 if source.startswith('?', stop) else stop
+    return False
+
+
+_regexp_line_terminators = {'\n': '\\n', '\r': '\\r', '\u2028': '\\u2028', '\u2029': '\\u2029'}
+
+_regexp_flags = {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'g': 0, 'y': 0, 'u': 0}
+
+
+class RegExp(object):
+    """A JavaScript regular expression, compiled with Python's `re` module."""
+
+    __slots__ = ('source', 'flags', 'compiled')
+
+    def __init__(self, source, flags=''):
+        flags = flags or ''
+        if has_python_only_syntax(source):
+            raise ValueError('Invalid regular expression /{}/: Python-only syntax'.format(source))
+        python_flags = 0
+        for flag in flags:
+            if flag not in _regexp_flags or flags.count(flag) > 1:
+                raise ValueError('Invalid regular expression flags \'{}\''.format(flags))
+            python_flags |= _regexp_flags[flag]
+        if 'u' not in flags:
+            python_flags |= getattr(re, 'ASCII', 0)
+
+        # Named groups and backreferences do not have the same syntax, and `[^]` matches any character
+        pattern = re.sub(r'\(\?<(?![=!])', '(?P<', source)
+        pattern = re.sub(r'\\k<(\w+)>', r'(?P=\1)', pattern)
+        pattern = pattern.replace('[^]', '[\\s\\S]')
+        try:
+            self.compiled = re.compile(pattern, python_flags)
+        except re.error as e:
+            raise ValueError('Invalid regular expression /{}/: {}'.format(source, e))
+
+        self.source = source
+        self.flags = flags
+
+    @property
+    def literal(self):
+        """The regular expression literal, e.g. `/\\d+\\/\\d+/g`, escaping slashes the way JavaScript does."""
+        pieces = []
+        escaped = False
+        for char in self.source:
+            if char in _regexp_line_terminators:
+                pieces.append(_regexp_line_terminators[char])
+            elif char == '/' and not escaped:
+                pieces.append('\\/')
+            else:
+                pieces.append(char)
+            escaped = char == '\\' and not escaped
+        return '/{}/{}'.format(''.join(pieces) or '(?:)', self.flags)
+
+    @property
+    def is_global(self):
+        return 'g' in self.flags
+
+    def test(self, string):
+        return self.compiled.search(to_string(string)) is not None
@@ -1,22 +1,89 @@
 """Python to VegaExpression transpiler."""
 
 import ast
+import copy
 import sys
+import threading
 
 import inspect
 import types
 
+from .analysis import order_operands
 from .constants import constants
+from .cost import Budget
+from .expression import (
+    Array, Binary, Call, Conditional, Expression, Identifier, Index, Literal, Logical, Member, Object,
+    Parameter, Unary, emit
+)
+from .folding import fold_call, fold_date_operand, resolve_timezone
 from .functions import vega_functions
+from .inference import TypeInference, lower_builtin
+from .interning import InternTable
+from .javascript import RegExp, has_python_only_syntax, number_to_string, unsupported_regexp_syntax
+from .simplify import simplify
+from .sourcemap import emit_with_source_map
+
+# From this number of elements, `in` tests against literal lists are turned into constant object lookups
+membership_lookup_threshold = 16
+
+# Read-only registry of the available Vega functions, shared by every translation
+vega_function_names = frozenset(vega_functions)
+
+# Those nodes do not exist anymore in recent Python versions, or not yet in older ones
+_Index = getattr(ast, 'Index', ())
+_ExtSlice = getattr(ast, 'ExtSlice', ())
+_Constant = getattr(ast, 'Constant', ())
+
+_no_value = object()
 
 
 class Variable():
     """Helper class for defining a variable in whitelisting."""
 
-    def __init__(self, name, members):
-        """Construct a Variable, given its name and available members."""
+    def __init__(self, name, members=(), type=None, range=None, values=None):
+        """Construct a Variable, given its name, available members and optionally its type and domain.
+
+        The type is one of 'number', 'string', 'boolean', 'array', 'object' or 'date', a trailing `?`
+        meaning that the value may be null (e.g. 'number?'). It lets the translator drop coercions.
+
+        The domain is either a `range` of numbers, a (minimum, maximum) tuple of the bounds included, the
+        value being a number which is never NaN, or the list of the `values` the variable takes, e.g.
+        categories, None being in the list if it may be null. Conditions that the domains always satisfy
+        or never satisfy are then simplified at translation time.
+        """
         self.name = name
         self.members = members
+        self.type = type
+        self.range = range
+        self.values = values
+
+    def has_domain(self):
+        """Return True if the variable or one of its members declares a domain."""
+        return self.range is not None or self.values is not None or \
+            any(isinstance(member, Variable) and member.has_domain() for member in self.members)
+
+
+class Whitelist(object):
+    """Read-only index of a variable whitelist.
+
+    The index is built once and shared by every translation using it, it is never mutated afterwards.
+    """
+
+    __slots__ = ('entries', 'names', 'ordered_names', 'variables', 'domains')
+
+    def __init__(self, whitelist):
+        """Construct a Whitelist index, given a list of names and `Variable` instances."""
+        self.entries = tuple(whitelist)
+        self.ordered_names = tuple(elt.name if isinstance(elt, Variable) else elt for elt in self.entries)
+        self.names = frozenset(self.ordered_names)
+        self.variables = dict((elt.name, elt) for elt in self.entries if isinstance(elt, Variable))
+        self.domains = any(variable.has_domain() for variable in self.variables.values())
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
 
 
 operator_mapping = {
@@ -29,14 +96,17 @@ operator_mapping = {
     ast.Mod: '%'
 }
 
+# Operators converting their operands to numbers, `+` concatenating dates as strings
+numeric_operators = frozenset(['-', '*', '/', '%', '<', '<=', '>', '>='])
+
 # Note that built-in functions like `abs`, `min`, `max` which already have an equivalent in
 # Vega expressions are already supported automatically
 builtin_function_mapping = {
-    'bool': '(isValid({args}) ? toBoolean({args}) : false)',
-    'float': 'toNumber({args})',
-    'int': 'floor(toNumber({args}))',
-    'len': 'length({args})',
-    'str': 'toString({args})'
+    'bool': lambda args: Conditional(Call('isValid', args), Call('toBoolean', args), Literal(False), parens=True),
+    'float': lambda args: Call('toNumber', args),
+    'int': lambda args: Call('floor', [Call('toNumber', args)]),
+    'len': lambda args: Call('length', args),
+    'str': lambda args: Call('toString', args)
 }
 
 
@@ -75,6 +145,68 @@ def validate(nodes, origin_node):
                 origin_node.__class__.__name__, nodes[-1].__class__.__name__))
 
 
+def _literal_value(node):
+    """Return the value of a string or number literal node, or `_no_value` if the node is not such a literal."""
+    if isinstance(node, _Constant):
+        value = node.value
+    elif isinstance(node, ast.Num):
+        value = node.n
+    elif isinstance(node, ast.Str):
+        value = node.s
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        # A negative zero would not be emitted as `-0`
+        value = _literal_value(node.operand)
+        if isinstance(value, str) or value is _no_value or value == 0:
+            return _no_value
+        return -value
+    else:
+        return _no_value
+
+    if value.__class__ not in (str, int, float):
+        return _no_value
+    return value
+
+
+def literal_values(nodes):
+    """Return the values of a sequence of literal nodes if they are all strings or all numbers, None otherwise.
+
+    Those homogeneous containers of literals are emitted directly from their values, instead of visiting their elements.
+    """
+    values = []
+    for node in nodes:
+        value = _literal_value(node)
+        if value is _no_value:
+            return None
+        values.append(value)
+
+    if values and isinstance(values[0], str):
+        homogeneous = all(value.__class__ is str for value in values)
+    else:
+        homogeneous = all(value.__class__ is not str for value in values)
+    return values if homogeneous else None
+
+
+def regexp_literal(args):
+    """Return the regular expression literal built by a `regexp` call with constant arguments, or None.
+
+    The pattern is validated at translation time, and the literal saves Vega from constructing the
+    regular expression again each time the expression is evaluated.
+    """
+    if not 1 <= len(args) <= 2 or not all(isinstance(arg, Literal) for arg in args):
+        return None
+    values = [arg.value for arg in args]
+    if not isinstance(values[0], str) or (len(values) == 2 and not isinstance(values[1], str)):
+        return None
+
+    # Patterns which Python cannot check the way JavaScript does are left to Vega, Python-only syntax is rejected
+    if unsupported_regexp_syntax.search(values[0]) is not None and not has_python_only_syntax(values[0]):
+        return None
+    try:
+        return Literal(RegExp(*values))
+    except ValueError as e:
+        raise Py2VegaSyntaxError(str(e))
+
+
 def valid_attribute_impl(node, var):
     """Check the attribute access validity. Returns True if the member access is valid, False otherwise."""
     if node.value.id == var.name and node.attr in var.members:
@@ -120,9 +252,43 @@ def valid_attribute(node, whitelist):
 class VegaExpressionVisitor(ast.NodeVisitor):
     """Visitor that turns a Node into a Vega expression."""
 
-    def __init__(self, whitelist, scope={}):
-        self.whitelist = whitelist
-        self.scope = scope
+    def __init__(self, whitelist, scope=None, budget=None, parameters=(), lookup_threshold=membership_lookup_threshold,
+                 timezone=None, interned=None):
+        self.whitelist = whitelist if isinstance(whitelist, Whitelist) else Whitelist(whitelist)
+        self.scope = {} if scope is None else scope
+        self.budget = budget
+        self.parameters = parameters
+        self.lookup_threshold = lookup_threshold
+        self.timezone = resolve_timezone(timezone)
+        self.types = TypeInference(self.whitelist)
+        self.line_offset = 0
+        self.interned = interned
+
+    def _fork(self, scope):
+        """Create a visitor sharing this visitor's translation state but using a different scope."""
+        visitor = copy.copy(self)
+        visitor.scope = scope
+        return visitor
+
+    def visit(self, node):
+        """Visit a node, checking the translated expression against the budget if there is one."""
+        if self.interned is not None and isinstance(node, ast.expr):
+            key = self.interned.key(node, self.scope, self.parameters)
+            expr = self.interned.get(key)
+            if expr is None:
+                expr = super(VegaExpressionVisitor, self).visit(node)
+                self.interned.add(key, expr, self.scope)
+        else:
+            expr = super(VegaExpressionVisitor, self).visit(node)
+
+        # Nodes coming from the scope keep the location of the assignment they were translated from
+        if expr.location is None and hasattr(node, 'lineno'):
+            expr.location = (node.lineno + self.line_offset, node.col_offset)
+
+        if self.budget is not None:
+            self.budget.check(expr)
+
+        return expr
 
     def generic_visit(self, node):
         """Throwing an error by default."""
@@ -138,41 +304,48 @@ class VegaExpressionVisitor(ast.NodeVisitor):
         body_scope = self.scope.copy()
         validate(node.body, node)
         for stmt in node.body[:-1]:
-            VegaExpressionVisitor(self.whitelist, body_scope).visit(stmt)
+            self._fork(body_scope).visit(stmt)
 
         # Visiting orelse
         orelse_scope = self.scope.copy()
         validate(node.orelse, node)
         for stmt in node.orelse[:-1]:
-            VegaExpressionVisitor(self.whitelist, orelse_scope).visit(stmt)
+            self._fork(orelse_scope).visit(stmt)
 
-        return 'if({}, {}, {})'.format(
+        return Conditional(
             self.visit(node.test),
-            VegaExpressionVisitor(self.whitelist, body_scope).visit(node.body[-1]),
-            VegaExpressionVisitor(self.whitelist, orelse_scope).visit(node.orelse[-1])
+            self._fork(body_scope).visit(node.body[-1]),
+            self._fork(orelse_scope).visit(node.orelse[-1]),
+            function=True
         )
 
+    def visit_Constant(self, node):
+        """Turn a Python constant expression into a Vega-expression."""
+        if node.value is None or isinstance(node.value, (bool, int, float, str)):
+            return Literal(node.value)
+        raise Py2VegaSyntaxError('Unsupported {} constant'.format(node.value.__class__.__name__))
+
     def visit_NameConstant(self, node):
         """Turn a Python nameconstant expression into a Vega-expression."""
-        if node.value is False:
-            return 'false'
-        if node.value is True:
-            return 'true'
-        if node.value is None:
-            return 'null'
+        if node.value in (False, True, None):
+            return Literal(node.value)
         raise Py2VegaNameError('name \'{}\' is not defined'.format(str(node.value)))
 
     def visit_Num(self, node):
         """Turn a Python num expression into a Vega-expression."""
-        return repr(node.n)
+        return Literal(node.n)
 
     def visit_Str(self, node):
         """Turn a Python str expression into a Vega-expression."""
-        return repr(node.s)
+        return Literal(node.s)
 
     def _visit_list_impl(self, node):
         """Turn a Python list expression into a Vega-expression."""
-        return '[{}]'.format(', '.join(self.visit(elt) for elt in node.elts))
+        values = literal_values(node.elts)
+        if values is not None:
+            return Literal(values)
+
+        return Array([self.visit(elt) for elt in node.elts])
 
     def visit_Tuple(self, node):
         """Turn a Python tuple expression into a Vega-expression."""
@@ -184,12 +357,18 @@ class VegaExpressionVisitor(ast.NodeVisitor):
 
     def visit_Dict(self, node):
         """Turn a Python dict expression into a Vega-expression."""
-        return '{{{}}}'.format(
-            ', '.join([
-                '{}: {}'.format(self.visit(node.keys[idx]), self.visit(node.values[idx]))
-                for idx in range(len(node.keys))
-            ])
-        )
+        keys = literal_values(node.keys)
+        values = literal_values(node.values) if keys is not None else None
+        if values is not None:
+            table = dict(zip(keys, values))
+            # Duplicated keys would be dropped from the emitted object
+            if len(table) == len(keys):
+                return Literal(table)
+
+        return Object([
+            (self.visit(node.keys[idx]), self.visit(node.values[idx]))
+            for idx in range(len(node.keys))
+        ])
 
     def visit_Assign(self, node):
         """Turn a Python assignment expression into a Vega-expression. And save the assigned variable in the current scope."""
@@ -202,55 +381,94 @@ class VegaExpressionVisitor(ast.NodeVisitor):
             self.scope[target.id] = value
 
         # Assignment in Python returns None
-        return 'null'
+        return Literal(None)
 
     def visit_UnaryOp(self, node):
         """Turn a Python unaryop expression into a Vega-expression."""
         if isinstance(node.op, ast.Not):
-            return '!({})'.format(self.visit(node.operand))
+            return Unary('!', self.visit(node.operand))
         if isinstance(node.op, ast.USub):
-            return '-{}'.format(self.visit(node.operand))
+            return Unary('-', fold_date_operand(self.visit(node.operand), self.timezone))
         if isinstance(node.op, ast.UAdd):
-            return '+{}'.format(self.visit(node.operand))
+            return Unary('+', fold_date_operand(self.visit(node.operand), self.timezone))
 
         raise Py2VegaSyntaxError('Unsupported {} operator'.format(node.op.__class__.__name__))
 
     def visit_BoolOp(self, node):
         """Turn a Python boolop expression into a Vega-expression."""
-        return '({} {} {})'.format(
-            self.visit(node.values[0]),
-            '||' if isinstance(node.op, ast.Or) else '&&',
-            self.visit(node.values[1])
-        )
-
-    def _visit_binop_impl(self, left_node, op, right_node):
-        left = left_node if isinstance(left_node, str) else self.visit(left_node)
-        right = self.visit(right_node)
+        operator = '||' if isinstance(node.op, ast.Or) else '&&'
+
+        # Nested chains of the same operator are flattened, e.g. `a and (b and c)`
+        operands = []
+        for value in node.values:
+            operand = self.visit(value)
+            if isinstance(operand, Logical) and operand.operator == operator:
+                operands.extend(operand.operands)
+            else:
+                operands.append(operand)
+
+        return Logical(operator, order_operands(operands), parens=True)
+
+    def _lower_membership(self, value, container, negate, parens):
+        """Turn a Python `in` or `not in` test into a Vega-expression.
+
+        Tests against large literal lists of strings or numbers are turned into a lookup in a constant
+        object, e.g. `(isString(value) && {'a': 1, 'b': 1}[value] === 1)`, instead of a linear search.
+        As object keys are strings, the type check keeps numbers and strings apart like `indexof` does.
+        """
+        if self.lookup_threshold is not None and isinstance(container, Literal) and \
+                isinstance(container.value, list) and len(container.value) >= self.lookup_threshold:
+            if isinstance(container.value[0], str):
+                check = 'isString'
+                keys = container.value
+            else:
+                check = 'isNumber'
+                keys = [number_to_string(key) for key in container.value]
+
+            # Setting `__proto__` in an object literal does not create a key
+            if '__proto__' not in keys:
+                table = Literal(dict((key, 1) for key in keys))
+                lookup = [Call(check, [value]), Binary('===', Index(table, value), Literal(1))]
+                if negate:
+                    return Unary('!', Logical('&&', lookup), parens=parens)
+                return Logical('&&', lookup, parens=parens)
+
+        return Binary('==' if negate else '!=', Call('indexof', [container, value]), Literal(-1), parens=parens)
+
+    def _visit_binop_impl(self, left_node, op, right_node, parens=False):
+        left = left_node if isinstance(left_node, Expression) else self.visit(left_node)
+        if isinstance(right_node, ast.Set) and isinstance(op, (ast.In, ast.NotIn)):
+            right = self._visit_list_impl(right_node)
+        else:
+            right = self.visit(right_node)
+
+        if isinstance(op, (ast.In, ast.NotIn)):
+            return self._lower_membership(left, right, isinstance(op, ast.NotIn), parens)
+        operator = operator_mapping.get(op.__class__)
+        # Dates are converted to their timestamp by arithmetic and ordering, constant ones are then folded
+        if operator in numeric_operators or isinstance(op, ast.Pow):
+            left = fold_date_operand(left, self.timezone)
+            right = fold_date_operand(right, self.timezone)
 
-        if isinstance(op, ast.In):
-            return 'indexof({}, {}) != -1'.format(right, left)
-        if isinstance(op, ast.NotIn):
-            return 'indexof({}, {}) == -1'.format(right, left)
         if isinstance(op, ast.Pow):
-            return 'pow({}, {})'.format(left, right)
-
-        operator = operator_mapping.get(op.__class__)
+            return Call('pow', [left, right], parens=parens)
 
         if operator is None:
             raise Py2VegaSyntaxError('Unsupported {} operator'.format(op.__class__.__name__))
 
-        return '{} {} {}'.format(left, operator, right)
+        return Binary(operator, left, right, parens=parens)
 
     def visit_BinOp(self, node):
         """Turn a Python binop expression into a Vega-expression."""
-        return '({})'.format(self._visit_binop_impl(node.left, node.op, node.right))
+        return self._visit_binop_impl(node.left, node.op, node.right, parens=True)
 
     def visit_IfExp(self, node):
         """Turn a Python if expression into a Vega-expression."""
-        return '({} ? {} : {})'.format(
+        return Conditional(
             self.visit(node.test),
             self.visit(node.body),
-            self.visit(node.orelse)
+            self.visit(node.orelse),
+            parens=True
         )
 
     def visit_Compare(self, node):
@@ -258,29 +476,33 @@ class VegaExpressionVisitor(ast.NodeVisitor):
         left_operand = node.left
 
         for idx in range(len(node.comparators)):
-            left_operand = self._visit_binop_impl(left_operand, node.ops[idx], node.comparators[idx])
+            left_operand = self._visit_binop_impl(
+                left_operand, node.ops[idx], node.comparators[idx], parens=idx == len(node.comparators) - 1)
 
-        return '({})'.format(left_operand)
+        return left_operand
 
     def visit_Name(self, node):
         """Turn a Python name expression into a Vega-expression."""
         if sys.version_info[0] == 2:
             if node.id == 'False':
-                return 'false'
+                return Literal(False)
             if node.id == 'True':
-                return 'true'
+                return Literal(True)
             if node.id == 'None':
-                return 'null'
+                return Literal(None)
 
         # If it's in the scope, return it's evaluated expression
         if node.id in self.scope:
             return self.scope[node.id]
 
-        whitelisted_vars = [elt.name if isinstance(elt, Variable) else elt for elt in self.whitelist]
-        if node.id in constants or node.id in whitelisted_vars:
-            return node.id
+        if node.id in self.parameters:
+            return Parameter(node.id)
+
+        if node.id in constants or node.id in self.whitelist.names:
+            return Identifier(node.id)
 
-        raise Py2VegaNameError('name \'{}\' is not defined, available variables are {}'.format(node.id, whitelisted_vars))
+        raise Py2VegaNameError('name \'{}\' is not defined, available variables are {}'.format(
+            node.id, list(self.whitelist.ordered_names)))
 
     def visit_Call(self, node):
         """Turn a Python call expression into a Vega-expression."""
@@ -290,13 +512,24 @@ class VegaExpressionVisitor(ast.NodeVisitor):
         if isinstance(node.func, ast.Attribute):
             func_name = node.func.attr
 
-        args = ', '.join([self.visit(arg) for arg in node.args])
+        args = [self.visit(arg) for arg in node.args]
 
         if func_name in builtin_function_mapping:
-            return builtin_function_mapping[func_name].format(args=args)
-
-        if func_name in vega_functions:
-            return '{func_name}({args})'.format(func_name=func_name, args=args)
+            lowered = lower_builtin(func_name, args, self.types)
+            if lowered is not None:
+                return lowered
+            return builtin_function_mapping[func_name](args)
+
+        if func_name == 'regexp':
+            literal = regexp_literal(args)
+            if literal is not None:
+                return literal
+
+        if func_name in vega_function_names:
+            folded = fold_call(func_name, args, self.timezone)
+            if folded is not None:
+                return folded
+            return Call(func_name, args)
 
         raise Py2VegaNameError('name \'{}\' is not defined'.format(func_name))
 
@@ -304,53 +537,165 @@ class VegaExpressionVisitor(ast.NodeVisitor):
         """Turn a Python Subscript node into a Vega-expression."""
         value = self.visit(node.value)
 
-        if isinstance(node.slice, ast.Index):
-            return '{value}[{index}]'.format(
-                value=value,
-                index=self.visit(node.slice.value)
-            )
+        # Python 3.9 dropped the `Index` wrapper, the slice is then directly the index expression
+        slice_node = node.slice.value if isinstance(node.slice, _Index) else node.slice
 
-        if isinstance(node.slice, ast.Slice):
-            if node.slice.step is not None:
-                raise Py2VegaSyntaxError('Unsupported step for {} node'.format(node.slice.__class__.__name__))
+        if isinstance(slice_node, ast.Slice):
+            if slice_node.step is not None:
+                raise Py2VegaSyntaxError('Unsupported step for {} node'.format(slice_node.__class__.__name__))
 
-            args = [value, '0' if node.slice.lower is None else self.visit(node.slice.lower)]
-            if node.slice.upper is not None:
-                args += self.visit(node.slice.upper)
+            args = [value, Literal(0) if slice_node.lower is None else self.visit(slice_node.lower)]
+            if slice_node.upper is not None:
+                args.append(self.visit(slice_node.upper))
 
-            return 'slice({args})'.format(args=', '.join(args))
+            return Call('slice', args)
 
-        raise Py2VegaSyntaxError('Unsupported {} node'.format(node.slice.__class__.__name__))
+        if isinstance(slice_node, _ExtSlice):
+            raise Py2VegaSyntaxError('Unsupported {} node'.format(slice_node.__class__.__name__))
+
+        return Index(value, self.visit(slice_node))
 
     def visit_Attribute(self, node):
         """Turn a Python attribute expression into a Vega-expression."""
         value = self.visit(node.value)
 
         if not valid_attribute(node, self.whitelist):
-            raise Py2VegaSyntaxError('Cannot access `{}` member from `{}`'.format(node.attr, value))
-
-        return '{}.{}'.format(value, node.attr)
+            raise Py2VegaSyntaxError('Cannot access `{}` member from `{}`'.format(node.attr, emit(value)))
 
+        return Member(value, node.attr)
 
-def py2vega(value, whitelist=[]):
-    """Convert Python code or Python function to a valid Vega expression."""
-    if isinstance(value, str):
-        parsed = ast.parse(value, '<string>', 'eval')
 
-        return VegaExpressionVisitor(whitelist).visit(parsed.body)
+class Translator(object):
+    """Reusable Python to Vega-expression translator.
 
-    if isinstance(value, (types.FunctionType, types.MethodType)):
-        if getattr(value, '__name__', '') in ('', '<lambda>'):
-            raise RuntimeError('Anonymous functions not supported')
-
-        value = inspect.getsource(value)
-
-        func = ast.parse(value, '<string>', 'exec').body[0]
-
-        scope = {}
-        validate(func.body, func)
-        for node in func.body[:-1]:
-            VegaExpressionVisitor(whitelist, scope).visit(node)
-        return VegaExpressionVisitor(whitelist, scope).visit(func.body[-1])
+    The whitelist index and the cache of parsed functions are shared by all the translations
+    and never mutated by them, each translation works on its own scope. A single translator
+    can then safely be used concurrently from multiple threads.
+    """
 
-    raise RuntimeError('py2vega only supports a code string or function as input')
+    def __init__(self, whitelist=[], lookup_threshold=membership_lookup_threshold, timezone=None):
+        """Construct a Translator, given a variable whitelist.
+
+        `in` tests against literal lists of at least `lookup_threshold` elements are turned into constant
+        object lookups, None disables it. Local time functions with constant arguments are computed in the
+        given `timezone`, a tzinfo instance or an IANA name like 'Europe/Paris', only if there is one. So
+        are constant `datetime` dates where they are converted to timestamps, e.g. compared, the calls
+        being kept elsewhere as they return Date objects.
+        """
+        self.whitelist = Whitelist(whitelist)
+        self.lookup_threshold = lookup_threshold
+        self.timezone = resolve_timezone(timezone)
+        self._functions = {}
+        self._lock = threading.Lock()
+
+    def parse_function(self, func):
+        """Return the `FunctionDef` node of a function, parsing its source only once.
+
+        Functions are translated from this node, parsing them beforehand moves the parsing cost out of
+        their first translation.
+        """
+        code = func.__code__
+
+        with self._lock:
+            parsed = self._functions.get(code)
+
+        if parsed is None:
+            parsed = ast.parse(inspect.getsource(func), '<string>', 'exec').body[0]
+
+            with self._lock:
+                parsed = self._functions.setdefault(code, parsed)
+
+        return parsed
+
+    def translate_expression(self, value, budget=None, parameters=(), interned=None):
+        """Convert Python code or Python function to a translated expression tree.
+
+        If a `Budget` is given, the translation fails as soon as the expression exceeds it. The given
+        `parameters` names are translated to `Parameter` nodes. If an `InternTable` is given, subtrees
+        already translated with it are not translated again, their expression nodes are shared instead.
+        If the whitelist declares domains, the expression is simplified using them.
+        """
+        visitor = VegaExpressionVisitor(
+            self.whitelist, budget=budget, parameters=parameters, lookup_threshold=self.lookup_threshold,
+            timezone=self.timezone, interned=interned)
+
+        visitor, node = self.prepare(value, visitor)
+        expr = visitor.visit(node)
+        if self.whitelist.domains:
+            expr = simplify(expr, visitor.types)
+        return expr
+
+    def prepare(self, value, visitor):
+        """Return the node of Python code or of a Python function whose translation is the expression.
+
+        The assignments preceding the last statement of a function are visited first, the returned
+        visitor then has them in its scope and is the one to visit the node with.
+        """
+        if isinstance(value, str):
+            parsed = ast.parse(value, '<string>', 'eval')
+
+            return visitor, parsed.body
+
+        if isinstance(value, (types.FunctionType, types.MethodType)):
+            if getattr(value, '__name__', '') in ('', '<lambda>'):
+                raise RuntimeError('Anonymous functions not supported')
+
+            func = self.parse_function(value)
+            # Locations are given as lines of the file the function is defined in
+            visitor.line_offset = value.__code__.co_firstlineno - 1
+
+            scope = {}
+            validate(func.body, func)
+            for node in func.body[:-1]:
+                visitor._fork(scope).visit(node)
+            return visitor._fork(scope), func.body[-1]
+
+        raise RuntimeError('py2vega only supports a code string or function as input')
+
+    def translate(self, value, max_cost=None, max_length=None, source_map=False):
+        """Convert Python code or Python function to a valid Vega expression.
+
+        A `Py2VegaBudgetError` is raised if the estimated cost of the expression exceeds `max_cost`, or if
+        its length exceeds `max_length` characters. If `source_map` is True, a tuple of the expression and
+        of its `SourceMap` is returned.
+        """
+        budget = None
+        if max_cost is not None or max_length is not None:
+            budget = Budget(max_cost=max_cost, max_length=max_length)
+
+        expr = self.translate_expression(value, budget)
+        if source_map:
+            return emit_with_source_map(expr)
+        return emit(expr)
+
+    def translate_batch(self, values, max_cost=None, max_length=None):
+        """Convert a list of Python code or Python functions to a list of valid Vega expressions.
+
+        Subtrees shared by the values, like the same guard conditions or the same `scale` calls, are
+        translated once. `max_cost` and `max_length` apply to each expression like in `translate`.
+        """
+        interned = InternTable()
+        # Values translated to the same expression share the same string
+        emitted = {}
+        results = []
+        for value in values:
+            budget = None
+            if max_cost is not None or max_length is not None:
+                budget = Budget(max_cost=max_cost, max_length=max_length)
+            expr = self.translate_expression(value, budget, interned=interned)
+            if id(expr) not in emitted:
+                emitted[id(expr)] = (expr, emit(expr))
+            results.append(emitted[id(expr)][1])
+        return results
+
+
+def py2vega(value, whitelist=[], max_cost=None, max_length=None, timezone=None, source_map=False):
+    """Convert Python code or Python function to a valid Vega expression.
+
+    A `Py2VegaBudgetError` is raised if the estimated cost of the expression exceeds `max_cost`, or if
+    its length exceeds `max_length` characters. Constant dates are computed in the given `timezone`.
+    If `source_map` is True, a tuple of the expression and of its `SourceMap` is returned, mapping
+    spans of the expression to the lines and columns of the Python code they were translated from.
+    """
+    return Translator(whitelist, timezone=timezone).translate(
+        value, max_cost=max_cost, max_length=max_length, source_map=source_map)
@@ -0,0 +1,455 @@
+"""Native evaluation of translated Vega expressions over number and boolean columns, using numba.
+
+Expressions are turned into the source of a typed scalar kernel, which numba compiles to a parallel
+ufunc. Kernels are written to a cache directory, named after the hash of their source, and numba
+caches their compiled code next to them, so that a kernel is only compiled once across runs.
+"""
+
+import hashlib
+import importlib.util
+import math
+import os
+import sys
+
+from .expression import Binary, Call, Conditional, Identifier, Literal, Logical, Member, Unary
+from .fused import FusedEvaluator, FusedUnsupportedError, _constants
+
+try:
+    import numba
+except ImportError:  # numba is optional
+    numba = None
+
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'py2vega', 'kernels')
+
+_number = 'number'
+_boolean = 'boolean'
+
+# Helpers implementing the JavaScript semantics that Python's operators and `math` functions do not have.
+# They are jitted along with the kernel, and neither raise under numba nor in Python.
+_kernel_helpers = '''
+import math
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+nan = float('nan')
+inf = float('inf')
+
+
+def jit(func):
+    return func if numba is None else numba.njit(cache=True)(func)
+
+
+@jit
+def truthy(x):
+    return x != 0.0 and x == x
+
+
+@jit
+def js_div(a, b):
+    if b == 0.0:
+        if a == 0.0 or a != a:
+            return nan
+        return math.copysign(inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+@jit
+def js_mod(a, b):
+    if b == 0.0 or a != a or b != b or math.isinf(a):
+        return nan
+    if math.isinf(b):
+        return a
+    # The remainder of positive numbers is exact, and has the sign of the dividend in JavaScript
+    return math.copysign(abs(a) % abs(b), a)
+
+
+@jit
+def is_odd_integer(x):
+    return not math.isinf(x) and abs(x) % 2.0 == 1.0
+
+
+@jit
+def js_pow(a, b):
+    if b != b:
+        return nan
+    if b == 0.0:
+        return 1.0
+    if a != a:
+        return nan
+    if math.isinf(b):
+        if abs(a) == 1.0:
+            return nan
+        return inf if (abs(a) > 1.0) == (b > 0.0) else 0.0
+    if a == 0.0 or math.isinf(a):
+        negative = math.copysign(1.0, a) < 0.0 and is_odd_integer(b)
+        result = inf if (a == 0.0) == (b < 0.0) else 0.0
+        return -result if negative else result
+    if a < 0.0 and math.floor(b) != b:
+        return nan
+    try:
+        return math.pow(a, b)
+    except Exception:
+        return -inf if a < 0.0 and is_odd_integer(b) else inf
+
+
+@jit
+def js_floor(x):
+    return x if x != x or math.isinf(x) else float(math.floor(x))
+
+
+@jit
+def js_ceil(x):
+    return x if x != x or math.isinf(x) else float(math.ceil(x))
+
+
+@jit
+def js_round(x):
+    return js_floor(x + 0.5)
+
+
+@jit
+def js_sqrt(x):
+    return nan if x < 0.0 else math.sqrt(x)
+
+
+@jit
+def js_exp(x):
+    if x != x:
+        return nan
+    if x > 709.0:
+        try:
+            return math.exp(x)
+        except Exception:
+            return inf
+    return math.exp(x)
+
+
+@jit
+def js_log(x):
+    if x == 0.0:
+        return -inf
+    if x < 0.0 or x != x:
+        return nan
+    return math.log(x)
+
+
+@jit
+def js_trigonometric(x):
+    return nan if math.isinf(x) else x
+
+
+@jit
+def js_inverse_trigonometric(x):
+    return nan if x < -1.0 or x > 1.0 else x
+
+
+@jit
+def js_min(a, b):
+    return nan if a != a or b != b else min(a, b)
+
+
+@jit
+def js_max(a, b):
+    return nan if a != a or b != b else max(a, b)
+'''
+
+_arithmetic = {'+': '({} + {})', '-': '({} - {})', '*': '({} * {})', '/': 'js_div({}, {})', '%': 'js_mod({}, {})'}
+_comparisons = {'<': '<', '<=': '<=', '>': '>', '>=': '>=', '==': '==', '!=': '!=', '===': '==', '!==': '!='}
+_unary_functions = {
+    'abs': 'abs({})', 'ceil': 'js_ceil({})', 'floor': 'js_floor({})', 'round': 'js_round({})', 'sqrt': 'js_sqrt({})',
+    'exp': 'js_exp({})', 'log': 'js_log({})', 'sin': 'math.sin(js_trigonometric({}))',
+    'cos': 'math.cos(js_trigonometric({}))', 'tan': 'math.tan(js_trigonometric({}))',
+    'asin': 'math.asin(js_inverse_trigonometric({}))', 'acos': 'math.acos(js_inverse_trigonometric({}))',
+    'atan': 'math.atan({})',
+}
+
+
+class _KernelWriter(object):
+    """Write the statements of a scalar kernel, one local variable per distinct node of the expression.
+
+    Numbers and booleans never throw, both branches of conditions are then computed.
+    """
+
+    def __init__(self, field_kinds, variable_kinds, datum):
+        self.field_kinds = field_kinds
+        self.variable_kinds = variable_kinds
+        self.datum = datum
+        self.fields = set()
+        self.variables = set()
+        self.lines = []
+        self._memo = {}
+
+    def write(self, expr):
+        """Return the kind of an expression, and the local variable or literal holding its value."""
+        memo = self._memo.get(id(expr))
+        if memo is not None:
+            return memo[1]
+
+        kind, code = self._write(expr)
+        if not isinstance(expr, (Literal, Identifier, Member)):
+            name = 'v{}'.format(len(self._memo))
+            self.lines.append('    {} = {}'.format(name, code))
+            code = name
+
+        self._memo[id(expr)] = (expr, (kind, code))
+        return kind, code
+
+    def _number(self, expr):
+        kind, code = self.write(expr)
+        return code if kind == _number else '(1.0 if {} else 0.0)'.format(code)
+
+    def _truthy(self, expr):
+        kind, code = self.write(expr)
+        return code if kind == _boolean else 'truthy({})'.format(code)
+
+    def _write(self, expr):
+        if isinstance(expr, Literal):
+            if isinstance(expr.value, bool):
+                return _boolean, repr(expr.value)
+            if isinstance(expr.value, (int, float)):
+                return _number, _float_literal(expr.value)
+            raise FusedUnsupportedError('Only number and boolean literals are supported')
+
+        if isinstance(expr, Identifier):
+            if expr.name in _constants:
+                return _number, _float_literal(_constants[expr.name])
+            if expr.name not in self.variable_kinds:
+                raise FusedUnsupportedError('The `{}` variable must be given as a number or a boolean'.format(expr.name))
+            self.variables.add(expr.name)
+            return self.variable_kinds[expr.name], 'variable_' + expr.name
+
+        if isinstance(expr, Member) and isinstance(expr.object, Identifier) and expr.object.name == self.datum:
+            if expr.property not in self.field_kinds:
+                raise FusedUnsupportedError('No column for the `{}` field'.format(expr.property))
+            self.fields.add(expr.property)
+            # Arguments are prefixed, so that they never clash with each other or with the helpers
+            return self.field_kinds[expr.property], 'datum_' + expr.property
+
+        if isinstance(expr, Unary):
+            if expr.operator == '!':
+                return _boolean, '(not {})'.format(self._truthy(expr.argument))
+            if expr.operator == '-':
+                return _number, '(-{})'.format(self._number(expr.argument))
+            return _number, self._number(expr.argument)
+
+        if isinstance(expr, Binary):
+            return self._write_binary(expr)
+
+        if isinstance(expr, Logical):
+            kinds = set(self.write(operand)[0] for operand in expr.operands)
+            if len(kinds) > 1:
+                raise FusedUnsupportedError('Operands of `{}` must all be numbers or all be booleans'.format(expr.operator))
+            codes = [self.write(operand)[1] for operand in expr.operands]
+            truthy = [self._truthy(operand) for operand in expr.operands]
+            # `a && b` is `b` if `a` is truthy, `a` otherwise
+            code = codes[-1]
+            for operand, test in reversed(list(zip(codes[:-1], truthy[:-1]))):
+                if expr.operator == '&&':
+                    code = '({} if {} else {})'.format(code, test, operand)
+                else:
+                    code = '({} if {} else {})'.format(operand, test, code)
+            return kinds.pop(), code
+
+        if isinstance(expr, Conditional):
+            kind, consequent = self.write(expr.consequent)
+            alternate_kind, alternate = self.write(expr.alternate)
+            if kind != alternate_kind:
+                raise FusedUnsupportedError('Both branches of a condition must be numbers or booleans')
+            return kind, '({} if {} else {})'.format(consequent, self._truthy(expr.test), alternate)
+
+        if isinstance(expr, Call):
+            return self._write_call(expr)
+
+        raise FusedUnsupportedError('Unsupported {} node'.format(expr.__class__.__name__))
+
+    def _write_binary(self, expr):
+        if expr.operator in _arithmetic:
+            return _number, _arithmetic[expr.operator].format(self._number(expr.left), self._number(expr.right))
+
+        if expr.operator in _comparisons:
+            left_kind, left = self.write(expr.left)
+            right_kind, right = self.write(expr.right)
+            if left_kind != right_kind:
+                if expr.operator in ('===', '!=='):
+                    # A number is never strictly equal to a boolean
+                    return _boolean, repr(expr.operator == '!==')
+                left = self._number(expr.left)
+                right = self._number(expr.right)
+            return _boolean, '({} {} {})'.format(left, _comparisons[expr.operator], right)
+
+        raise FusedUnsupportedError('Unsupported {} operator'.format(expr.operator))
+
+    def _write_call(self, expr):
+        name = expr.callee
+        args = expr.arguments
+
+        if name in _unary_functions and len(args) == 1:
+            return _number, _unary_functions[name].format(self._number(args[0]))
+        if name == 'pow' and len(args) == 2:
+            return _number, 'js_pow({}, {})'.format(self._number(args[0]), self._number(args[1]))
+        if name == 'atan2' and len(args) == 2:
+            return _number, 'math.atan2({}, {})'.format(self._number(args[0]), self._number(args[1]))
+        if name in ('min', 'max') and args:
+            code = self._number(args[0])
+            for arg in args[1:]:
+                code = 'js_{}({}, {})'.format(name, code, self._number(arg))
+            return _number, code
+        if name == 'clamp' and len(args) == 3:
+            return _number, 'js_max({}, js_min({}, {}))'.format(
+                self._number(args[1]), self._number(args[2]), self._number(args[0]))
+
+        if name in ('isNaN', 'isFinite', 'isValid', 'isNumber', 'isBoolean', 'toNumber', 'toBoolean') and len(args) == 1:
+            kind, code = self.write(args[0])
+            if name in ('isNumber', 'isBoolean'):
+                return _boolean, repr((kind == _number) == (name == 'isNumber'))
+            if name == 'toNumber':
+                return _number, self._number(args[0])
+            if name == 'toBoolean':
+                return _boolean, self._truthy(args[0])
+            if kind == _boolean:
+                return _boolean, repr(name != 'isNaN')
+            if name == 'isNaN':
+                return _boolean, '({0} != {0})'.format(code)
+            if name == 'isFinite':
+                return _boolean, '({0} - {0} == 0)'.format(code)
+            return _boolean, '({0} == {0})'.format(code)
+
+        raise FusedUnsupportedError('The `{}` function is not supported by the native evaluator'.format(name))
+
+
+def _float_literal(value):
+    value = float(value)
+    if value != value:
+        return 'nan'
+    if math.isinf(value):
+        return 'inf' if value > 0 else '-inf'
+    return repr(value)
+
+
+def kernel_source(expr, field_kinds, variable_kinds=None, datum='datum'):
+    """Return the source of the scalar kernel of an expression, the kind of its result, and the fields and variables it takes.
+
+    `field_kinds` and `variable_kinds` map the names of the fields of the datum and of the other variables
+    to 'number' or 'boolean'. The `kernel` function of the source takes the fields, then the variables.
+    A `FusedUnsupportedError` is raised if the expression uses other values or unsupported functions.
+    """
+    writer = _KernelWriter(field_kinds, {} if variable_kinds is None else variable_kinds, datum)
+    kind, code = writer.write(expr)
+
+    fields = sorted(writer.fields)
+    variables = sorted(writer.variables)
+    arguments = ['datum_' + name for name in fields] + ['variable_' + name for name in variables]
+    lines = [_kernel_helpers, '', '@jit', 'def kernel({}):'.format(', '.join(arguments))] + writer.lines
+    lines.append('    return {}'.format(code))
+    return '\n'.join(lines) + '\n', kind, fields, variables
+
+
+def load_kernel_module(source, cache_dir=None):
+    """Write the source of a kernel to the cache directory, named after its hash, and import it."""
+    cache_dir = default_cache_dir if cache_dir is None else cache_dir
+    name = 'py2vega_kernel_' + hashlib.sha1(source.encode('utf-8')).hexdigest()
+    path = os.path.join(cache_dir, name + '.py')
+
+    if not os.path.exists(path):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Written then renamed, so that concurrent runs never import a partially written kernel
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            f.write(source)
+        os.replace(temporary, path)
+
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[name] = module
+    return module
+
+
+def _kind(value):
+    """Return the kind of a column or of a variable value, or None if it is neither a number nor a boolean."""
+    dtype = getattr(value, 'dtype', None)
+    if dtype is not None:
+        return _boolean if dtype.kind == 'b' else _number if dtype.kind in 'iuf' else None
+    if isinstance(value, bool):
+        return _boolean
+    if isinstance(value, (int, float)):
+        return _number
+    return None
+
+
+class NativeEvaluator(object):
+    """Evaluate a translated expression over number and boolean columns with a kernel compiled by numba.
+
+    The kernel is compiled for the types of the columns and of the variables, and vectorized as a ufunc
+    running on all the cores, the `target` given to `numba.vectorize`. numba must be installed, use
+    `vectorized_evaluator` to fall back to `FusedEvaluator` if it is not.
+    """
+
+    def __init__(self, expr, datum='datum', variables=None, cache_dir=None, target='parallel'):
+        if numba is None:
+            raise ImportError('The native evaluator requires numba')
+        self.expr = expr
+        self.datum = datum
+        self.variables = {} if variables is None else variables
+        self.cache_dir = cache_dir
+        self.target = target
+        self._kernels = {}
+
+    def kernel(self, columns):
+        """Return the ufunc of the expression compiled for the types of the columns, and its fields and variables."""
+        field_kinds = dict((name, _kind(column)) for name, column in columns.items() if _kind(column) is not None)
+        variable_kinds = dict((name, _kind(value)) for name, value in self.variables.items() if _kind(value) is not None)
+        key = (tuple(sorted(field_kinds.items())), tuple(sorted(variable_kinds.items())))
+
+        kernel = self._kernels.get(key)
+        if kernel is None:
+            source, kind, fields, variables = kernel_source(self.expr, field_kinds, variable_kinds, self.datum)
+            module = load_kernel_module(source, self.cache_dir)
+            types = dict(number=numba.float64, boolean=numba.boolean)
+            signature = types[kind](*[types[field_kinds[name]] for name in fields] + [types[variable_kinds[name]] for name in variables])
+            ufunc = numba.vectorize([signature], target=self.target, cache=True)(module.kernel.py_func)
+            kernel = self._kernels[key] = (ufunc, fields, variables)
+        return kernel
+
+    def evaluate(self, columns, out=None):
+        """Return the array of the results of every row, written into `out` if given."""
+        import numpy
+
+        ufunc, fields, variables = self.kernel(columns)
+        arguments = [columns[name] for name in fields] + [self.variables[name] for name in variables]
+        # Infinities and NaNs are valid results in JavaScript
+        with numpy.errstate(all='ignore'):
+            if fields:
+                return ufunc(*arguments) if out is None else ufunc(*arguments, out=out)
+            # Only scalars, the result is broadcast to the number of rows
+            length = len(next(iter(columns.values()))) if columns else 0
+            result = numpy.broadcast_to(ufunc(*arguments), (length, ))
+        if out is None:
+            return numpy.array(result)
+        out[...] = result
+        return out
+
+    def filter(self, columns):
+        """Return the array of the indices of the rows for which the expression is truthy."""
+        import numpy
+
+        result = self.evaluate(columns)
+        if result.dtype != numpy.bool_:
+            result = (result != 0) & (result == result)
+        return numpy.flatnonzero(result)
+
+
+def vectorized_evaluator(expr, datum='datum', variables=None, scales=None, **options):
+    """Return a `NativeEvaluator` of the expression if numba is installed, and a `FusedEvaluator` otherwise.
+
+    Expressions calling `scales` are always evaluated by a `FusedEvaluator`.
+    """
+    if numba is not None and not scales:
+        return NativeEvaluator(expr, datum, variables, **options)
+    return FusedEvaluator(expr, datum=datum, variables=variables, scales=scales)
@@ -0,0 +1,263 @@
+"""Parallel evaluation of translated Vega expressions over partitions of columnar data.
+
+Expressions supported by `FusedEvaluator` run NumPy kernels, which release the GIL, and are evaluated by
+worker threads or processes. Other expressions, e.g. over strings or using regular expressions, are
+evaluated by worker processes. Results are written by the workers into a preallocated output, which
+is shared through a memory-mapped file by worker processes. numpy is needed.
+"""
+
+import multiprocessing
+import os
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from .artifact import dump_expression, load_expression
+from .columns import ChunkedEvaluator, default_chunk_size, memory_map_columns
+from .fused import FusedEvaluator, FusedUnsupportedError, _numpy
+from .javascript import truthy
+
+# Evaluation state of a worker process, set once when the process starts
+_worker = {}
+
+
+def partition(length, parts):
+    """Split `length` rows into at most `parts` contiguous (start, stop) ranges of nearly equal sizes."""
+    parts = max(1, min(parts, length))
+    size, extra = divmod(length, parts)
+
+    ranges = []
+    start = 0
+    for idx in range(parts):
+        stop = start + size + (1 if idx < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _is_source(columns):
+    """Return True if the columns are given as files to memory-map, and not as in-memory columns."""
+    if isinstance(columns, dict):
+        return len(columns) > 0 and all(isinstance(path, str) for path in columns.values())
+    return isinstance(columns, str)
+
+
+def _rows(columns, start, stop):
+    return dict((name, column[start:stop]) for name, column in columns.items())
+
+
+class _Partitions(object):
+    """Evaluation of partitions of rows, by `FusedEvaluator` if it supports the expression and the columns,
+    by the compiled closures of the expression otherwise.
+    """
+
+    def __init__(self, expr, chunk_size, datum, functions, parameters):
+        self.expr = expr
+        self.datum = datum
+        # Custom functions may replace the functions the fused evaluator implements
+        self.custom = bool(functions)
+        self.chunked = ChunkedEvaluator(expr, chunk_size, datum, functions, parameters)
+
+    def fused(self, columns, variables):
+        """Return the `FusedEvaluator` of the expression and its plan for the columns, or None if unsupported."""
+        if self.custom or not all(hasattr(column, 'dtype') for column in columns.values()):
+            return None
+        evaluator = FusedEvaluator(self.expr, datum=self.datum, variables=variables)
+        try:
+            return evaluator, evaluator.plan(columns)
+        except FusedUnsupportedError:
+            return None
+
+    def evaluate(self, columns, variables, start, stop, out):
+        """Evaluate the rows `start` to `stop` into `out` if they are numbers, and return the list of the results otherwise."""
+        fused = self.fused(columns, variables)
+        if fused is not None:
+            fused[0].evaluate(_rows(columns, start, stop), out=out)
+            return None
+        results = []
+        for chunk in self.chunked.chunks(columns, variables, start, stop):
+            results.extend(chunk)
+        return results
+
+    def filter(self, columns, variables, zone_map, start, stop, mask):
+        """Write into `mask` whether the expression is truthy for each of the rows `start` to `stop`."""
+        fused = self.fused(columns, variables)
+        if zone_map is None:
+            ranges = [(start, stop, None)]
+        else:
+            from .zonemap import predicate_outcome
+
+            ranges = [
+                (chunk_start, chunk_stop, predicate_outcome(self.expr, statistics, variables, self.datum))
+                for chunk_start, chunk_stop, statistics in zone_map.chunks(start, stop)
+            ]
+
+        for chunk_start, chunk_stop, outcome in ranges:
+            chunk = mask[chunk_start - start:chunk_stop - start]
+            if outcome is not None:
+                chunk[:] = outcome
+            elif fused is not None:
+                np = _numpy()
+                for block_start, block_stop, result in fused[0].blocks(_rows(columns, chunk_start, chunk_stop)):
+                    result = np.asarray(result)
+                    if result.dtype != np.bool_:
+                        result = (result != 0) & (result == result)
+                    chunk[block_start:block_stop] = result
+            else:
+                offset = 0
+                for results in self.chunked.chunks(columns, variables, chunk_start, chunk_stop):
+                    chunk[offset:offset + len(results)] = [truthy(result) for result in results]
+                    offset += len(results)
+
+
+def _initialize_worker(artifact, chunk_size, datum, functions, parameters):
+    _worker['partitions'] = _Partitions(load_expression(artifact), chunk_size, datum, functions, parameters)
+    _worker['source'] = (None, None)
+
+
+def _run_partition(task):
+    mode, source, variables, zone_map, path, start, stop = task
+    # The columns are memory-mapped by each process, the pages of the files are then shared by the processes
+    key = tuple(sorted(source.items())) if isinstance(source, dict) else source
+    if _worker['source'][0] != key:
+        _worker['source'] = (key, memory_map_columns(source))
+    columns = _worker['source'][1]
+
+    out = None
+    if path is not None:
+        from numpy.lib.format import open_memmap
+
+        out = open_memmap(path, mode='r+')[start:stop]
+    if mode == 'filter':
+        return _worker['partitions'].filter(columns, variables, zone_map, start, stop, out)
+    return _worker['partitions'].evaluate(columns, variables, start, stop, out)
+
+
+class ParallelEvaluator(object):
+    """Evaluate a translated expression for every row of columnar data, on many cores.
+
+    The rows are split into one contiguous partition per worker, and each worker writes the results of its
+    partition into the output. The pool of workers is kept until `close` is called, or until the end of
+    the `with` block using the evaluator.
+
+    Worker processes evaluate any expression. The expression is sent to them as an artifact, each of them
+    compiles it once and memory-maps the column files itself, the columns must then be given as files, like
+    for `memory_map_columns`, and the custom `functions` must be picklable. Results which are not numbers,
+    e.g. strings, are sent back to the main process.
+    Worker threads, used if `processes` is False, can evaluate in-memory NumPy columns, but only expressions
+    supported by `FusedEvaluator`, other expressions holding the GIL.
+    """
+
+    def __init__(self, expr, workers=None, processes=True, chunk_size=default_chunk_size, datum='datum',
+                 functions=None, parameters=None):
+        """Construct a ParallelEvaluator, `workers` defaulting to the number of cores."""
+        self.expr = expr
+        self.workers = multiprocessing.cpu_count() if workers is None else workers
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.datum = datum
+        self.functions = functions
+        self.parameters = parameters
+        self.partitions = _Partitions(expr, chunk_size, datum, functions, parameters)
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the workers."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def pool(self):
+        """Return the pool of workers, started on first use."""
+        if self._pool is None:
+            if self.processes:
+                self._pool = multiprocessing.Pool(self.workers, _initialize_worker, (
+                    dump_expression(self.expr), self.chunk_size, self.datum, self.functions, self.parameters))
+            else:
+                self._pool = ThreadPool(self.workers)
+        return self._pool
+
+    def _map(self, mode, columns, variables, zone_map=None):
+        np = _numpy()
+        source = _is_source(columns)
+        if self.processes and not source:
+            raise ValueError('Worker processes read the columns from files, give the paths of the column files')
+
+        opened = memory_map_columns(columns) if source else columns
+        length = len(next(iter(opened.values()))) if opened else 0
+        ranges = partition(length, self.workers)
+        fused = self.partitions.fused(opened, variables)
+        if not self.processes and fused is None:
+            raise FusedUnsupportedError('Worker threads only evaluate expressions supported by FusedEvaluator, use worker processes')
+
+        # Filters write a mask of the truthy rows, results which are not numbers are returned by the workers
+        if mode == 'filter':
+            dtype = np.bool_
+        elif fused is not None:
+            dtype = np.bool_ if fused[1].kind == 'boolean' else np.float64
+        else:
+            dtype = None
+
+        out = None
+        if self.processes:
+            path = None
+            if dtype is not None:
+                from numpy.lib.format import open_memmap
+
+                handle, path = tempfile.mkstemp(suffix='.npy')
+                os.close(handle)
+                out = open_memmap(path, mode='w+', dtype=dtype, shape=(length, ))
+            try:
+                parts = self.pool().map(_run_partition, [
+                    (mode, columns, variables, zone_map, path, start, stop) for start, stop in ranges])
+            finally:
+                # The output stays mapped in memory once its file is removed
+                if path is not None:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        else:
+            out = np.empty(length, dtype=dtype)
+
+            def run(rows):
+                start, stop = rows
+                if mode == 'filter':
+                    return self.partitions.filter(opened, variables, zone_map, start, stop, out[start:stop])
+                return self.partitions.evaluate(opened, variables, start, stop, out[start:stop])
+            parts = self.pool().map(run, ranges)
+
+        if mode == 'filter':
+            return np.flatnonzero(out)
+        if out is None:
+            out = np.empty(length, dtype=object)
+            for (start, stop), part in zip(ranges, parts):
+                for idx, result in enumerate(part):
+                    out[start + idx] = result
+        return out
+
+    def evaluate(self, columns, variables=None):
+        """Return the array of the results of every row of the columns, of numbers or of Python values."""
+        return self._map('evaluate', columns, variables)
+
+    def filter(self, columns, variables=None, zone_map=None):
+        """Return the array of the indices of the rows for which the expression is truthy, skipping chunks using the `zone_map` if given."""
+        return self._map('filter', columns, variables, zone_map)
+
+
+def evaluate_parallel(expr, columns, workers=None, processes=True, chunk_size=default_chunk_size, variables=None, datum='datum'):
+    """Return the results of a translated expression for every row of the columns, evaluated on many cores."""
+    with ParallelEvaluator(expr, workers, processes, chunk_size, datum) as evaluator:
+        return evaluator.evaluate(columns, variables)
+
+
+def filter_parallel(expr, columns, workers=None, processes=True, chunk_size=default_chunk_size, variables=None, datum='datum'):
+    """Return the indices of the rows of the columns for which a translated expression is truthy, evaluated on many cores."""
+    with ParallelEvaluator(expr, workers, processes, chunk_size, datum) as evaluator:
+        return evaluator.filter(columns, variables)
@@ -0,0 +1,190 @@
+"""Vega-Lite filter predicates translated from Python code."""
+
+import ast
+import re
+
+from .expression import Array, Identifier, Index, Literal, Member, Unary, emit
+from .inference import literal_type
+from .javascript import is_finite
+from .main import Translator, VegaExpressionVisitor
+from .simplify import simplify
+
+# Vega-Lite field predicates of the comparison operators, the field being the left operand
+_comparison_predicates = {ast.Eq: 'equal', ast.NotEq: 'equal', ast.Lt: 'lt', ast.LtE: 'lte', ast.Gt: 'gt', ast.GtE: 'gte'}
+_swapped_predicates = {'equal': 'equal', 'lt': 'gt', 'lte': 'gte', 'gt': 'lt', 'gte': 'lte'}
+
+_field_escapes = re.compile(r'([\\.\[\]])')
+
+
+def field_name(expr, datum='datum'):
+    """Return the Vega-Lite field name of a member of the datum, e.g. "a.b" for `datum.a.b`, or None."""
+    path = []
+    while isinstance(expr, (Member, Index)):
+        if isinstance(expr, Member):
+            path.append(expr.property)
+        elif isinstance(expr.index, Literal) and isinstance(expr.index.value, str):
+            path.append(expr.index.value)
+        else:
+            return None
+        expr = expr.object
+
+    if not path or not isinstance(expr, Identifier) or expr.name != datum:
+        return None
+    # Dots and brackets would otherwise be read as accesses to nested fields
+    return '.'.join(_field_escapes.sub(r'\\\1', name) for name in reversed(path))
+
+
+def _constant(expr):
+    """Return a one-element tuple holding the value of a constant expression, or None."""
+    if isinstance(expr, Unary) and expr.operator == '-':
+        value = _constant(expr.argument)
+        if value is None or isinstance(value[0], bool) or not isinstance(value[0], (int, float)):
+            return None
+        return (-value[0], )
+    if isinstance(expr, Literal):
+        if isinstance(expr.value, (list, tuple)):
+            return (list(expr.value), )
+        if expr.value is None or isinstance(expr.value, (bool, int, float, str)):
+            return (expr.value, )
+        return None
+    if isinstance(expr, Array):
+        values = [_constant(element) for element in expr.elements]
+        if any(value is None for value in values):
+            return None
+        return ([value[0] for value in values], )
+    return None
+
+
+class _PredicateBuilder(object):
+    """Turn Python expression nodes into Vega-Lite predicates, or into expression strings if they are not predicates."""
+
+    def __init__(self, visitor, datum, domains=False):
+        self.visitor = visitor
+        self.datum = datum
+        self.domains = domains
+
+    def translate(self, node):
+        """Return the translated expression of a node, simplified if the whitelist declares domains."""
+        expr = self.visitor.visit(node)
+        return simplify(expr, self.visitor.types) if self.domains else expr
+
+    def expression(self, node):
+        return emit(self.translate(node))
+
+    def build(self, node):
+        """Return the predicate of a node, or its Vega-expression string."""
+        if isinstance(node, ast.BoolOp):
+            operands = [self.build(value) for value in node.values]
+            if all(isinstance(operand, str) for operand in operands):
+                return self.expression(node)
+            return {'and' if isinstance(node.op, ast.And) else 'or': operands}
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = self.build(node.operand)
+            if isinstance(operand, str):
+                return self.expression(node)
+            return {'not': operand}
+
+        # Conditions the domains always or never satisfy are kept as `true` or `false`, but chained comparisons,
+        # which are ranges, are translated to comparisons of booleans
+        if self.domains and not (isinstance(node, ast.Compare) and len(node.ops) > 1) and \
+                isinstance(self.translate(node), Literal):
+            return self.expression(node)
+
+        if isinstance(node, ast.Compare):
+            predicate = self._compare(node)
+            if predicate is not None:
+                return predicate
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'isValid' and len(node.args) == 1:
+            argument = self.visitor.visit(node.args[0])
+            field = field_name(argument, self.datum)
+            variable = self.visitor.types.variable(argument)
+            # Vega-Lite's `valid` also rejects values that are not finite numbers, which the field must never be
+            if field is not None and self.visitor.types.is_a(argument, 'number') and variable is not None and \
+                    variable.range is not None and all(is_finite(bound) for bound in variable.range):
+                return {'field': field, 'valid': True}
+
+        return self.expression(node)
+
+    def _compare(self, node):
+        operands = [node.left] + node.comparators
+        predicates = []
+        for left, op, right in zip(operands, node.ops, operands[1:]):
+            predicate = self._comparison(left, op, right)
+            if predicate is None:
+                return None
+            predicates.append(predicate)
+
+        if len(predicates) == 1:
+            return predicates[0]
+
+        # `a <= datum.x <= b` is a range
+        if len(predicates) == 2 and predicates[0].get('field') == predicates[1].get('field') and \
+                'gte' in predicates[0] and 'lte' in predicates[1]:
+            return {'field': predicates[0]['field'], 'range': [predicates[0]['gte'], predicates[1]['lte']]}
+        return {'and': predicates}
+
+    def _comparison(self, left, op, right):
+        """Return the field predicate of a comparison between a field and a constant, or None."""
+        left = self.visitor.visit(left)
+        right = self.visitor.visit(right)
+
+        if isinstance(op, (ast.In, ast.NotIn)):
+            field = field_name(left, self.datum)
+            values = _constant(right)
+            if field is None or values is None or not isinstance(values[0], list):
+                return None
+            predicate = {'field': field, 'oneOf': values[0]}
+            return {'not': predicate} if isinstance(op, ast.NotIn) else predicate
+
+        name = _comparison_predicates.get(op.__class__)
+        if name is None:
+            return None
+
+        operand = left
+        field = field_name(left, self.datum)
+        value = _constant(right)
+        if field is None:
+            operand = right
+            field = field_name(right, self.datum)
+            value = _constant(left)
+            name = _swapped_predicates[name]
+
+        # Null and arrays compare differently with the strict equality of Vega-Lite predicates
+        if field is None or value is None or value[0] is None or isinstance(value[0], list):
+            return None
+        # Python equality is translated to the loose equality of Vega, which only matches the strict one
+        # for values of the same type
+        if name == 'equal' and not self.visitor.types.is_a(operand, literal_type(value[0]).kind):
+            return None
+
+        predicate = {'field': field, name: value[0]}
+        return {'not': predicate} if isinstance(op, ast.NotEq) else predicate
+
+
+def py2vega_predicate(value, whitelist=(), datum='datum', timezone=None):
+    """Convert Python code or a Python filter function to a Vega-Lite predicate.
+
+    Comparisons between a field of the datum and a constant are turned into `equal`, `lt`, `lte`, `gt`,
+    `gte` and `range` field predicates, `in` tests against constant lists into `oneOf` predicates and
+    `isValid` calls on number fields of finite range into `valid` predicates. They are composed with `and`, `or` and
+    `not`. `equal` predicates being strict, equality tests are only turned into them if the field is
+    declared with the type of the constant, e.g. `Variable('name', type='string')`, they are kept as
+    loose `==` expressions otherwise. Anything else is kept as a Vega-expression string, which is what
+    is returned if the code is not a predicate at all. If the whitelist declares domains, the expression
+    strings are simplified like by `Translator.translate_expression`, and conditions the domains always or
+    never satisfy become `"true"` or `"false"`.
+    """
+    translator = Translator(whitelist, timezone=timezone)
+    visitor = VegaExpressionVisitor(
+        translator.whitelist, lookup_threshold=translator.lookup_threshold, timezone=translator.timezone)
+    visitor, node = translator.prepare(value, visitor)
+
+    builder = _PredicateBuilder(visitor, datum, translator.whitelist.domains)
+    if isinstance(node, ast.Return):
+        node = node.value
+    elif not isinstance(node, ast.expr):
+        return builder.expression(node)
+
+    return builder.build(node)
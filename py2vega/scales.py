@@ -0,0 +1,822 @@
+"""Server-side implementations of Vega scales.
+
+Scales are configured from the `scales` definitions of a Vega spec by `parse_scales`, and map values the way
+Vega does: one value at a time when called, or whole arrays of values with `Scale.apply`, which needs numpy.
+`scale_functions` returns the implementations of the `scale`, `invert`, `bandwidth` and other scale functions
+to give to the evaluator, and `FusedEvaluator` takes the scales to evaluate expressions over whole columns.
+
+The linear, log, pow, sqrt, symlog, time, utc, band, point, ordinal, quantize and threshold scale types are
+supported, with literal or data domains, and with ranges of numbers, or of any values for discrete scales.
+"""
+
+import math
+from bisect import bisect_right
+
+from .javascript import NaN, inf, is_nullish, is_number, power, strict_equals, to_number, undefined
+
+
+def _numpy():
+    import numpy
+
+    return numpy
+
+
+def _safe(func):
+    """Wrap a `math` function of a number so that it returns NaN or infinity instead of raising, like in JavaScript."""
+    def impl(value):
+        if value != value:
+            return NaN
+        try:
+            return func(value)
+        except OverflowError:
+            return inf
+        except ValueError:
+            return NaN
+    return impl
+
+
+_log = _safe(lambda value: -inf if value == 0 else math.log(value))
+_exp = _safe(math.exp)
+_log1p = _safe(math.log1p)
+_expm1 = _safe(math.expm1)
+
+
+def _round(value):
+    """JavaScript `Math.round` function, rounding halves up."""
+    return math.floor(value + 0.5) if value - value == 0 else value
+
+
+# Transforms of continuous scales, mapping the domain to the space where values are linearly interpolated
+
+class _Identity(object):
+    def forward(self, value):
+        return value
+
+    backward = forward
+
+    def forward_array(self, np, values):
+        return values
+
+    backward_array = forward_array
+
+
+class _Log(object):
+    """Log transform, reflected if the domain is negative. The base of the logarithm only matters for `nice`."""
+
+    def __init__(self, negative=False):
+        self.sign = -1.0 if negative else 1.0
+
+    def forward(self, value):
+        return self.sign * _log(self.sign * value)
+
+    def backward(self, value):
+        return self.sign * _exp(self.sign * value)
+
+    def forward_array(self, np, values):
+        return self.sign * np.log(self.sign * values)
+
+    def backward_array(self, np, values):
+        return self.sign * np.exp(self.sign * values)
+
+
+class _Pow(object):
+    """Power transform, symmetric around zero."""
+
+    def __init__(self, exponent):
+        self.exponent = exponent
+
+    def _power(self, value, exponent):
+        return -power(-value, exponent) if value < 0 else power(value, exponent)
+
+    def _power_array(self, np, values, exponent):
+        if exponent == 1:
+            return values
+        if exponent == 0.5:
+            return np.where(values < 0, -np.sqrt(-values), np.sqrt(values))
+        return np.where(values < 0, -np.power(-values, exponent), np.power(values, exponent))
+
+    def forward(self, value):
+        return self._power(value, self.exponent)
+
+    def backward(self, value):
+        return self._power(value, 1.0 / self.exponent)
+
+    def forward_array(self, np, values):
+        return self._power_array(np, values, self.exponent)
+
+    def backward_array(self, np, values):
+        return self._power_array(np, values, 1.0 / self.exponent)
+
+
+class _Symlog(object):
+    """Symmetric log transform, linear around zero, of the given constant."""
+
+    def __init__(self, constant):
+        self.constant = constant
+
+    def forward(self, value):
+        return math.copysign(_log1p(abs(value) / self.constant), value) if value == value else NaN
+
+    def backward(self, value):
+        return math.copysign(_expm1(abs(value)) * self.constant, value) if value == value else NaN
+
+    def forward_array(self, np, values):
+        return np.sign(values) * np.log1p(np.abs(values) / self.constant)
+
+    def backward_array(self, np, values):
+        return np.sign(values) * np.expm1(np.abs(values)) * self.constant
+
+
+class _Piecewise(object):
+    """Piecewise linear interpolation of numbers, from the stops of the domain to the stops of the range."""
+
+    def __init__(self, domain, range, round=False):
+        size = min(len(domain), len(range))
+        domain = list(domain[:size])
+        range = list(range[:size])
+        if size and domain[-1] < domain[0]:
+            domain.reverse()
+            range.reverse()
+        self.domain = domain
+        self.range = range
+        self.round = round
+
+    def __call__(self, value):
+        domain, range = self.domain, self.range
+        if not domain:
+            return undefined
+        if len(domain) == 1:
+            return range[0]
+        idx = bisect_right(domain, value, 1, len(domain) - 1) - 1
+        span = domain[idx + 1] - domain[idx]
+        if span:
+            fraction = (value - domain[idx]) / span
+        else:
+            fraction = NaN if span != span else 0.5
+        result = range[idx] * (1 - fraction) + range[idx + 1] * fraction
+        return _round(result) if self.round else result
+
+    def apply(self, np, values):
+        if len(self.domain) < 2:
+            return np.full(np.shape(values), self(0) if self.domain else NaN)
+        domain = np.array(self.domain, dtype=np.float64)
+        range = np.array(self.range, dtype=np.float64)
+        if len(domain) == 2:
+            start, stop, low, high = domain[0], domain[1], range[0], range[1]
+        else:
+            idx = np.searchsorted(domain[1:-1], values, side='right')
+            start, stop, low, high = domain[idx], domain[idx + 1], range[idx], range[idx + 1]
+        span = stop - start
+        fraction = np.where(span != 0, (values - start) / np.where(span != 0, span, 1), np.where(span == span, 0.5, NaN))
+        result = low * (1 - fraction) + high * fraction
+        return np.floor(result + 0.5) if self.round else result
+
+
+class Scale(object):
+    """Base class of the scales, which map values when called, and arrays of values with `apply`.
+
+    Results are undefined for values the scale cannot map, and NaN in the arrays of numbers `apply` returns.
+    """
+
+    type = None
+
+    def __init__(self, domain, range):
+        self.domain = list(domain)
+        self.range = list(range)
+
+    def __call__(self, value):
+        raise NotImplementedError()
+
+    def apply(self, values):
+        """Return the array of the mapped values, of numbers if the results are numbers."""
+        return _results(_numpy(), [self(value) for value in _numpy().asarray(values).ravel().tolist()], values)
+
+    def invert(self, value):
+        """Return the domain value of a range value, like Vega's `invert` function."""
+        raise TypeError('{} scales cannot be inverted'.format(self.type))
+
+    def invert_array(self, values):
+        """Return the array of the inverted values."""
+        return _results(_numpy(), [self.invert(value) for value in _numpy().asarray(values).ravel().tolist()], values)
+
+    def bandwidth(self):
+        """Return the width of the bands of a band scale, zero for the other scales."""
+        return 0
+
+    def returns_numbers(self, invert=False):
+        """Return True if the scale, or its inverse, maps any value to a number or to undefined."""
+        return False
+
+
+def _lookup(np, keys, values, nan_equal=False):
+    """Return the array of the index of the first key equal to each value, -1 if there is none.
+
+    Keys are searched with `np.searchsorted`, None is returned if they are not all numbers or all strings,
+    or if the values are objects, which NumPy cannot compare like JavaScript does.
+    """
+    if keys and all(is_number(key) for key in keys):
+        keys, kinds = np.array(keys, dtype=np.float64), 'iuf'
+    elif all(isinstance(key, str) for key in keys):
+        keys, kinds = np.array(keys, dtype=str), 'U'
+    else:
+        return None
+    if values.dtype.kind == 'O':
+        return None
+    if values.dtype.kind not in kinds or not len(keys):
+        return np.full(values.shape, -1, dtype=np.intp)
+
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    positions = np.minimum(np.searchsorted(keys, values), len(keys) - 1)
+    found = keys[positions] == values
+    if nan_equal and kinds == 'iuf':
+        found |= (keys[positions] != keys[positions]) & (values != values)
+    return np.where(found, order[positions], -1)
+
+
+def _objects(np, values):
+    """Return an array of objects holding the values, which may be lists."""
+    array = np.empty(len(values), dtype=object)
+    for idx, value in enumerate(values):
+        array[idx] = value
+    return array
+
+
+def _results(np, results, values):
+    """Return the results of a scale as an array of numbers, undefined being NaN, or as an array of objects."""
+    shape = np.shape(values)
+    if all(is_number(result) or result is undefined for result in results):
+        return np.array([NaN if result is undefined else result for result in results], dtype=np.float64).reshape(shape)
+    return _objects(np, results).reshape(shape)
+
+
+class ContinuousScale(Scale):
+    """Linear, log, pow, sqrt, symlog, time and utc scales, interpolating numbers between the stops of the range."""
+
+    def __init__(self, type, domain, range, transform=None, clamp=False, round=False):
+        super(ContinuousScale, self).__init__(domain, range)
+        self.type = type
+        self.transform = _Identity() if transform is None else transform
+        self.clamp = clamp
+        self.round = round
+        size = min(len(self.domain), len(self.range))
+        numbers = [to_number(value) for value in self.domain[:size]]
+        self._bounds = (min(numbers[0], numbers[-1]), max(numbers[0], numbers[-1])) if size else (NaN, NaN)
+        transformed = [self.transform.forward(value) for value in numbers]
+        stops = [to_number(value) for value in self.range]
+        self._output = _Piecewise(transformed, stops, round)
+        self._input = _Piecewise(stops, transformed)
+
+    def _clamp(self, value):
+        return min(max(value, self._bounds[0]), self._bounds[1]) if self.clamp and value == value else value
+
+    def __call__(self, value):
+        if is_nullish(value):
+            return undefined
+        value = to_number(value)
+        if value != value:
+            return undefined
+        return self._output(self.transform.forward(self._clamp(value)))
+
+    def apply(self, values):
+        np = _numpy()
+        values = np.asarray(values, dtype=np.float64)
+        if self.clamp:
+            values = np.clip(values, *self._bounds)
+        with np.errstate(all='ignore'):
+            return self._output.apply(np, self.transform.forward_array(np, values))
+
+    def invert(self, value):
+        if not self._input.domain:
+            return undefined
+        return self._clamp(self.transform.backward(self._input(to_number(value))))
+
+    def invert_array(self, values):
+        np = _numpy()
+        with np.errstate(all='ignore'):
+            values = self.transform.backward_array(np, self._input.apply(np, np.asarray(values, dtype=np.float64)))
+        return np.clip(values, *self._bounds) if self.clamp else values
+
+    def returns_numbers(self, invert=False):
+        return True
+
+
+def _key(value):
+    """Key of a value in the domain of a discrete scale, which are compared like the keys of a JavaScript Map."""
+    if is_number(value):
+        return (float, 'NaN' if value != value else float(value))
+    if isinstance(value, (list, dict)):
+        return (object, id(value))
+    return (type(value), value)
+
+
+class OrdinalScale(Scale):
+    """Ordinal scales, mapping the values of the domain to the values of the range, cycling through the range.
+
+    Values missing from the domain are undefined, or appended to the domain if `implicit` is True.
+    """
+
+    type = 'ordinal'
+
+    def __init__(self, domain, range, implicit=False):
+        super(OrdinalScale, self).__init__([], range)
+        self.implicit = implicit
+        self._index = {}
+        for value in domain:
+            if _key(value) not in self._index:
+                self._index[_key(value)] = len(self.domain)
+                self.domain.append(value)
+
+    def _position(self, value):
+        key = _key(value)
+        idx = self._index.get(key)
+        if idx is None and self.implicit:
+            idx = self._index[key] = len(self.domain)
+            self.domain.append(value)
+        return idx
+
+    def __call__(self, value):
+        idx = self._position(value)
+        if idx is None or not self.range:
+            return undefined
+        return self.range[idx % len(self.range)]
+
+    def apply(self, values):
+        np = _numpy()
+        values = np.asarray(values)
+        try:
+            uniques, first, inverse = np.unique(values.ravel(), return_index=True, return_inverse=True)
+        except TypeError:
+            # Values which cannot be sorted
+            return super(OrdinalScale, self).apply(values)
+        # Unique values are mapped in the order of their first row, in which implicit values are appended
+        mapped = [None] * len(uniques)
+        for idx in np.argsort(first, kind='stable'):
+            value = uniques[idx]
+            mapped[idx] = self(value.item() if isinstance(value, np.generic) else value)
+        return _results(np, mapped, uniques)[inverse.reshape(-1)].reshape(values.shape)
+
+    def returns_numbers(self, invert=False):
+        return not invert and all(is_number(value) for value in self.range)
+
+
+def bandspace(count, padding_inner, padding_outer):
+    """Return the number of steps of a band scale, like Vega's `bandspace` function."""
+    count = to_number(count)
+    space = count - to_number(padding_inner) + to_number(padding_outer) * 2
+    return (space if space > 0 else 1) if count else 0
+
+
+class BandScale(OrdinalScale):
+    """Band and point scales, mapping the values of the domain to the start of evenly spaced bands of the range.
+
+    A point scale is a band scale of zero bandwidth, whose inner padding is 1.
+    """
+
+    type = 'band'
+
+    def __init__(self, domain, range, padding_inner=0, padding_outer=0, align=0.5, round=False, type='band'):
+        super(BandScale, self).__init__(domain, [])
+        self.type = type
+        self.extent = [to_number(value) for value in range[:2]]
+        reverse = self.extent[1] < self.extent[0]
+        start, stop = sorted(self.extent)
+        count = len(self.domain)
+        padding_inner = min(1, padding_inner)
+        align = max(0, min(1, align))
+
+        self.step = (stop - start) / max(1, count - padding_inner + padding_outer * 2)
+        if round:
+            self.step = math.floor(self.step)
+        start += (stop - start - self.step * (count - padding_inner)) * align
+        self._bandwidth = self.step * (1 - padding_inner)
+        if round:
+            start = _round(start)
+            self._bandwidth = _round(self._bandwidth)
+        self.range = [start + self.step * idx for idx, _ in enumerate(self.domain)]
+        if reverse:
+            self.range.reverse()
+
+    def bandwidth(self):
+        return self._bandwidth
+
+    def apply(self, values):
+        np = _numpy()
+        values = np.asarray(values)
+        idx = _lookup(np, self.domain, values, nan_equal=True)
+        if idx is None:
+            return super(BandScale, self).apply(values)
+        # Values missing from the domain take the last stop, which is NaN
+        return np.take(np.array(self.range + [NaN], dtype=np.float64), idx)
+
+    def invert_array(self, values):
+        np = _numpy()
+        if not self.domain or not self.returns_numbers(invert=True):
+            return super(BandScale, self).invert_array(values)
+        try:
+            values = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return super(BandScale, self).invert_array(values)
+        reverse = self.extent[1] < self.extent[0]
+        starts = np.array(self.range[::-1] if reverse else self.range, dtype=np.float64)
+        domain = np.array(self.domain[::-1] if reverse else self.domain, dtype=np.float64)
+        # Like `invert_range`, values are in the band starting at the last start before them
+        idx = np.maximum(np.searchsorted(starts, values, side='right') - 1, 0)
+        with np.errstate(invalid='ignore'):
+            found = (values >= starts[0]) & (values <= max(self.extent)) & (values - starts[idx] <= self._bandwidth + 1e-10)
+        return np.where(found, np.take(domain, idx), NaN)
+
+    def invert(self, value):
+        if isinstance(value, list):
+            return self.invert_range(value)
+        values = self.invert_range([value, value])
+        return values[0] if values else undefined
+
+    def invert_range(self, extent):
+        """Return the list of the domain values whose bands intersect a range extent, or undefined if there are none."""
+        reverse = self.extent[1] < self.extent[0]
+        values = self.range[::-1] if reverse else self.range
+        last = len(values) - 1
+        low, high = to_number(extent[0]), to_number(extent[1])
+        if low != low or high != high or not values:
+            return undefined
+        if high < low:
+            low, high = high, low
+        if high < values[0] or low > self.extent[0 if reverse else 1]:
+            return undefined
+        first = max(0, bisect_right(values, low) - 1)
+        stop = first if low == high else bisect_right(values, high) - 1
+        if low - values[first] > self._bandwidth + 1e-10:
+            first += 1
+        if reverse:
+            first, stop = last - stop, last - first
+        return undefined if first > stop else self.domain[first:stop + 1]
+
+    def returns_numbers(self, invert=False):
+        return not invert or all(is_number(value) for value in self.domain)
+
+
+class QuantizeScale(Scale):
+    """Quantize scales, dividing the numbers of the domain extent into uniform segments mapped to the range values."""
+
+    type = 'quantize'
+
+    def __init__(self, domain, range):
+        super(QuantizeScale, self).__init__(domain[:2], range)
+        low, high = [to_number(value) for value in self.domain]
+        count = len(self.range) - 1
+        self.thresholds = [((idx + 1) * high - (idx - count) * low) / (count + 1) for idx, _ in enumerate(self.range[1:])]
+
+    def __call__(self, value):
+        if is_nullish(value) or to_number(value) != to_number(value) or not self.range:
+            return undefined
+        return self.range[bisect_right(self.thresholds, to_number(value))]
+
+    def apply(self, values):
+        np = _numpy()
+        try:
+            values = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            return super(QuantizeScale, self).apply(values)
+        # Values which are not numbers take the last stop, which is undefined
+        if all(is_number(value) for value in self.range):
+            stops = np.array(self.range + [NaN], dtype=np.float64)
+        else:
+            stops = _objects(np, self.range + [undefined])
+        idx = np.searchsorted(np.array(self.thresholds, dtype=np.float64), values, side='right')
+        return np.take(stops, np.where(values == values, idx, len(self.range)))
+
+    def _bounds(self):
+        """Return the bounds of the segments mapped to the range values."""
+        return [to_number(self.domain[0])] + self.thresholds + [to_number(self.domain[1])]
+
+    def invert(self, value):
+        idx = _index_of(self.range, value)
+        if idx < 0:
+            return [NaN, NaN]
+        return self._bounds()[idx:idx + 2]
+
+    def invert_array(self, values):
+        """Return the array of the extents of the inverted values, of shape `values.shape + (2, )`, undefined being NaN."""
+        np = _numpy()
+        values = np.asarray(values)
+        idx = _lookup(np, self.range, values)
+        if idx is None:
+            idx = np.array([_index_of(self.range, value) for value in values.ravel().tolist()], dtype=np.intp).reshape(values.shape)
+        # Values missing from the range take the last bounds, which are NaN
+        bounds = [NaN if bound is undefined else bound for bound in self._bounds()]
+        lows = np.array(bounds[:-1] + [NaN], dtype=np.float64)
+        highs = np.array(bounds[1:] + [NaN], dtype=np.float64)
+        return np.stack([np.take(lows, idx), np.take(highs, idx)], axis=-1)
+
+    def returns_numbers(self, invert=False):
+        return not invert and bool(self.range) and all(is_number(value) for value in self.range)
+
+
+class ThresholdScale(QuantizeScale):
+    """Threshold scales, mapping the segments between the numbers of the domain to the range values."""
+
+    type = 'threshold'
+
+    def __init__(self, domain, range):
+        Scale.__init__(self, domain, range)
+        self.thresholds = [to_number(value) for value in self.domain[:max(0, len(self.range) - 1)]]
+
+    def _bounds(self):
+        return [undefined] + self.thresholds + [undefined]
+
+    def invert(self, value):
+        idx = _index_of(self.range, value)
+        bounds = self._bounds()
+        return [bounds[idx], bounds[idx + 1]] if idx >= 0 else [undefined, undefined]
+
+
+def _index_of(values, value):
+    for idx, element in enumerate(values):
+        if strict_equals(element, value):
+            return idx
+    return -1
+
+
+# Parsing of the scale definitions of a Vega spec
+
+_continuous_types = frozenset(['linear', 'log', 'pow', 'sqrt', 'symlog', 'time', 'utc'])
+_discrete_types = frozenset(['ordinal', 'band', 'point'])
+_zero_types = frozenset(['linear', 'pow', 'sqrt'])
+
+_e10 = math.sqrt(50)
+_e5 = math.sqrt(10)
+_e2 = math.sqrt(2)
+
+
+def _tick_increment(start, stop, count):
+    step = (stop - start) / max(0, count)
+    exponent = math.floor(math.log10(step))
+    error = step / 10 ** exponent
+    factor = 10 if error >= _e10 else 5 if error >= _e5 else 2 if error >= _e2 else 1
+    return factor * 10 ** exponent if exponent >= 0 else -10 ** -exponent / factor
+
+
+def _nice_linear(domain, count):
+    """Extend the first and last numbers of a domain to round values, like d3's `nice` for linear scales."""
+    first, last = (0, len(domain) - 1) if domain[0] <= domain[-1] else (len(domain) - 1, 0)
+    start, stop = domain[first], domain[last]
+    previous = None
+    for _ in range(10):
+        if not start < stop or math.isinf(stop - start):
+            return
+        step = _tick_increment(start, stop, count)
+        if step == previous:
+            domain[first], domain[last] = start, stop
+            return
+        if step > 0:
+            start, stop = math.floor(start / step) * step, math.ceil(stop / step) * step
+        else:
+            start, stop = math.ceil(start * step) / step, math.floor(stop * step) / step
+        previous = step
+
+
+def _log2(value):
+    # math.log2 is missing from Python 2, powers of two are computed exactly all the same
+    mantissa, exponent = math.frexp(value)
+    return exponent - 1 if mantissa == 0.5 else math.log(value) / math.log(2)
+
+
+def _nice_log(domain, base):
+    """Extend the first and last numbers of a domain to powers of the base."""
+    sign = -1 if domain[0] < 0 else 1
+    logarithm = math.log10 if base == 10 else _log2 if base == 2 else lambda value: math.log(value) / math.log(base)
+    first, last = (0, len(domain) - 1) if domain[0] <= domain[-1] else (len(domain) - 1, 0)
+
+    def nice(value, rounding):
+        # Negative domains are reflected
+        exponent = rounding(sign * logarithm(sign * value))
+        return sign * base ** (sign * exponent)
+    domain[first] = nice(domain[first], math.floor)
+    domain[last] = nice(domain[last], math.ceil)
+
+
+def _check(value, name):
+    if isinstance(value, dict) and 'signal' in value:
+        raise ValueError('The {} of a scale cannot be a signal'.format(name))
+    return value
+
+
+def _data_values(reference, data):
+    """Yield the values of the fields of a data reference, e.g. `{"data": "table", "field": "x"}`."""
+    name = reference.get('data')
+    if name not in data:
+        raise ValueError('No values for the `{}` dataset of a scale domain'.format(name))
+    fields = reference['fields'] if 'fields' in reference else [reference.get('field')]
+    for field in fields:
+        if not isinstance(field, str):
+            raise ValueError('Scale domains must reference fields by name')
+        for row in data[name]:
+            yield row.get(field)
+
+
+def _domain(definition, data, discrete):
+    domain = _check(definition.get('domain'), 'domain')
+    if isinstance(domain, dict):
+        values = _data_values(domain, data)
+        if discrete:
+            # Distinct values, in the order of their first row unless sorted
+            seen = set()
+            distinct = []
+            for value in values:
+                if value is not None and _key(value) not in seen:
+                    seen.add(_key(value))
+                    distinct.append(value)
+            if domain.get('sort'):
+                distinct.sort(key=lambda value: (not is_number(value), value))
+            domain = distinct
+        else:
+            numbers = [to_number(value) for value in values if not is_nullish(value)]
+            numbers = [value for value in numbers if value == value]
+            domain = [min(numbers), max(numbers)] if numbers else []
+    elif not isinstance(domain, list):
+        raise ValueError('The domain of the `{}` scale must be a list or a data reference'.format(definition.get('name')))
+    return [_check(value, 'domain') for value in domain]
+
+
+def _range(definition, count, width, height):
+    range = _check(definition.get('range'), 'range')
+    if range == 'width' and width is not None:
+        range = [0, width]
+    elif range == 'height' and height is not None:
+        range = [height, 0]
+    elif isinstance(range, dict) and 'step' in range and definition.get('type') in ('band', 'point'):
+        point = definition['type'] == 'point'
+        padding = definition.get('padding', 0)
+        outer = definition.get('paddingOuter', padding)
+        inner = 1 if point else definition.get('paddingInner', padding)
+        range = [0, range['step'] * bandspace(count, inner, outer)]
+    if not isinstance(range, list):
+        raise ValueError('The range of the `{}` scale must be a list, "width" or "height"'.format(definition.get('name')))
+    range = [_check(value, 'range') for value in range]
+    return range[::-1] if definition.get('reverse') else range
+
+
+def parse_scale(definition, data=None, width=None, height=None):
+    """Return the `Scale` of a Vega scale definition.
+
+    Data domains are computed from the rows of the datasets given in `data`, a mapping of dataset names
+    to lists of dicts, and the "width" and "height" ranges from the given sizes.
+    A `ValueError` is raised for the scale types and the properties which are not supported.
+    """
+    type = definition.get('type', 'linear')
+    if type not in _continuous_types and type not in _discrete_types and type not in ('quantize', 'threshold'):
+        raise ValueError('The `{}` scale type is not supported'.format(type))
+    domain = _domain(definition, {} if data is None else data, type in _discrete_types)
+    range = _range(definition, len(domain), width, height)
+
+    if type in _discrete_types:
+        if type == 'ordinal':
+            return OrdinalScale(domain, range, implicit=bool(definition.get('domainImplicit')))
+        point = type == 'point'
+        padding = definition.get('padding', 0)
+        return BandScale(
+            domain, range,
+            padding_inner=1 if point else definition.get('paddingInner', padding),
+            padding_outer=definition.get('paddingOuter', padding),
+            align=definition.get('align', 0.5), round=bool(definition.get('round')), type=type
+        )
+
+    if any(not is_number(value) for value in domain) and type != 'threshold':
+        raise ValueError('The domain of the `{}` scale must be numbers'.format(definition.get('name')))
+    if type == 'threshold':
+        return ThresholdScale(domain, range)
+
+    domain = list(domain)
+    if domain and (definition.get('zero', type in _zero_types) or any(
+            key in definition for key in ('domainMin', 'domainMax', 'domainMid'))):
+        last = len(domain) - 1
+        if definition.get('zero', type in _zero_types):
+            if domain[0] > 0:
+                domain[0] = 0
+            if domain[last] < 0:
+                domain[last] = 0
+        if definition.get('domainMin') is not None:
+            domain[0] = definition['domainMin']
+        if definition.get('domainMax') is not None:
+            domain[last] = definition['domainMax']
+        if definition.get('domainMid') is not None:
+            middle = definition['domainMid']
+            domain.insert(last + 1 if middle > domain[last] else 0 if middle < domain[0] else last, middle)
+
+    nice = definition.get('nice')
+    if nice and len(domain) > 1:
+        if type in ('time', 'utc') or isinstance(nice, (str, dict)):
+            raise ValueError('Nice time scale domains are not supported')
+        if type == 'log':
+            _nice_log(domain, definition.get('base', 10))
+        else:
+            _nice_linear(domain, 10 if nice is True else nice)
+
+    if type == 'quantize':
+        return QuantizeScale(domain, range)
+    if any(not is_number(value) for value in range):
+        raise ValueError('The range of the `{}` scale must be numbers'.format(definition.get('name')))
+    if 'padding' in definition:
+        raise ValueError('The padding of continuous scales is not supported')
+
+    transform = None
+    if type == 'log':
+        transform = _Log(negative=bool(domain) and domain[0] < 0)
+    elif type in ('pow', 'sqrt'):
+        transform = _Pow(0.5 if type == 'sqrt' else definition.get('exponent', 1))
+    elif type == 'symlog':
+        transform = _Symlog(definition.get('constant', 1))
+    return ContinuousScale(
+        type, domain, range, transform, clamp=bool(definition.get('clamp')), round=bool(definition.get('round')))
+
+
+def parse_scales(spec, data=None, width=None, height=None):
+    """Return the mapping of the names of the scales of a Vega spec to their `Scale`.
+
+    `spec` is a Vega spec or a list of scale definitions. Its inline datasets and its width and height are used
+    unless other values are given.
+    """
+    if isinstance(spec, list):
+        spec = {'scales': spec}
+    datasets = dict((dataset['name'], dataset['values']) for dataset in spec.get('data', [])
+                    if isinstance(dataset.get('values'), list))
+    if data is not None:
+        datasets.update(data)
+    width = spec.get('width') if width is None else width
+    height = spec.get('height') if height is None else height
+    return dict((definition['name'], parse_scale(definition, datasets, width, height)) for definition in spec.get('scales', []))
+
+
+# Pan and zoom functions, transforming the domain of a scale
+
+def _pan(domain, delta, transform):
+    start, stop = transform.forward(to_number(domain[0])), transform.forward(to_number(domain[-1]))
+    shift = (stop - start) * to_number(delta)
+    return [transform.backward(start - shift), transform.backward(stop - shift)]
+
+
+def _zoom(domain, anchor, factor, transform):
+    start, stop = transform.forward(to_number(domain[0])), transform.forward(to_number(domain[-1]))
+    anchor = (start + stop) / 2 if is_nullish(anchor) else transform.forward(to_number(anchor))
+    factor = to_number(factor)
+    return [transform.backward(anchor + (start - anchor) * factor), transform.backward(anchor + (stop - anchor) * factor)]
+
+
+def _log_transform(domain):
+    return _Log(negative=to_number(domain[0]) < 0)
+
+
+_pan_zoom_functions = {
+    'panLinear': lambda domain, delta: _pan(domain, delta, _Identity()),
+    'panLog': lambda domain, delta: _pan(domain, delta, _log_transform(domain)),
+    'panPow': lambda domain, delta, exponent: _pan(domain, delta, _Pow(to_number(exponent))),
+    'panSymlog': lambda domain, delta, constant: _pan(domain, delta, _Symlog(to_number(constant))),
+    'zoomLinear': lambda domain, anchor, factor: _zoom(domain, anchor, factor, _Identity()),
+    'zoomLog': lambda domain, anchor, factor: _zoom(domain, anchor, factor, _log_transform(domain)),
+    'zoomPow': lambda domain, anchor, factor, exponent: _zoom(domain, anchor, factor, _Pow(to_number(exponent))),
+    'zoomSymlog': lambda domain, anchor, factor, constant: _zoom(domain, anchor, factor, _Symlog(to_number(constant))),
+}
+
+
+class _ScaleFunctions(object):
+    """Implementations of the scale functions looking up scales by name, which can be pickled with the scales."""
+
+    def __init__(self, scales):
+        self.scales = scales
+
+    def scale(self, name, value, group=undefined):
+        scale = self.scales.get(name)
+        return undefined if scale is None else scale(value)
+
+    def invert(self, name, value, group=undefined):
+        scale = self.scales.get(name)
+        return undefined if scale is None else scale.invert(value)
+
+    def bandwidth(self, name, group=undefined):
+        scale = self.scales.get(name)
+        return 0 if scale is None else scale.bandwidth()
+
+    def domain(self, name, group=undefined):
+        scale = self.scales.get(name)
+        return [] if scale is None else list(scale.domain)
+
+    def range(self, name, group=undefined):
+        scale = self.scales.get(name)
+        if scale is None:
+            return []
+        return list(scale.extent) if isinstance(scale, BandScale) else list(scale.range)
+
+
+def scale_functions(scales):
+    """Return the implementations of the scale functions to give to the evaluator, given a mapping of names to scales.
+
+    >>> evaluate = compile_expression(expr, functions=scale_functions(parse_scales(spec)))
+    """
+    functions = _ScaleFunctions(scales)
+    implementations = dict(_pan_zoom_functions)
+    implementations.update(
+        scale=functions.scale, invert=functions.invert, bandwidth=functions.bandwidth,
+        domain=functions.domain, range=functions.range, bandspace=bandspace,
+    )
+    return implementations
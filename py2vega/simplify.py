@@ -0,0 +1,193 @@
+"""Compile-time simplification of translated expressions using the value domains declared on the whitelist.
+
+`Variable` instances may declare the range of their numbers or the values they take. Conditions that are
+always true or always false over these domains are then known at translation time, and branches that
+are never taken, guards that always pass, validity checks and clamps that never apply are removed.
+"""
+
+import copy
+
+from .evaluator import vega_function_implementations
+from .expression import Call, Conditional, Identifier, Index, Literal, Logical, Member, Parameter
+from .inference import variable_type
+from .javascript import less_equal, less_than, loose_equals, property_key, strict_equals
+from .intervals import Interval, IntervalAnalysis, any_number, join, point, truth_interval
+
+# Comparisons of values taken from finite domains, which are computed for every pair of values
+_comparisons = {
+    '==': loose_equals, '!=': lambda a, b: not loose_equals(a, b),
+    '===': strict_equals, '!==': lambda a, b: not strict_equals(a, b),
+    '<': less_than, '<=': less_equal, '>': lambda a, b: less_than(b, a), '>=': lambda a, b: less_equal(b, a),
+}
+
+_type_checks = frozenset(['isArray', 'isBoolean', 'isDefined', 'isNumber', 'isString', 'isValid', 'isNaN', 'isFinite'])
+
+# Largest number of pairs of values compared
+_max_pairs = 1024
+
+
+def domain_interval(variable):
+    """Return the `Interval` of the values of a whitelisted `Variable`, or None if unknown or if it may be null."""
+    declared = variable_type(variable)
+    if declared is None or declared.nullable:
+        return None
+    if variable.range is not None:
+        return Interval(float(variable.range[0]), float(variable.range[1]), False, False)
+    if variable.values is not None:
+        result = None
+        for idx, value in enumerate(variable.values):
+            interval = point(value)
+            result = interval if idx == 0 else join(result, interval)
+            if result is None:
+                return None
+        return result
+    if declared.kind == 'boolean':
+        return Interval(0.0, 1.0, False, True)
+    if declared.kind == 'number':
+        return any_number
+    return None
+
+
+class _DomainAnalysis(IntervalAnalysis):
+    """Interval analysis of an expression whose variables take values in their declared domains."""
+
+    def __init__(self, types):
+        super(_DomainAnalysis, self).__init__({}, {}, None)
+        self.types = types
+
+    def candidates(self, expr):
+        """Return the list of the values an expression may take, if it is a literal or a variable with enumerated values."""
+        if isinstance(expr, Literal) and (expr.value is None or isinstance(expr.value, (bool, int, float, str))):
+            return [expr.value]
+        if isinstance(expr, (Identifier, Member)):
+            variable = self.types.variable(expr)
+            if variable is not None and variable.values is not None:
+                return list(variable.values)
+        return None
+
+    def _interval(self, expr):
+        variable = self.types.variable(expr)
+        if variable is not None:
+            return domain_interval(variable)
+        return super(_DomainAnalysis, self)._interval(expr)
+
+    def _binary(self, expr):
+        if expr.operator in _comparisons:
+            left = self.candidates(expr.left)
+            right = self.candidates(expr.right)
+            if left is not None and right is not None and len(left) * len(right) <= _max_pairs:
+                compare = _comparisons[expr.operator]
+                return truth_interval(_same(compare(a, b) for a in left for b in right))
+        return super(_DomainAnalysis, self)._binary(expr)
+
+    def _call(self, expr):
+        if len(expr.arguments) == 1 and expr.callee in _type_checks:
+            values = self.candidates(expr.arguments[0])
+            if values is not None:
+                check = vega_function_implementations[expr.callee]
+                return truth_interval(_same(bool(check(value)) for value in values))
+
+        if expr.callee == 'indexof' and len(expr.arguments) == 2 and isinstance(expr.arguments[0], Literal) and \
+                isinstance(expr.arguments[0].value, (list, tuple)):
+            values = self.candidates(expr.arguments[1])
+            if values is not None:
+                indices = [float(vega_function_implementations['indexof'](list(expr.arguments[0].value), value))
+                           for value in values]
+                return Interval(min(indices), max(indices), False, False)
+
+        return super(_DomainAnalysis, self)._call(expr)
+
+    def _lookup(self, index, expected):
+        values = self.candidates(index.index)
+        if values is not None and isinstance(index.object, Literal) and isinstance(index.object.value, dict) and \
+                isinstance(expected, Literal) and expected.value == 1 and not isinstance(expected.value, bool):
+            table = index.object.value
+            return _same(
+                value is not None and strict_equals(table.get(property_key(value)), 1) for value in values)
+        return super(_DomainAnalysis, self)._lookup(index, expected)
+
+
+def _same(results):
+    """Return the result if all the results are the same, None otherwise."""
+    results = set(results)
+    return results.pop() if len(results) == 1 else None
+
+
+def _is_boolean(interval):
+    return interval is not None and interval.boolean
+
+
+def _is_atomic(expr):
+    return isinstance(expr, (Literal, Identifier, Parameter, Member, Index, Call)) or \
+        isinstance(expr, Conditional) and expr.function
+
+
+def _lifted(child):
+    """Return a child node taking the place of its parent, parenthesized unless it is a single term."""
+    if child.parens or _is_atomic(child):
+        return child
+    child = copy.copy(child)
+    child.parens = True
+    return child
+
+
+class _Simplifier(object):
+    def __init__(self, types):
+        self.analysis = _DomainAnalysis(types)
+        self._memo = {}
+
+    def simplify(self, expr):
+        memo = self._memo.get(id(expr))
+        if memo is None:
+            memo = self._memo[id(expr)] = (expr, self._simplify(expr))
+        return memo[1]
+
+    def _simplify(self, expr):
+        analysis = self.analysis
+        if not isinstance(expr, Literal):
+            interval = analysis.interval(expr)
+            if interval is not None and interval.boolean and interval.low == interval.high:
+                # Conditions which are always true or always false
+                return Literal(interval.low == 1)
+
+        if isinstance(expr, Conditional):
+            test = analysis.truth(expr.test)
+            if test is not None:
+                return _lifted(self.simplify(expr.consequent if test else expr.alternate))
+
+        if isinstance(expr, Logical):
+            # Operands which are never the value of the chain are dropped, `a && b` being `b` if `a` is truthy
+            operands = []
+            for idx, operand in enumerate(expr.operands):
+                truth = analysis.truth(operand)
+                if idx < len(expr.operands) - 1 and truth is (expr.operator == '&&'):
+                    continue
+                operands.append((operand, self.simplify(operand)))
+                if truth is (expr.operator == '||'):
+                    break
+            # `a && true` and `a || false` are `a` if `a` is a boolean
+            neutral = point(expr.operator == '&&')
+            while len(operands) > 1 and analysis.interval(operands[-1][0]) == neutral and \
+                    all(_is_boolean(analysis.interval(operand)) for operand, _ in operands[:-1]):
+                operands.pop()
+            operands = [simplified for _, simplified in operands]
+            if len(operands) == 1:
+                return _lifted(operands[0])
+            if len(operands) < len(expr.operands):
+                simplified = Logical(expr.operator, operands, parens=expr.parens)
+                simplified.location = expr.location
+                return simplified
+
+        if isinstance(expr, Call) and expr.callee == 'clamp' and len(expr.arguments) == 3:
+            value, lower, upper = [analysis.interval(arg) for arg in expr.arguments]
+            # Clamping numbers which are already in the bounds, NaN being left unchanged by clamp as well
+            if value is not None and lower is not None and upper is not None and not value.boolean and \
+                    not lower.nan and not upper.nan and lower.high <= value.low and value.high <= upper.low:
+                return _lifted(self.simplify(expr.arguments[0]))
+
+        return expr.with_children([self.simplify(child) for child in expr.children()])
+
+
+def simplify(expr, types):
+    """Simplify a translated expression using the domains of the variables, given the `TypeInference` of its translation."""
+    return _Simplifier(types).simplify(expr)
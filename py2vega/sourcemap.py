@@ -0,0 +1,71 @@
+"""Source maps linking the emitted Vega expressions to the Python code they were translated from."""
+
+from collections import namedtuple
+
+SourceSpan = namedtuple('SourceSpan', ['start', 'end', 'line', 'column'])
+SourceSpan.__doc__ = """Span of an emitted Vega expression translated from a given Python node.
+
+start, end: character offsets of the span in the Vega expression, `end` being excluded
+line, column: line and column offset of the Python node, as given by the `ast` module
+"""
+
+
+class SourceMap(object):
+    """Spans of an emitted Vega expression, with the location of the Python code each of them comes from.
+
+    Spans are ordered by start offset, a span coming before the spans it contains.
+    """
+
+    def __init__(self, spans):
+        self.spans = spans
+
+    def lookup(self, offset):
+        """Return the innermost span containing the given offset of the Vega expression, or None."""
+        result = None
+        for span in self.spans:
+            if span.start > offset:
+                break
+            if offset < span.end:
+                result = span
+        return result
+
+    def __iter__(self):
+        return iter(self.spans)
+
+    def __len__(self):
+        return len(self.spans)
+
+
+class _MappedOutput(list):
+    """Output list keeping track of the offset of the emitted pieces of each node."""
+
+    def __init__(self):
+        super(_MappedOutput, self).__init__()
+        self.position = 0
+        self.spans = []
+        self._open = []
+
+    def append(self, piece):
+        super(_MappedOutput, self).append(piece)
+        self.position += len(piece)
+
+    def enter(self, node):
+        if node.location is None:
+            self._open.append(None)
+        else:
+            # The span is recorded when the node is entered so that spans are ordered, its end is known on exit
+            self._open.append((len(self.spans), self.position))
+            self.spans.append(None)
+
+    def exit(self, node):
+        opened = self._open.pop()
+        if opened is not None:
+            idx, start = opened
+            self.spans[idx] = SourceSpan(start, self.position, node.location[0], node.location[1])
+
+
+def emit_with_source_map(expr):
+    """Turn a translated expression into its Vega-expression string and its `SourceMap`."""
+    out = _MappedOutput()
+    expr.write(out)
+    return ''.join(out), SourceMap(out.spans)
@@ -0,0 +1,71 @@
+"""Parameterized Vega-expression templates."""
+
+from .expression import Parameter, format_literal
+from .main import Translator
+
+
+class ExpressionTemplate(object):
+    """Vega expression translated once, with parameters substituted by literal values afterwards.
+
+    The expression is translated and emitted once, parameters being left as slots in the emitted string.
+    Instantiating the template then only formats the parameter values and fills the slots in, negative
+    numbers being parenthesized.
+
+    Parameter values are not known at translation time, so they are not checked or optimized like literals:
+    e.g. a `regexp` pattern given as a parameter is not validated nor turned into a regexp literal, and an
+    `in` test against a list parameter is not turned into a lookup.
+
+    >>> template = ExpressionTemplate('color if value > threshold else "grey"', ['threshold', 'color'], ['value'])
+    >>> template.instantiate(3, 'red')
+    "((value > 3) ? 'red' : 'grey')"
+    """
+
+    def __init__(self, value, parameters, whitelist=()):
+        """Construct an ExpressionTemplate, given Python code or a Python function and the names of its parameters."""
+        self.parameters = tuple(parameters)
+
+        out = []
+        Translator(whitelist).translate_expression(value, parameters=frozenset(self.parameters)).write(out)
+
+        positions = dict((name, idx) for idx, name in enumerate(self.parameters))
+        pieces = []
+        for piece in out:
+            if isinstance(piece, Parameter):
+                pieces.append('{{{}}}'.format(positions[piece.name]))
+            else:
+                pieces.append(piece.replace('{', '{{').replace('}', '}}'))
+        self._format = ''.join(pieces).format
+
+    def instantiate(self, *args, **kwargs):
+        """Return the Vega expression for the given parameter values, given positionally or by name."""
+        if kwargs:
+            unknown = [name for name in kwargs if name not in self.parameters[len(args):]]
+            if unknown:
+                raise TypeError('Unexpected or duplicate template parameters {}'.format(sorted(unknown)))
+            missing = [name for name in self.parameters[len(args):] if name not in kwargs]
+            if missing:
+                raise TypeError('Missing template parameters {}'.format(missing))
+            args = args + tuple(kwargs[name] for name in self.parameters[len(args):])
+        if len(args) != len(self.parameters):
+            raise TypeError('The template expects {} parameters {}, {} were given'.format(
+                len(self.parameters), list(self.parameters), len(args)))
+
+        return self._format(*[_format_parameter(arg) for arg in args])
+
+    def instantiate_many(self, rows):
+        """Return the Vega expressions for a sequence of parameter value tuples."""
+        fmt = self._format
+        size = len(self.parameters)
+        results = []
+        for row in rows:
+            if len(row) != size:
+                raise TypeError('The template expects {} parameters {}, {} were given'.format(
+                    size, list(self.parameters), len(row)))
+            results.append(fmt(*[_format_parameter(arg) for arg in row]))
+        return results
+
+
+def _format_parameter(value):
+    """Format a parameter value, parenthesized if it is negative so that it stays one operand, e.g. in `x - -1`."""
+    text = format_literal(value)
+    return '({})'.format(text) if text.startswith('-') else text
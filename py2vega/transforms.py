@@ -0,0 +1,382 @@
+"""Vega transforms computed from translated expressions."""
+
+import copy
+
+from .analysis import StructureTable, is_safe
+from .constants import constants
+from .cost import CostModel
+from .expression import Call, Conditional, Expression, Identifier, Index, Literal, Logical, Member, Parameter, emit, replace_nodes
+from .interning import InternTable
+from .main import Translator
+
+# Vega functions that may return a different value each time they are called
+volatile_functions = frozenset(['now', 'random'])
+
+
+def _translate_all(expressions, whitelist):
+    """Translate a list or dict of Python code, Python functions or translated expressions."""
+    translator = None
+    interned = InternTable()
+    keys = list(expressions) if isinstance(expressions, dict) else None
+    values = [expressions[key] for key in keys] if keys is not None else list(expressions)
+
+    translated = []
+    for value in values:
+        if not isinstance(value, Expression):
+            if translator is None:
+                translator = Translator(whitelist)
+            value = translator.translate_expression(value, interned=interned)
+        translated.append(value)
+
+    return keys, translated
+
+
+def _topological_order(roots):
+    """Return the distinct nodes reachable from the roots, every node coming before its children."""
+    order = []
+    visited = set()
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if id(node) in visited:
+                continue
+            visited.add(id(node))
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children())
+    order.reverse()
+    return order
+
+
+def _conditional_children(node):
+    """Return the ids of the children of a node that are not always evaluated when the node is."""
+    if isinstance(node, Conditional):
+        return set([id(node.consequent), id(node.alternate)]) - set([id(node.test)])
+    if isinstance(node, Logical):
+        return set(id(operand) for operand in node.operands[1:]) - set([id(node.operands[0])])
+    return ()
+
+
+class _Occurrences(object):
+    """Count how many times each structure is evaluated per datum over a set of root expressions."""
+
+    def __init__(self, roots, structures):
+        self.counts = {}
+        self.conditional = {}
+        self.nodes = {}
+
+        order = _topological_order(roots)
+        evaluations = dict((id(node), 0) for node in order)
+        conditional = dict((id(node), 0) for node in order)
+        for root in roots:
+            evaluations[id(root)] += 1
+
+        # Nodes come before their children, the number of paths to a node is then known when it is reached
+        for node in order:
+            lazy = _conditional_children(node)
+            for child in node.children():
+                evaluations[id(child)] += evaluations[id(node)]
+                conditional[id(child)] += evaluations[id(node)] if id(child) in lazy else conditional[id(node)]
+
+            number = structures.number(node)
+            self.counts[number] = self.counts.get(number, 0) + evaluations[id(node)]
+            self.conditional[number] = self.conditional.get(number, 0) + conditional[id(node)]
+            self.nodes.setdefault(number, node)
+
+
+class _Shareability(object):
+    """Tell which subexpressions may be computed once per datum into a field."""
+
+    def __init__(self, datum):
+        self.datum = datum
+        self._memo = {}
+
+    def __call__(self, expr):
+        """Return (pure, uses_datum) for an expression."""
+        memo = self._memo.get(id(expr))
+        if memo is not None:
+            return memo[1]
+
+        if isinstance(expr, Identifier):
+            result = (expr.name == self.datum or expr.name in constants, expr.name == self.datum)
+        elif isinstance(expr, Parameter):
+            result = (False, False)
+        else:
+            pure = not (isinstance(expr, Call) and expr.callee in volatile_functions)
+            uses_datum = False
+            for child in expr.children():
+                child_pure, child_uses_datum = self(child)
+                pure = pure and child_pure
+                uses_datum = uses_datum or child_uses_datum
+            result = (pure, uses_datum)
+
+        self._memo[id(expr)] = (expr, result)
+        return result
+
+
+def _is_field_access(expr):
+    """Return True if the expression is a variable or a member of a variable, which is not worth a formula."""
+    return isinstance(expr, (Identifier, Literal)) or isinstance(expr, Member) and isinstance(expr.object, Identifier)
+
+
+def _without_parens(expr):
+    if not expr.parens:
+        return expr
+    expr = copy.copy(expr)
+    expr.parens = False
+    return expr
+
+
+def _share(roots, formulas, prefix, min_uses, min_cost, datum):
+    """Move the shared subexpressions of the roots and of the formulas into new formulas."""
+    model = CostModel()
+    shareability = _Shareability(datum)
+
+    while True:
+        structures = StructureTable()
+        occurrences = _Occurrences(roots + [expr for _, expr in formulas], structures)
+
+        best = None
+        for number, node in occurrences.nodes.items():
+            uses = occurrences.counts[number]
+            if uses < min_uses or _is_field_access(node):
+                continue
+            cost = model.measure(node).cost
+            if cost < min_cost or shareability(node) != (True, True):
+                continue
+            if occurrences.conditional[number] and not is_safe(node):
+                continue
+            saving = (uses - 1) * cost
+            if best is None or saving > best[0]:
+                best = (saving, number, node)
+
+        if best is None:
+            return roots, formulas
+
+        _, number, node = best
+        field = '{}{}'.format(prefix, len(formulas))
+        reference = Member(Identifier(datum), field)
+
+        def replacement(expr):
+            return reference if structures.number(expr) == number else None
+
+        roots = [replace_nodes(root, replacement) for root in roots]
+        formulas = [(name, replace_nodes(expr, replacement)) for name, expr in formulas]
+        formulas.append((field, _without_parens(node)))
+
+
+def share_subexpressions(expressions, whitelist=('datum', ), prefix='_shared', min_uses=2, min_cost=3, datum='datum'):
+    """Compute the subexpressions shared by many expressions of a spec only once per datum.
+
+    The expressions are given as a list or a dict of Python code, Python functions or translated
+    expressions. Pure subexpressions of the datum that are evaluated at least `min_uses` times per datum
+    over all the expressions, and that cost at least `min_cost`, are computed by Vega `formula`
+    transforms into new fields of the datum named after `prefix`. The expressions are rewritten to read
+    these fields instead.
+
+    The expressions are assumed to be evaluated for every datum. A subexpression that may throw (e.g.
+    `datum.a.b`) is then shared only if it is always evaluated, and not e.g. guarded by a condition.
+
+    Return the list of formula transforms, to add to the data, and the rewritten Vega expressions as a
+    list or a dict like the given expressions.
+    """
+    keys, roots = _translate_all(expressions, whitelist)
+    roots, formulas = _share(roots, [], prefix, min_uses, min_cost, datum)
+
+    transforms = _formula_transforms(formulas, datum)
+    results = [emit(root) for root in roots]
+    if keys is not None:
+        return transforms, dict(zip(keys, results))
+    return transforms, results
+
+
+def _lookup_tables(roots, min_size):
+    """Return the `{...}[key]` nodes of the roots indexing a literal dict of at least `min_size` entries, in order of the roots."""
+    return [
+        node for root in roots for node in _topological_order([root])
+        if isinstance(node, Index) and isinstance(node.object, Literal) and
+        isinstance(node.object.value, dict) and len(node.object.value) >= min_size
+    ]
+
+
+def extract_lookups(expressions, whitelist=('datum', ), min_size=50, prefix='_lookup', datum='datum'):
+    """Move the large literal dicts indexed by expressions of a spec into inline datasets.
+
+    Vega builds the object of a literal dict each time it evaluates the expression indexing it.
+    Dicts of at least `min_size` entries indexed per datum (e.g. `{...}[datum.code]`) are instead turned
+    into inline datasets, which are indexed once by Vega `lookup` transforms writing the indexed values
+    into new fields of the datum named after `prefix`. A key that is not a field of the datum is first
+    computed by a `formula` transform. Like for `share_subexpressions`, a key that may throw is not
+    extracted if it is conditionally evaluated. The matched entry is written into the field, and its
+    value read by the expression with `(datum._lookup0 || {}).value`, so that missing keys still give
+    undefined. Unlike in the dict, keys inherited from the Object prototype, like 'constructor', are
+    missing keys too.
+
+    The expressions are given as a list or a dict of Python code, Python functions or translated
+    expressions. Return the list of datasets, the list of transforms to add to the data, and the
+    rewritten Vega expressions as a list or a dict like the given expressions.
+    """
+    keys, roots = _translate_all(expressions, whitelist)
+    structures = StructureTable()
+    occurrences = _Occurrences(roots, structures)
+    shareability = _Shareability(datum)
+
+    datasets = []
+    table_names = {}
+    transforms = []
+    fields = {}
+    for node in _lookup_tables(roots, min_size):
+        number = structures.number(node)
+        key = node.index
+        if number in fields or not shareability(key)[0]:
+            continue
+        if occurrences.conditional[structures.number(key)] and not is_safe(key):
+            continue
+
+        table = structures.number(node.object)
+        if table not in table_names:
+            table_names[table] = '{}_data{}'.format(prefix, len(datasets))
+            datasets.append({
+                'name': table_names[table],
+                'values': [{'key': item, 'value': value} for item, value in node.object.value.items()]
+            })
+
+        field = '{}{}'.format(prefix, len(fields))
+        if isinstance(key, Member) and isinstance(key.object, Identifier) and key.object.name == datum:
+            key_field = key.property
+        else:
+            key_field = '{}_key'.format(field)
+            transforms.append({'type': 'formula', 'expr': emit(_without_parens(key)), 'as': key_field})
+
+        # The matched entry is written, missing keys giving null, its value is then undefined like in the dict
+        transforms.append({'type': 'lookup', 'from': table_names[table], 'key': 'key', 'fields': [key_field], 'as': [field]})
+        fields[number] = Member(Logical('||', [Member(Identifier(datum), field), Literal({})], parens=True), 'value')
+
+    def replacement(expr):
+        return fields.get(structures.number(expr))
+
+    results = [emit(replace_nodes(root, replacement)) for root in roots]
+    if keys is not None:
+        return datasets, transforms, dict(zip(keys, results))
+    return datasets, transforms, results
+
+
+class _Splitter(object):
+    """Move subexpressions of oversized expressions into formulas, until every expression fits the limits."""
+
+    def __init__(self, formulas, prefix, max_length, max_cost, datum):
+        self.formulas = formulas
+        self.prefix = prefix
+        self.max_length = max_length
+        self.max_cost = max_cost
+        self.datum = datum
+        self.model = CostModel()
+        self._memo = {}
+
+    def _exceeded(self, expr):
+        """Return the name of the `ExpressionCost` measure exceeding its limit, or None if the expression fits."""
+        measure = self.model.measure(expr)
+        if self.max_length is not None and measure.length > self.max_length:
+            return 'length'
+        if self.max_cost is not None and measure.cost > self.max_cost:
+            return 'cost'
+        return None
+
+    def split(self, expr, guarded=False):
+        """Return the expression with subexpressions moved into formulas, `guarded` telling if it is conditionally evaluated."""
+        memo = self._memo.get((id(expr), guarded))
+        if memo is not None:
+            return memo[1]
+
+        lazy = _conditional_children(expr)
+        children = [self.split(child, guarded or id(child) in lazy) for child in expr.children()]
+        result = expr.with_children(children)
+
+        exceeded = self._exceeded(result)
+        while exceeded is not None:
+            reference = Member(Identifier(self.datum), '{}{}'.format(self.prefix, len(self.formulas)))
+            saved = getattr(self.model.measure(reference), exceeded)
+            # Moving a subexpression must save more than the field access costs, and it is then evaluated
+            # for every datum, so it must not throw if it was guarded
+            candidates = [
+                child for original, child in zip(expr.children(), result.children())
+                if getattr(self.model.measure(child), exceeded) > (2 * saved if exceeded == 'length' else saved) and
+                (not (guarded or id(original) in lazy) or is_safe(child))
+            ]
+            if not candidates:
+                break
+
+            largest = max(candidates, key=lambda child: getattr(self.model.measure(child), exceeded))
+            self.formulas.append((reference.property, _without_parens(largest)))
+            result = result.with_children([reference if child is largest else child for child in result.children()])
+            exceeded = self._exceeded(result)
+
+        self._memo[(id(expr), guarded)] = (expr, result)
+        return result
+
+
+def py2vega_formulas(value, field, whitelist=('datum', ), max_length=None, max_cost=None, prefix=None, min_cost=3, datum='datum'):
+    """Convert Python code or Python function to a pipeline of Vega `formula` transforms computing the `field` of the datum.
+
+    Subexpressions that are evaluated more than once and that cost at least `min_cost` are computed once
+    in their own formula. Subexpressions are then moved into formulas, largest first, until the expression
+    of every formula is at most `max_length` characters long and costs at most `max_cost`. Subexpressions
+    that may throw and that are conditionally evaluated are never moved, the limits are then not always met.
+
+    Intermediate fields are named after `prefix`, which defaults to `_<field>_`. Return the list of
+    formula transforms, the last one computing `field`.
+    """
+    if prefix is None:
+        prefix = '_{}_'.format(field)
+
+    expr = value if isinstance(value, Expression) else Translator(whitelist).translate_expression(value)
+    roots, formulas = _share([expr], [], prefix, 2, min_cost, datum)
+
+    splitter = _Splitter(formulas, prefix, max_length, max_cost, datum)
+    if max_length is not None or max_cost is not None:
+        for idx in range(len(formulas)):
+            name, formula = formulas[idx]
+            formulas[idx] = (name, splitter.split(formula))
+        roots = [splitter.split(roots[0])]
+
+    # Intermediates reading the field read its value before the last formula computes it
+    transforms = _formula_transforms(formulas, datum)
+    transforms.append({'type': 'formula', 'expr': emit(_without_parens(roots[0])), 'as': field})
+    return transforms
+
+
+def _formula_transforms(formulas, datum):
+    return [
+        {'type': 'formula', 'expr': emit(expr), 'as': name}
+        for name, expr in _dependency_order(formulas, datum)
+    ]
+
+
+def _dependency_order(formulas, datum):
+    """Order the formulas so that each formula comes after the formulas whose field it reads.
+
+    A formula reading its own field reads the value it overwrites. A `ValueError` is raised if formulas
+    read the fields of each other in a cycle.
+    """
+    names = set(name for name, _ in formulas)
+    dependencies = {}
+    for name, expr in formulas:
+        dependencies[name] = set(
+            node.property for node in _topological_order([expr])
+            if isinstance(node, Member) and isinstance(node.object, Identifier) and node.object.name == datum and node.property in names
+        )
+        dependencies[name].discard(name)
+
+    ordered = []
+    done = set()
+    while len(ordered) < len(formulas):
+        ready = [(name, expr) for name, expr in formulas if name not in done and dependencies[name] <= done]
+        if not ready:
+            cycle = sorted(name for name, _ in formulas if name not in done)
+            raise ValueError('The formulas of the {} fields depend on each other'.format(', '.join(cycle)))
+        ordered.append(ready[0])
+        done.add(ready[0][0])
+    return ordered
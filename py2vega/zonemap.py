@@ -0,0 +1,95 @@
+"""Zone maps: skipping chunks of rows using the minimum and maximum values of their columns.
+
+The interval of values of each node of a translated expression is computed from the intervals of the
+columns over a chunk of rows, which decides whether a filter is always false, always true, or may be
+either for the rows of the chunk.
+"""
+
+from .columns import default_chunk_size, read_chunk
+from .intervals import Interval, IntervalAnalysis, not_a_number
+
+# Integers beyond this magnitude are not exactly converted to floats
+_max_exact_integer = 2 ** 53
+
+
+def predicate_outcome(expr, statistics, variables=None, datum='datum'):
+    """Return whether a translated predicate is always truthy, always falsy, or None if unknown over a chunk of rows.
+
+    `statistics` maps the fields of the datum to the `Interval` of their values over the chunk, and
+    `variables` the other variables to their values. Fields without interval may take any value.
+    """
+    return IntervalAnalysis(statistics, {} if variables is None else variables, datum).truth(expr)
+
+
+def column_interval(column, start, stop):
+    """Return the `Interval` of the values of the rows `start` to `stop` of a column, or None if not only numbers or booleans."""
+    dtype = getattr(column, 'dtype', None)
+    if dtype is not None and getattr(dtype, 'kind', None) in ('b', 'i', 'u', 'f'):
+        chunk = column[start:stop]
+        if dtype.kind == 'b':
+            return Interval(float(chunk.min()), float(chunk.max()), False, True)
+        if dtype.kind == 'f':
+            import numpy
+
+            nan = bool(numpy.isnan(chunk).any())
+            if nan:
+                chunk = chunk[~numpy.isnan(chunk)]
+            if not len(chunk):
+                return not_a_number
+            return Interval(float(chunk.min()), float(chunk.max()), nan, False)
+        low = int(chunk.min())
+        high = int(chunk.max())
+        if low < -_max_exact_integer or high > _max_exact_integer:
+            return None
+        return Interval(float(low), float(high), False, False)
+
+    values = read_chunk(column, start, stop)
+    if values and all(isinstance(value, bool) for value in values):
+        return Interval(float(min(values)), float(max(values)), False, True)
+    if any(isinstance(value, bool) or not isinstance(value, (int, float)) or
+           isinstance(value, int) and abs(value) > _max_exact_integer for value in values):
+        # Nulls, strings and other values
+        return None
+    numbers = [float(value) for value in values if value == value]
+    if not numbers:
+        return not_a_number
+    return Interval(min(numbers), max(numbers), len(numbers) < len(values), False)
+
+
+class ZoneMap(object):
+    """Intervals of the values of columns over each chunk of `chunk_size` rows."""
+
+    def __init__(self, chunk_size, length, zones):
+        """Construct a ZoneMap, given the number of rows and one mapping of field names to `Interval` per chunk."""
+        self.chunk_size = chunk_size
+        self.length = length
+        self.zones = zones
+
+    def chunks(self, start=0, stop=None):
+        """Yield the start, stop and statistics of the chunks of rows overlapping the rows `start` to `stop`."""
+        stop = self.length if stop is None else min(stop, self.length)
+        for idx in range(start // self.chunk_size, len(self.zones)):
+            chunk_start = max(start, idx * self.chunk_size)
+            chunk_stop = min(stop, (idx + 1) * self.chunk_size)
+            if chunk_start >= chunk_stop:
+                break
+            yield chunk_start, chunk_stop, self.zones[idx]
+
+
+def build_zone_map(columns, chunk_size=default_chunk_size):
+    """Compute the zone map of columns, which can be kept and reused by all the filters run on them."""
+    lengths = set(len(column) for column in columns.values())
+    if len(lengths) > 1:
+        raise ValueError('All the columns must have the same number of rows')
+    length = lengths.pop() if lengths else 0
+
+    zones = []
+    for start in range(0, length, chunk_size):
+        stop = min(start + chunk_size, length)
+        zone = {}
+        for name, column in columns.items():
+            interval = column_interval(column, start, stop)
+            if interval is not None:
+                zone[name] = interval
+        zones.append(zone)
+    return ZoneMap(chunk_size, length, zones)
@@ -0,0 +1,70 @@
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.artifact import MAGIC, dump_expression, dump_expressions, load_expression, load_expressions
+from py2vega.expression import emit
+
+translator = Translator(['value', Variable('datum', ['a', 'b', 'name'])])
+
+
+def artifact_func(value):
+    label = upper(trim(datum.name))  # noqa
+    if value > 3:
+        return label + '!'
+    elif value < -12345678901234567890:
+        return {'key': [1, 2.5, None, True], 'other': label}
+    else:
+        return regexp('a+b', 'gi') if value else [datum.a, {'x': datum['b']}][0]  # noqa
+
+
+def same_nodes(first, second):
+    stack = [(first, second)]
+    while stack:
+        first, second = stack.pop()
+        if type(first) is not type(second) or first.parens != second.parens or first.location != second.location:
+            return False
+        stack.extend(zip(first.children(), second.children()))
+    return True
+
+
+def test_round_trip():
+    expressions = [
+        translator.translate_expression(artifact_func),
+        translator.translate_expression('datum.a / -0.0 if isNaN(datum.b) else {"x": 1.0, "y": NaN}[datum.name]'),
+        translator.translate_expression('not (datum.a and datum.b or value in [1, 2, 3])'),
+    ]
+    data = dump_expressions(expressions)
+    assert data.startswith(MAGIC)
+
+    loaded = load_expressions(data)
+    assert [emit(expr) for expr in loaded] == [emit(expr) for expr in expressions]
+    assert all(same_nodes(expr, other) for expr, other in zip(loaded, expressions))
+
+    # The label is shared by the branches of the function, and stays shared
+    conditional = loaded[0]
+    assert conditional.consequent.left is conditional.alternate.consequent.properties[1][1]
+
+
+def test_compact():
+    expr = translator.translate_expression('datum.a + datum.a * datum.a - datum.a')
+    data = dump_expression(expr, locations=False)
+    # The name and the member access are stored once
+    assert data.count(b'datum') == 1
+    assert len(data) < len(emit(expr)) < len(dump_expression(expr))
+
+    loaded = load_expression(data)
+    assert emit(loaded) == emit(expr)
+    assert loaded.right is loaded.left.left
+    assert loaded.location is None
+
+
+def test_invalid_artifact():
+    data = dump_expression(translator.translate_expression('datum.a + 1'))
+    with pytest.raises(ValueError):
+        load_expression(b'{"expr": "datum.a + 1"}')
+    with pytest.raises(ValueError):
+        load_expression(data[:-3])
+    with pytest.raises(ValueError):
+        load_expression(MAGIC + b'\x63' + data[len(MAGIC) + 1:])
+    with pytest.raises(ValueError):
+        load_expression(dump_expressions([]))
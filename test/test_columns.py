@@ -0,0 +1,42 @@
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.columns import ChunkedEvaluator, datum_fields, evaluate_chunks, filter_rows, memory_map_columns
+from py2vega.javascript import undefined
+
+translator = Translator([Variable('datum', ['a', 'b', 'name'])])
+
+
+def test_datum_fields():
+    assert datum_fields(translator.translate_expression('datum.a + datum["b"] if datum.a > 1 else datum.a')) == set(['a', 'b'])
+    assert datum_fields(translator.translate_expression('isObject(datum)')) is None
+
+
+def test_evaluate_chunks():
+    columns = {'a': list(range(10)), 'name': ['x', 'y'] * 5, 'unused': [None] * 10}
+    expr = translator.translate_expression('datum.a * 2 if datum.name == "x" else datum.b')
+
+    chunks = list(evaluate_chunks(expr, columns, chunk_size=4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert sum(chunks, []) == [0, undefined, 4, undefined, 8, undefined, 12, undefined, 16, undefined]
+
+    evaluator = ChunkedEvaluator(translator.translate_expression('datum.a % 3 == 0'), chunk_size=4)
+    assert evaluator.fields == set(['a'])
+    assert list(evaluator.filter(columns)) == [[0, 3], [6], [9]]
+
+    with pytest.raises(ValueError):
+        list(evaluator.chunks({'a': [1, 2], 'b': [1]}))
+
+
+def test_memory_mapped_columns(tmp_path):
+    numpy = pytest.importorskip('numpy')
+
+    paths = {}
+    for name, values in (('a', numpy.arange(1000, dtype='float64')), ('b', numpy.arange(1000) % 7)):
+        paths[name] = str(tmp_path / '{}.npy'.format(name))
+        numpy.save(paths[name], values)
+
+    columns = memory_map_columns(paths)
+    expr = translator.translate_expression('datum.a > 990 and datum.b == 2')
+    assert sum(filter_rows(expr, columns, chunk_size=100), []) == [996]
+    assert list(evaluate_chunks(translator.translate_expression('datum.a / 2'), columns, chunk_size=600))[1][0] == 300
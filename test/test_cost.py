@@ -0,0 +1,97 @@
+import pytest
+
+from py2vega import py2vega, Translator, Variable
+from py2vega.cost import estimate_cost, Py2VegaBudgetError
+from py2vega.functions import regexp
+from py2vega.functions.math import isNaN
+
+whitelist = ['value', 'x', Variable('cell', ['value', 'x'])]
+
+
+def conditional_func(value, x, cell):
+    a = 3 if isNaN(value) else value
+    if a < 3:
+        return bool(cell.value)
+    elif value[1:] in ('a', 'b'):
+        return {'hello': x, 'there': [1, -2]}['hello']
+    else:
+        return not (a ** 2 > x or value == x)
+
+
+def exploding_func(value):
+    a = value + 1
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    a = a + a
+    return a
+
+
+def regexp_func(value):
+    return regexp.test(regexp.regexp('^[a-z]+$', 'i'), value) and value > 3
+
+
+def test_length():
+    translator = Translator(whitelist)
+
+    for value in [conditional_func, regexp_func, '3 < value <= 4', 'value', '[]', '{}', 'cell.x[0]']:
+        expr = translator.translate_expression(value)
+
+        assert estimate_cost(expr).length == len(translator.translate(value))
+
+
+def test_cost():
+    cost = estimate_cost(Translator(whitelist).translate_expression('value + 3'))
+
+    assert cost.nodes == 3
+    assert cost.depth == 2
+    assert cost.length == len('(value + 3)')
+
+    # Assigned variables are counted each time they are used
+    cost = estimate_cost(Translator(whitelist).translate_expression(exploding_func))
+    assert cost.nodes == 2 ** 31 - 1
+    assert cost.depth == 31
+
+    # Regular expressions are more expensive than comparisons
+    regexp_cost = estimate_cost(Translator(whitelist).translate_expression('test(regexp("a+", "i"), value)'))
+    compare_cost = estimate_cost(Translator(whitelist).translate_expression('value > 3'))
+    assert regexp_cost.cost > compare_cost.cost
+
+
+def test_budget():
+    assert py2vega('value + 3', whitelist, max_length=11) == '(value + 3)'
+
+    with pytest.raises(Py2VegaBudgetError, match='maximum length of 10 characters'):
+        py2vega('value + 3', whitelist, max_length=10)
+
+    with pytest.raises(Py2VegaBudgetError, match='maximum cost of 5'):
+        py2vega(regexp_func, whitelist, max_cost=5)
+
+    # The translation fails before emitting the multi-gigabyte expression
+    with pytest.raises(Py2VegaBudgetError):
+        py2vega(exploding_func, whitelist, max_length=1000000)
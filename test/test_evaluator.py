@@ -0,0 +1,120 @@
+import math
+
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.evaluator import compile_expression, evaluate
+from py2vega.javascript import number_to_string, undefined
+
+whitelist = ['value', 'x', Variable('datum', ['a', 'b', Variable('c', ['d'])])]
+translator = Translator(whitelist)
+
+
+def run(code, **variables):
+    return evaluate(translator.translate_expression(code), variables)
+
+
+def test_number_to_string():
+    assert number_to_string(1) == '1'
+    assert number_to_string(1.0) == '1'
+    assert number_to_string(-1.5) == '-1.5'
+    assert number_to_string(0.1) == '0.1'
+    assert number_to_string(1e21) == '1e+21'
+    assert number_to_string(1e16) == '10000000000000000'
+    assert number_to_string(123456789012345680000.0) == '123456789012345680000'
+    assert number_to_string(1e-7) == '1e-7'
+    assert number_to_string(0.000001) == '0.000001'
+    assert number_to_string(1.5e-10) == '1.5e-10'
+    assert number_to_string(float('nan')) == 'NaN'
+    assert number_to_string(-float('inf')) == '-Infinity'
+
+
+def test_operators():
+    assert run('value + 1', value=2) == 3
+    assert run('value + 1', value='2') == '21'
+    assert run('value - 1', value='2') == 1
+    assert run('value / 0', value=2) == float('inf')
+    assert math.isnan(run('value / 0', value=0))
+    assert run('value % 3', value=-4) == -1
+    assert run('value ** 2', value=3) == 9
+    assert run('value == 1', value='1') is True
+    assert run('value == None', value=undefined) is True
+    assert run('value < x', value='a', x='b') is True
+    assert run('value < x', value=None, x=1) is True
+    assert run('not value', value='') is True
+    assert run('value or x', value=0, x='a') == 'a'
+    assert run('value and x', value=0, x='a') == 0
+    assert run('-value', value='3') == -3
+
+
+def size_func(value):
+    if value > 3:
+        return 'big'
+    elif value > 1:
+        return 'medium'
+    else:
+        return 'small'
+
+
+def test_conditionals():
+    evaluate_func = compile_expression(translator.translate_expression(size_func))
+    assert [evaluate_func({'value': value}) for value in (0, 2, 5)] == ['small', 'medium', 'big']
+
+    assert run('bool(value)', value=None) is False
+    assert run('bool(value)', value='false') is False
+    assert run('bool(value)', value=[]) is True
+
+
+def test_members():
+    assert run('datum.a', datum={'a': 3}) == 3
+    assert run('datum.b', datum={'a': 3}) is undefined
+    assert run('datum.c.d', datum={'c': {'d': 'x'}}) == 'x'
+    assert run('value[1]', value=[1, 2]) == 2
+    assert run('value[5]', value=[1, 2]) is undefined
+    assert run('value[1:]', value='abc') == 'bc'
+    assert run('{"a": 1, 2: "b"}[value]', value=2) == 'b'
+
+    with pytest.raises(TypeError):
+        run('datum.c.d', datum={'c': None})
+
+
+def test_functions():
+    assert run('abs(value)', value=-3) == 3
+    assert run('floor(value)', value='3.7') == 3
+    assert run('round(value)', value=-2.5) == -2
+    assert run('max(value, 3, x)', value=1, x=5) == 5
+    assert math.isnan(run('sqrt(value)', value=-1))
+    assert run('isValid(value)', value=float('nan')) is False
+    assert run('toNumber(value)', value='') is None
+    assert run('str(value)', value=1.0) == '1'
+    assert run('int(value)', value='3.9') == 3
+    assert run('len(value)', value='abc') == 3
+    assert run('lower(value)', value='ABC') == 'abc'
+    assert run('pad(value, 5, "*", "center")', value='ab') == '*ab**'
+    assert run('truncate(value, 4)', value='abcdef') == u'abc…'
+    assert run('parseFloat(value)', value=' 3.5px') == 3.5
+    assert run('parseInt(value)', value='0x1A') == 26
+    assert run('substring(value, 3, 1)', value='abcdef') == 'bc'
+    assert run('split(value, ",")', value='a,b') == ['a', 'b']
+    assert run('replace(value, "a", "b")', value='aaa') == 'baa'
+    assert run('replace(value, regexp("a(.)", "g"), "$1")', value='abac') == 'bc'
+    assert run('test(regexp("^A", "i"), value)', value='abc') is True
+    assert run('inrange(value, [3, 1])', value=2) is True
+    assert run('indexof(value, "b")', value=['a', 'b']) == 1
+    assert run('merge({"a": 1}, value)', value={'a': 2, 'b': 3}) == {'a': 2, 'b': 3}
+    assert run('PI') == math.pi
+
+    with pytest.raises(NotImplementedError):
+        run('now()')
+
+
+def test_membership_lookup():
+    ids = ['id{}'.format(idx) for idx in range(20)] + ['1', 'constructor']
+    numbers = list(range(-10, 10)) + [0.5, 1e16, 1e21]
+
+    for container in (ids, numbers):
+        lookup = compile_expression(translator.translate_expression('value in {}'.format(repr(container))))
+        search = compile_expression(Translator(whitelist, lookup_threshold=None).translate_expression('value in {}'.format(repr(container))))
+
+        for value in ids + numbers + ['toString', '__proto__', 1, 1.0, '-1', True, None, undefined, float('nan')]:
+            assert lookup({'value': value}) == search({'value': value}), value
@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+
+from py2vega import py2vega
+
+
+def test_utc():
+    assert py2vega('utc(2020, 0, 1)') == '1577836800000'
+    assert py2vega('utc(2020, 0, 1, 12, 30, 15, 500)') == '1577881815500'
+    assert py2vega('utc(2020)') == '1577836800000'
+
+    # Fields overflow the way they do in JavaScript
+    assert py2vega('utc(2020, 12, 0, 25)') == py2vega('utc(2021, 0, 1, 1)') == '1609462800000'
+    assert py2vega('utc(2020, -1)') == py2vega('utc(2019, 11)')
+
+    # Two-digit years are in the 20th century
+    assert py2vega('utc(99, 0)') == '915148800000'
+
+    assert py2vega('value < utc(1969, 11, 31, 23, 59, 59, 999)', ['value']) == '(value < -1)'
+
+    # Dates out of range or with non-constant arguments are not folded
+    assert py2vega('utc(300000, 0)') == 'utc(300000, 0)'
+    assert py2vega('utc(value, 0)', ['value']) == 'utc(value, 0)'
+
+
+def test_datetime():
+    # Local times are only folded given a timezone
+    assert py2vega('value < datetime(2020, 0, 1)', ['value']) == '(value < datetime(2020, 0, 1))'
+    assert py2vega('value < datetime(2020, 0, 1)', ['value'], timezone='UTC') == '(value < 1577836800000)'
+    assert py2vega('time(datetime(2020, 0, 1))', timezone=datetime.timezone(datetime.timedelta(hours=-5))) == '1577854800000'
+    assert py2vega('datetime(2020, 0, 2) - datetime(2020, 0, 1)', timezone='UTC') == '(1577923200000 - 1577836800000)'
+
+    # Dates are objects, which are only converted to timestamps by arithmetic, ordering and date functions
+    assert py2vega('datetime(2020, 0, 1)', timezone='UTC') == 'datetime(2020, 0, 1)'
+    assert py2vega('value == datetime(2020, 0, 1)', ['value'], timezone='UTC') == '(value == datetime(2020, 0, 1))'
+    assert py2vega('bool(datetime(1970, 0, 1))', timezone='UTC') == '(isValid(datetime(1970, 0, 1)) ? toBoolean(datetime(1970, 0, 1)) : false)'
+
+
+def test_datetime_dst():
+    pytest.importorskip('zoneinfo')
+    try:
+        py2vega('time(datetime(2020, 0, 1))', timezone='America/New_York')
+    except Exception:
+        pytest.skip('The timezone database is not available')
+
+    assert py2vega('time(datetime(2020, 0, 1))', timezone='America/New_York') == '1577854800000'
+    assert py2vega('time(datetime(2020, 6, 1))', timezone='America/New_York') == '1593576000000'
+
+    # Skipped times are moved forward and repeated times are taken in their first occurrence, like in JavaScript
+    assert py2vega('time(datetime(2021, 2, 14, 2, 30))', timezone='America/New_York') == '1615707000000'
+    assert py2vega('time(datetime(2021, 10, 7, 1, 30))', timezone='America/New_York') == '1636263000000'
+
+    assert py2vega('hours(datetime(2021, 10, 7, 1, 30))', timezone='America/New_York') == '1'
+    assert py2vega('utchours(datetime(2021, 10, 7, 1, 30))', timezone='America/New_York') == '5'
+
+
+def test_extractors():
+    assert py2vega('utcyear(utc(2020, 5, 1))') == '2020'
+    assert py2vega('utcmonth(utc(2020, 5, 1))') == '5'
+    assert py2vega('utcdate(utc(2020, 5, 1))') == '1'
+    assert py2vega('utcday(utc(2020, 0, 1))') == '3'
+    assert py2vega('utcmilliseconds(utc(2020, 0, 1, 0, 0, 0, 42))') == '42'
+    assert py2vega('time(utc(2020, 0, 1))') == '1577836800000'
+
+    # Local time extractors need a timezone
+    assert py2vega('year(utc(2020, 5, 1))') == 'year(1590969600000)'
+    assert py2vega('year(utc(2020, 0, 1))', timezone=datetime.timezone(datetime.timedelta(hours=-5))) == '2019'
+
+
+def test_colors():
+    # Expected strings are the ones of d3-color's `formatRgb`
+    assert py2vega('rgb(255, 0, 0)') == "'rgb(255, 0, 0)'"
+    assert py2vega('rgb(300, -2, 127.5)') == "'rgb(255, 0, 128)'"
+    assert py2vega('rgb(0, 0, 0, 0.5)') == "'rgba(0, 0, 0, 0.5)'"
+    assert py2vega('rgb(0, 0, 0, 2)') == "'rgb(0, 0, 0)'"
+    assert py2vega('rgb(0, 0, 0, -1)') == "'rgba(0, 0, 0, 0)'"
+
+    assert py2vega('hsl(120, 1, 0.5)') == "'rgb(0, 255, 0)'"
+    assert py2vega('hsl(0, 1, 0.5)') == "'rgb(255, 0, 0)'"
+    assert py2vega('hsl(-120, 1, 0.25, 0.3)') == "'rgba(0, 0, 128, 0.3)'"
+    assert py2vega('hsl(480, 0.5, 0.5)') == py2vega('hsl(120, 0.5, 0.5)') == "'rgb(64, 191, 64)'"
+
+    assert py2vega('lab(50, 0, 0)') == "'rgb(119, 119, 119)'"
+    assert py2vega('lab(100, 0, 0)') == "'rgb(255, 255, 255)'"
+    assert py2vega('lab(54.29, 80.81, 69.89)') == "'rgb(255, 0, 0)'"
+
+    assert py2vega('hcl(0, 0, 50)') == "'rgb(119, 119, 119)'"
+    assert py2vega('hcl(0, 0, 0)') == "'rgb(0, 0, 0)'"
+
+    # Colors that are not constant, or that are parsed from strings, are not folded
+    assert py2vega('rgb(value, 0, 0)', ['value']) == 'rgb(value, 0, 0)'
+    assert py2vega('rgb("red")') == 'rgb(\'red\')'
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.evaluator import compile_expression
+from py2vega.fused import FusedEvaluator, FusedUnsupportedError
+
+numpy = pytest.importorskip('numpy')
+
+translator = Translator(['offset', 'threshold', Variable('datum', ['value', 'flag', 'count', 'name'])])
+variables = {'offset': 1, 'threshold': 1.2}
+
+
+def make_columns():
+    columns = {
+        'value': numpy.linspace(-1, 1, 101),
+        'flag': numpy.arange(101) % 3 == 0,
+        'count': numpy.arange(101) % 5 - 2,
+    }
+    columns['value'][::13] = numpy.nan
+    return columns
+
+
+@pytest.mark.parametrize('code', [
+    '(datum.value * 2 + offset) / datum.count > threshold',
+    'datum.value % 0.3 if datum.flag else -datum.value',
+    'round(datum.value * 10) ** 2',
+    'datum.value and datum.count',
+    'not datum.flag or datum.value > 0.5',
+    'isNaN(datum.value / datum.count) and isValid(datum.count)',
+    'min(datum.value, 0.3, datum.count) + clamp(datum.count, -1, 1) + abs(datum.count)',
+    'datum.flag + 1 == 2',
+    'sqrt(datum.value) * PI',
+])
+def test_fused_evaluator(code):
+    columns = make_columns()
+    expr = translator.translate_expression(code)
+    reference = compile_expression(expr)
+    expected = [
+        reference(dict(variables, datum={'value': value, 'flag': flag, 'count': count}))
+        for value, flag, count in zip(columns['value'].tolist(), columns['flag'].tolist(), columns['count'].tolist())
+    ]
+
+    evaluator = FusedEvaluator(expr, block_size=16, variables=variables)
+    results = evaluator.evaluate(columns).tolist()
+    assert all(result == value or math.isnan(result) and math.isnan(value) for result, value in zip(results, expected))
+    assert evaluator.filter(columns).tolist() == [idx for idx, value in enumerate(expected) if value and value == value]
+
+
+def test_fused_unsupported():
+    columns = make_columns()
+    with pytest.raises(FusedUnsupportedError):
+        FusedEvaluator(translator.translate_expression('lower(datum.name)')).evaluate(columns)
+    with pytest.raises(FusedUnsupportedError):
+        FusedEvaluator(translator.translate_expression('datum.value if datum.flag else datum.flag')).evaluate(columns)
+    with pytest.raises(FusedUnsupportedError):
+        FusedEvaluator(translator.translate_expression('datum.value > threshold')).evaluate(columns)
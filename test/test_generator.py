@@ -0,0 +1,35 @@
+import ast
+
+from py2vega import Translator
+from py2vega.generator import ProgramGenerator, default_whitelist, function_modules, generate_source
+
+
+def test_reproducible():
+    assert generate_source(seed=3) == generate_source(seed=3)
+    assert generate_source(seed=3) != generate_source(seed=4)
+
+    generator = ProgramGenerator(seed=3)
+    assert generator.source() == generate_source(seed=3)
+    assert generator.source().startswith('def generated_1():')
+
+
+def test_size():
+    for seed in range(10):
+        body = ast.parse(generate_source(seed=seed, size=7)).body[0].body
+        assert len([node for node in body if isinstance(node, ast.Assign)]) == 7
+
+
+def test_translate_generated():
+    translator = Translator(default_whitelist)
+    called = set()
+    for seed in range(50):
+        func = ProgramGenerator(seed=seed, size=10, depth=3).function()
+        assert translator.translate(func)
+
+        for node in ast.walk(translator.parse_function(func)):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                called.add(node.func.id)
+
+    # Functions of every module are used
+    for _, names in function_modules:
+        assert called & set(names)
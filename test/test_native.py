@@ -0,0 +1,83 @@
+import math
+
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.evaluator import compile_expression
+from py2vega.fused import FusedEvaluator, FusedUnsupportedError
+from py2vega.native import kernel_source, load_kernel_module, numba, vectorized_evaluator
+
+translator = Translator(['offset', 'threshold', Variable('datum', ['value', 'flag', 'count', 'name'])])
+variables = {'offset': 1, 'threshold': 1.2}
+field_kinds = {'value': 'number', 'flag': 'boolean', 'count': 'number'}
+variable_kinds = {'offset': 'number', 'threshold': 'number'}
+
+codes = [
+    '(datum.value * 2 + offset) / datum.count > threshold',
+    'datum.value % 0.3 if datum.flag else -datum.value % datum.count',
+    'pow(datum.value, datum.count) + abs(-datum.count) if datum.flag else round(datum.value * 10)',
+    'datum.value and datum.count',
+    'not datum.flag or datum.value > 0.5',
+    'isNaN(datum.value / datum.count) or isFinite(datum.count / datum.value) and not datum.flag',
+    'min(datum.value, 0.3, offset) + clamp(datum.count, -1, 1) + log(datum.value) + exp(datum.count * 300)',
+    'datum.flag + 1 == 2',
+    'sqrt(datum.value) * PI + sin(datum.value) + acos(datum.count)',
+]
+
+
+def make_rows():
+    rows = []
+    for idx in range(101):
+        value = float('nan') if idx % 13 == 0 else -1 + idx / 50.0
+        rows.append({'value': value, 'flag': idx % 3 == 0, 'count': float(idx % 5 - 2)})
+    return rows
+
+
+def same(result, value):
+    return result == value or math.isnan(result) and math.isnan(value)
+
+
+@pytest.mark.parametrize('code', codes)
+def test_kernel_source(code, tmp_path):
+    expr = translator.translate_expression(code)
+    reference = compile_expression(expr)
+    source, kind, fields, names = kernel_source(expr, field_kinds, variable_kinds)
+    kernel = load_kernel_module(source, str(tmp_path)).kernel
+
+    assert len(list(tmp_path.glob('*.py'))) == 1
+    for row in make_rows():
+        result = kernel(*[row[name] for name in fields] + [variables[name] for name in names])
+        assert same(result, reference(dict(variables, datum=row)))
+
+
+def test_kernel_unsupported():
+    with pytest.raises(FusedUnsupportedError):
+        kernel_source(translator.translate_expression('lower(datum.name)'), field_kinds, variable_kinds)
+    with pytest.raises(FusedUnsupportedError):
+        kernel_source(translator.translate_expression('datum.value if datum.flag else datum.flag'), field_kinds, variable_kinds)
+    with pytest.raises(FusedUnsupportedError):
+        kernel_source(translator.translate_expression('datum.value > threshold'), field_kinds)
+
+
+def test_vectorized_evaluator():
+    expr = translator.translate_expression(codes[0])
+    evaluator = vectorized_evaluator(expr, variables=variables)
+    assert isinstance(evaluator, FusedEvaluator) == (numba is None)
+
+
+def test_native_evaluator(tmp_path):
+    numpy = pytest.importorskip('numpy')
+    pytest.importorskip('numba')
+    from py2vega.native import NativeEvaluator
+
+    rows = make_rows()
+    columns = dict((name, numpy.array([row[name] for row in rows])) for name in field_kinds)
+    for code in codes:
+        expr = translator.translate_expression(code)
+        reference = compile_expression(expr)
+        expected = [reference(dict(variables, datum=row)) for row in rows]
+
+        evaluator = NativeEvaluator(expr, variables=variables, cache_dir=str(tmp_path))
+        results = evaluator.evaluate(columns).tolist()
+        assert all(same(result, value) for result, value in zip(results, expected))
+        assert evaluator.filter(columns).tolist() == [idx for idx, value in enumerate(expected) if value and value == value]
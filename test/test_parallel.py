@@ -0,0 +1,61 @@
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.columns import memory_map_columns
+from py2vega.parallel import ParallelEvaluator, evaluate_parallel, filter_parallel, partition
+from py2vega.zonemap import build_zone_map
+
+translator = Translator([Variable('datum', ['a', 'b'])])
+
+
+def test_partition():
+    assert partition(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert partition(2, 4) == [(0, 1), (1, 2)]
+    assert partition(0, 4) == [(0, 0)]
+
+
+def test_threads():
+    numpy = pytest.importorskip('numpy')
+    from py2vega.fused import FusedUnsupportedError
+
+    columns = {'a': numpy.arange(100), 'b': numpy.arange(100) % 2}
+    expr = translator.translate_expression('datum.a * 2 if datum.b == 0 else -1')
+    results = evaluate_parallel(expr, columns, workers=3, processes=False, chunk_size=7)
+    assert results.tolist() == [idx * 2 if idx % 2 == 0 else -1 for idx in range(100)]
+
+    expr = translator.translate_expression('datum.a % 10 == 0')
+    assert filter_parallel(expr, columns, workers=4, processes=False).tolist() == list(range(0, 100, 10))
+
+    expr = translator.translate_expression('datum.a > 45 and datum.a % 10 == 0')
+    with ParallelEvaluator(expr, workers=3, processes=False, chunk_size=7) as evaluator:
+        assert evaluator.filter(columns, zone_map=build_zone_map(columns, 20)).tolist() == list(range(50, 100, 10))
+        assert evaluator.filter(columns).tolist() == list(range(50, 100, 10))
+
+    with pytest.raises(ValueError):
+        ParallelEvaluator(expr, workers=2).filter(columns)
+    with pytest.raises(FusedUnsupportedError):
+        expr = translator.translate_expression('datum.a if datum.b == "x" else -1')
+        evaluate_parallel(expr, {'a': numpy.arange(4), 'b': numpy.array(['x', 'y'] * 2)}, processes=False)
+
+
+def test_processes(tmp_path):
+    numpy = pytest.importorskip('numpy')
+
+    paths = {}
+    for name, values in (('a', numpy.arange(10000)), ('b', numpy.arange(10000) % 3), ('c', numpy.array(['x', 'y'] * 5000))):
+        paths[name] = str(tmp_path / '{}.npy'.format(name))
+        numpy.save(paths[name], values)
+
+    expr = translator.translate_expression('datum.a % 1000 == 0 and datum.b == 1')
+    assert filter_parallel(expr, paths, workers=2, chunk_size=1000).tolist() == [1000, 4000, 7000]
+    zone_map = build_zone_map(memory_map_columns(paths), 1000)
+    with ParallelEvaluator(expr, workers=2) as evaluator:
+        assert evaluator.filter(paths, zone_map=zone_map).tolist() == [1000, 4000, 7000]
+        assert evaluator.filter(paths).tolist() == [1000, 4000, 7000]
+    assert evaluate_parallel(translator.translate_expression('datum.a + datum.b'), paths, workers=3)[9999] == 9999
+
+    translator_c = Translator([Variable('datum', ['a', 'c'])])
+    expr = translator_c.translate_expression('datum.c + datum.a if datum.a < 2 else datum.a')
+    assert evaluate_parallel(expr, paths, workers=2)[:3].tolist() == ['x0', 'y1', 2]
+    expr = translator_c.translate_expression('datum.c == "y" and datum.a % 2000 == 1')
+    assert filter_parallel(expr, paths, workers=2).tolist() == [1, 2001, 4001, 6001, 8001]
@@ -0,0 +1,62 @@
+from py2vega import Variable
+from py2vega.predicates import field_name, py2vega_predicate
+from py2vega.expression import Identifier, Index, Literal, Member
+
+whitelist = [Variable('datum', [Variable('name', type='string?'), 'category', Variable('count', type='number'), Variable('size', type='number?', range=(0, 10)), Variable('position', ['x'])])]
+
+
+def filter_func(datum, isValid):
+    low = 10
+    return isValid(datum.size) and low <= datum.count <= 20 and datum.category in ['a', 'b']
+
+
+def test_field_predicates():
+    assert py2vega_predicate('datum.name == "foo"', whitelist) == {'field': 'name', 'equal': 'foo'}
+    assert py2vega_predicate('datum.name != "foo"', whitelist) == {'not': {'field': 'name', 'equal': 'foo'}}
+    assert py2vega_predicate('3 < datum.count', whitelist) == {'field': 'count', 'gt': 3}
+    assert py2vega_predicate('datum.position.x >= -2', whitelist) == {'field': 'position.x', 'gte': -2}
+    assert py2vega_predicate('0 <= datum.count <= 10', whitelist) == {'field': 'count', 'range': [0, 10]}
+    assert py2vega_predicate('0 < datum.count < 10', whitelist) == {'and': [{'field': 'count', 'gt': 0}, {'field': 'count', 'lt': 10}]}
+    assert py2vega_predicate('datum.category in ("a", "b")', whitelist) == {'field': 'category', 'oneOf': ['a', 'b']}
+    assert py2vega_predicate('datum.category not in [1, -1]', whitelist) == {'not': {'field': 'category', 'oneOf': [1, -1]}}
+    assert py2vega_predicate('datum.count < utc(2020, 0, 1)', whitelist) == {'field': 'count', 'lt': 1577836800000}
+
+
+def test_predicate_composition():
+    assert py2vega_predicate(filter_func, whitelist) == {'and': [
+        {'field': 'size', 'valid': True},
+        {'field': 'count', 'range': [10, 20]},
+        {'field': 'category', 'oneOf': ['a', 'b']},
+    ]}
+    assert py2vega_predicate('not (datum.name == "a" or datum.count * 2 > 3)', whitelist) == {
+        'not': {'or': [{'field': 'name', 'equal': 'a'}, '((datum.count * 2) > 3)']}
+    }
+
+
+def test_predicate_fallback():
+    assert py2vega_predicate('datum.count * 2 > 3', whitelist) == '((datum.count * 2) > 3)'
+    assert py2vega_predicate('datum.name == None', whitelist) == '(datum.name == null)'
+    assert py2vega_predicate('datum.category == "a"', whitelist) == "(datum.category == 'a')"
+    assert py2vega_predicate('datum.count != "3"', whitelist) == "(datum.count != '3')"
+    assert py2vega_predicate('datum.name == 3', whitelist) == '(datum.name == 3)'
+    assert py2vega_predicate('isValid(datum.name)', whitelist) == 'isValid(datum.name)'
+    # Vega-Lite's `valid` rejects infinite numbers, which isValid keeps
+    assert py2vega_predicate('isValid(datum.count)', whitelist) == 'isValid(datum.count)'
+    assert py2vega_predicate('datum.name == datum.category or datum.count', whitelist) == '((datum.name == datum.category) || datum.count)'
+
+
+def test_field_name():
+    assert field_name(Member(Member(Identifier('datum'), 'a'), 'b')) == 'a.b'
+    assert field_name(Index(Identifier('datum'), Literal('a.b[0]'))) == 'a\\.b\\[0\\]'
+    assert field_name(Index(Identifier('datum'), Literal(0))) is None
+    assert field_name(Member(Identifier('value'), 'a')) is None
+
+
+def test_predicate_domains():
+    domains = [Variable('datum', [Variable('count', range=(5, 10)), Variable('kind', values=['a', 'b']), 'name'])]
+    assert py2vega_predicate('datum.kind in ["a", "b"]', domains) == 'true'
+    assert py2vega_predicate('datum.count > 3 and datum.name * 2 > 1', domains) == '((datum.name * 2) > 1)'
+    assert py2vega_predicate('datum.count > 7 and datum.kind == "c"', domains) == {'and': [{'field': 'count', 'gt': 7}, 'false']}
+    assert py2vega_predicate('datum.kind == "a"', domains) == {'field': 'kind', 'equal': 'a'}
+    # Chained comparisons are ranges, and not comparisons of booleans
+    assert py2vega_predicate('-1 <= datum.count <= 1', domains) == {'field': 'count', 'range': [-1, 1]}
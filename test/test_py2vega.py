@@ -1,8 +1,12 @@
+import ast
+import threading
+
 import pytest
 
-from py2vega import py2vega, Variable
-from py2vega.main import Py2VegaSyntaxError, Py2VegaNameError
+from py2vega import py2vega, Translator, Variable
+from py2vega.main import Py2VegaSyntaxError, Py2VegaNameError, VegaExpressionVisitor
 from py2vega.functions.math import isNaN
+from py2vega.interning import InternTable
 
 whitelist = ['value', 'x', Variable('cell', ['value', 'x'])]
 
@@ -41,6 +45,25 @@ def test_list():
     assert py2vega(code, whitelist) == '[true, 3, \'hello\']'
 
 
+def test_literal_containers():
+    # Homogeneous containers of literals are emitted directly from their values
+    assert py2vega('[1, -2, 3.5, -0, 1e100]', whitelist) == '[1, -2, 3.5, -0, 1e+100]'
+    assert py2vega('("a", "b\'c", \'d"e\')', whitelist) == '[\'a\', "b\'c", \'d"e\']'
+    assert py2vega('{"a": 1, "b": -2.5}', whitelist) == "{'a': 1, 'b': -2.5}"
+    assert py2vega('{1: "a", 2: "b"}', whitelist) == "{1: 'a', 2: 'b'}"
+    assert py2vega('{"a": 1, "a": 2}', whitelist) == "{'a': 1, 'a': 2}"
+    assert py2vega('[]', whitelist) == '[]'
+    assert py2vega('{}', whitelist) == '{}'
+
+    # Large literal tables
+    values = ['id{}'.format(idx) for idx in range(100000)]
+    assert py2vega(repr(values), whitelist) == '[{}]'.format(', '.join(repr(value) for value in values))
+
+    table = dict((value, idx) for idx, value in enumerate(values))
+    assert py2vega('{}[value]'.format(repr(table)), whitelist) == '{{{}}}[value]'.format(
+        ', '.join('{}: {}'.format(repr(key), idx) for key, idx in table.items()))
+
+
 def test_dict():
     code = '{\'hello\': 3, \'there\': 4}'
     assert py2vega(code, whitelist) == '{\'hello\': 3, \'there\': 4}'
@@ -67,6 +90,12 @@ def test_binary():
     code = 'value and 3'
     assert py2vega(code, whitelist) == '(value && 3)'
 
+    code = 'value and x and 3'
+    assert py2vega(code, whitelist) == '(value && x && 3)'
+
+    code = 'value or (x or 3) or (x and 3)'
+    assert py2vega(code, whitelist) == '(value || x || 3 || (x && 3))'
+
     code = 'value + 3'
     assert py2vega(code, whitelist) == '(value + 3)'
 
@@ -79,6 +108,23 @@ def test_binary():
         py2vega(code, whitelist)
 
 
+def test_boolop_ordering():
+    # Cheap comparisons are evaluated before expensive function calls
+    code = 'test(regexp("^a", "i"), value) and isValid(x) and value > 3'
+    assert py2vega(code, whitelist) == "(isValid(x) && (value > 3) && test(/^a/i, value))"
+
+    code = 'lower(value) == "a" or x < 3'
+    assert py2vega(code, whitelist) == "((x < 3) || (lower(value) == 'a'))"
+
+    # Operands are not reordered if one of them may not be a boolean
+    code = 'lower(value) == "a" or x'
+    assert py2vega(code, whitelist) == "((lower(value) == 'a') || x)"
+
+    # An operand which may throw is not moved before the operands guarding it
+    code = 'isValid(cell.value) and cell.value.x > 3 and cell.x == 2'
+    assert py2vega(code, [Variable('cell', [Variable('value', ['x']), 'x'])]) == '(isValid(cell.value) && (cell.x == 2) && (cell.value.x > 3))'
+
+
 def test_ternary():
     code = '3 if value else 4'
     assert py2vega(code, whitelist) == '(value ? 3 : 4)'
@@ -98,27 +144,53 @@ def test_compare():
     assert py2vega(code, whitelist) == '(indexof(value, \'chevrolet\') == -1)'
 
 
+def test_membership_lookup():
+    values = ', '.join("'id{}'".format(idx) for idx in range(16))
+    table = ', '.join("'id{}': 1".format(idx) for idx in range(16))
+
+    code = 'value in ({})'.format(values)
+    assert py2vega(code, whitelist) == '(isString(value) && {{{}}}[value] === 1)'.format(table)
+
+    code = 'value not in {{{}}}'.format(values)
+    assert py2vega(code, whitelist) == '(!(isString(value) && {{{}}}[value] === 1))'.format(table)
+
+    # Object keys are the numbers formatted as strings
+    code = 'value in {}'.format(list(range(-1, 15)) + [1e21])
+    assert py2vega(code, whitelist).startswith("(isNumber(value) && {'-1': 1, '0': 1, '1': 1, ")
+    assert py2vega(code, whitelist).endswith("'14': 1, '1e+21': 1}[value] === 1)")
+
+    # Small lists and lists which are not made of literals are searched linearly
+    code = 'value in ["a", "b"]'
+    assert py2vega(code, whitelist) == "(indexof(['a', 'b'], value) != -1)"
+
+    code = 'value in [{}, x]'.format(values)
+    assert py2vega(code, whitelist).startswith("(indexof(['id0', ")
+
+    code = 'value in ({}, "__proto__")'.format(values)
+    assert py2vega(code, whitelist).startswith("(indexof(['id0', ")
+
+
 def test_call():
     code = 'toBoolean(3)'
     assert py2vega(code, whitelist) == 'toBoolean(3)'
 
-    code = 'bool(3)'
-    assert py2vega(code, whitelist) == '(isValid(3) ? toBoolean(3) : false)'
+    code = 'bool(value)'
+    assert py2vega(code, whitelist) == '(isValid(value) ? toBoolean(value) : false)'
 
     code = 'py2vega.string.toString(3)'
     assert py2vega(code, whitelist) == 'toString(3)'
 
-    code = 'str(3)'
-    assert py2vega(code, whitelist) == 'toString(3)'
+    code = 'str(value)'
+    assert py2vega(code, whitelist) == 'toString(value)'
 
     code = 'toNumber("3")'
     assert py2vega(code, whitelist) == 'toNumber(\'3\')'
 
-    code = 'float("3")'
-    assert py2vega(code, whitelist) == 'toNumber(\'3\')'
+    code = 'float(value)'
+    assert py2vega(code, whitelist) == 'toNumber(value)'
 
-    code = 'int("3")'
-    assert py2vega(code, whitelist) == 'floor(toNumber(\'3\'))'
+    code = 'int(value)'
+    assert py2vega(code, whitelist) == 'floor(toNumber(value))'
 
     code = 'length(value)'
     assert py2vega(code, whitelist) == 'length(value)'
@@ -126,12 +198,85 @@ def test_call():
     code = 'len(value)'
     assert py2vega(code, whitelist) == 'length(value)'
 
+    # Coercions of literals are computed
+    assert py2vega('bool(3)', whitelist) == 'true'
+    assert py2vega('bool("0")', whitelist) == 'false'
+    assert py2vega('str(3)', whitelist) == "'3'"
+    assert py2vega('str("")', whitelist) == 'null'
+    assert py2vega('float("3")', whitelist) == '3'
+    assert py2vega('float("3.5")', whitelist) == '3.5'
+    assert py2vega('float("foo")', whitelist) == 'NaN'
+    assert py2vega('int("3.7")', whitelist) == '3'
+    assert py2vega('int(None)', whitelist) == '0'
+    assert py2vega('int(1e300)', whitelist) == '1e+300'
+    assert py2vega('int("-2.5")', whitelist) == '-3'
+    assert py2vega('len("abc")', whitelist) == '3'
+    assert py2vega('len("\U0001f600")', whitelist) == '2'
+    assert py2vega('float("Infinity")', whitelist) == 'toNumber(\'Infinity\')'
+
     # Unsupported function
     code = 'foo(value)'
     with pytest.raises(Py2VegaNameError):
         py2vega(code, whitelist)
 
 
+def double_func(count):
+    doubled = count * 2
+    return float(doubled)
+
+
+def test_type_inference():
+    typed_whitelist = [
+        Variable('count', type='number'),
+        Variable('flag', type='boolean?'),
+        Variable('datum', [Variable('x', type='number?'), Variable('valid', type='boolean'), 'name'])
+    ]
+
+    assert py2vega('float(count)', typed_whitelist) == 'count'
+    assert py2vega('float(datum.x)', typed_whitelist) == 'datum.x'
+    assert py2vega('int(datum.x)', typed_whitelist) == 'floor(datum.x)'
+    assert py2vega('int(count / 2)', typed_whitelist) == 'floor((count / 2))'
+    assert py2vega('float(abs(count))', typed_whitelist) == 'abs(count)'
+    assert py2vega('bool(datum.valid)', typed_whitelist) == 'datum.valid'
+    assert py2vega('bool(count > 2)', typed_whitelist) == '(count > 2)'
+    assert py2vega('bool(flag)', typed_whitelist) == '(flag === true)'
+    assert py2vega('bool(count)', typed_whitelist) == 'toBoolean(count)'
+
+    # Unknown or nullable types keep the full coercion
+    assert py2vega('bool(datum.x)', typed_whitelist) == '(isValid(datum.x) ? toBoolean(datum.x) : false)'
+    assert py2vega('float(datum.name)', typed_whitelist) == 'toNumber(datum.name)'
+    assert py2vega('str(count)', typed_whitelist) == 'toString(count)'
+    assert py2vega(double_func, typed_whitelist) == '(count * 2)'
+
+
+def test_regexp():
+    assert py2vega('test(regexp("^a.c$"), value)', whitelist) == 'test(/^a.c$/, value)'
+    assert py2vega('replace(value, regexp("\\\\d+/", "gi"), "")', whitelist) == 'replace(value, /\\d+\\//gi, \'\')'
+    assert py2vega('regexp("")', whitelist) == '/(?:)/'
+
+    # Patterns which are not constant, or which cannot be checked, are left as calls
+    assert py2vega('regexp(value)', whitelist) == 'regexp(value)'
+    assert py2vega('regexp("\\\\p{L}", "u")', whitelist) == 'regexp(\'\\\\p{L}\', \'u\')'
+    assert py2vega('regexp("(?<=a+)b")', whitelist) == 'regexp(\'(?<=a+)b\')'
+    assert py2vega('regexp("\\\\Aa")', whitelist) == 'regexp(\'\\\\Aa\')'
+    assert py2vega('regexp("(?<name>a)\\\\k<name>")', whitelist) == '/(?<name>a)\\k<name>/'
+
+    with pytest.raises(Py2VegaSyntaxError):
+        py2vega('regexp("(a")', whitelist)
+
+    with pytest.raises(Py2VegaSyntaxError):
+        py2vega('regexp("a", "x")', whitelist)
+
+    # Python-only syntax is invalid in JavaScript
+    for pattern in ['(?i)a', '(?P<name>a)', '(?#comment)a', 'a++', '(?>a)', 'a{2}+', '(?:a)*?+', '[a]++']:
+        with pytest.raises(Py2VegaSyntaxError):
+            py2vega('regexp("{}")'.format(pattern), whitelist)
+
+    # Characters of classes and escaped characters are literal
+    for pattern in ['a[*+]+b', '[++]', '[(?#]', 'a}+', '\\\\++', '\\\\(?P']:
+        assert py2vega('regexp("{}")'.format(pattern), whitelist).startswith('/')
+
+
 def test_subscript():
     code = 'value[0]'
     assert py2vega(code, whitelist) == 'value[0]'
@@ -408,3 +553,83 @@ def assign_func10(value):
 def test_assign10():
     with pytest.raises(Py2VegaSyntaxError, match='Unsupported target'):
         assert py2vega(assign_func10, whitelist)
+
+
+def test_visitor_default_scope():
+    # Assignments made by a visitor created without scope must not leak into other visitors
+    VegaExpressionVisitor(whitelist).visit(ast.parse('leaked = 3').body[0])
+
+    with pytest.raises(NameError):
+        VegaExpressionVisitor(whitelist).visit(ast.parse('leaked', mode='eval').body)
+
+
+def test_translator():
+    translator = Translator(whitelist)
+
+    assert translator.translate(conditional_func) == "if((value < 3), 'red', if((value < 5), 'green', 'yellow'))"
+    assert translator.translate(assign_func8) == "if((value < 3), 3, 8)"
+    assert translator.translate('cell.value') == 'cell.value'
+
+    # Translating the same function twice uses the cached source and gives the same result
+    assert translator.translate(assign_func9) == translator.translate(assign_func9)
+
+    with pytest.raises(Py2VegaNameError, match='available variables are \\[\'value\', \'x\', \'cell\'\\]'):
+        translator.translate('my_variable')
+
+
+def test_translator_threads():
+    translator = Translator(whitelist)
+    values = [
+        conditional_func, assign_func1, assign_func2, assign_func5, assign_func6,
+        assign_func8, assign_func9, func, 'value[1:] if x < 3 else value[0]', 'cell.value'
+    ]
+    expected = [py2vega(value, whitelist) for value in values]
+
+    results = []
+    errors = []
+
+    def work(offset):
+        try:
+            for idx in range(200):
+                position = (idx + offset) % len(values)
+                results.append((position, translator.translate(values[position])))
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(offset, )) for offset in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(results) == 16 * 200
+    for position, result in results:
+        assert result == expected[position]
+
+
+def shared_guard_func1(value, x, isValid):
+    double = value * 2
+    return double if isValid(value) and value > 3 else 0
+
+
+def shared_guard_func2(value, x, isValid):
+    double = x * 2
+    return double if isValid(value) and value > 3 else 1
+
+
+def test_translate_batch():
+    translator = Translator(whitelist)
+    values = [shared_guard_func1, shared_guard_func2, 'value * 2', conditional_func, shared_guard_func1]
+    assert translator.translate_batch(values) == [translator.translate(value) for value in values]
+
+    # Structurally equal subtrees reading the same variables are translated once
+    interned = InternTable()
+    first = translator.translate_expression(shared_guard_func1, interned=interned)
+    second = translator.translate_expression(shared_guard_func2, interned=interned)
+    assert first.test is second.test
+    assert first.consequent is translator.translate_expression('value * 2', interned=interned)
+
+    # But not if they read differently assigned variables
+    assert first.consequent is not second.consequent
+    assert interned.hits > 0
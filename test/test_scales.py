@@ -0,0 +1,144 @@
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.evaluator import compile_expression
+from py2vega.javascript import undefined
+from py2vega.scales import parse_scale, parse_scales, scale_functions
+
+spec = {
+    'width': 200,
+    'height': 100,
+    'data': [{'name': 'table', 'values': [{'x': 3, 'c': 'b'}, {'x': 42, 'c': 'a'}, {'x': None, 'c': 'b'}]}],
+    'scales': [
+        {'name': 'x', 'type': 'linear', 'domain': {'data': 'table', 'field': 'x'}, 'range': 'width', 'nice': True},
+        {'name': 'y', 'type': 'log', 'domain': [3, 870], 'range': 'height', 'nice': True},
+        {'name': 'size', 'type': 'sqrt', 'domain': [0, 100], 'range': [0, 10], 'clamp': True},
+        {'name': 'sym', 'type': 'symlog', 'domain': [-100, 100], 'range': [0, 1]},
+        {'name': 'steps', 'type': 'linear', 'domain': [0, 5, 10], 'range': [0, 100, 110], 'zero': False},
+        {'name': 'band', 'type': 'band', 'domain': {'data': 'table', 'field': 'c', 'sort': True}, 'range': 'width', 'padding': 0.1},
+        {'name': 'point', 'type': 'point', 'domain': ['a', 'b', 'c'], 'range': {'step': 20}, 'padding': 0.5},
+        {'name': 'color', 'type': 'ordinal', 'domain': ['a', 'b'], 'range': ['red', 'blue', 'green']},
+        {'name': 'bucket', 'type': 'quantize', 'domain': [0, 100], 'range': [1, 2, 3, 4]},
+        {'name': 'level', 'type': 'threshold', 'domain': [0, 10], 'range': ['low', 'mid', 'high']},
+    ],
+}
+scales = parse_scales(spec)
+
+translator = Translator([Variable('datum', ['value', 'name'])])
+
+
+@pytest.mark.parametrize('name, value, expected', [
+    ('x', 21, 93.33333333333333),
+    ('x', None, undefined),
+    ('y', 100, 33.33333333333333),
+    ('size', 25, 5),
+    ('size', 400, 10),
+    ('sym', 0, 0.5),
+    ('steps', 7.5, 105),
+    ('steps', 12, 114),
+    ('band', 'b', 104.76190476190476),
+    ('band', 'z', undefined),
+    ('point', 'c', 50),
+    ('color', 'b', 'blue'),
+    ('color', 'z', undefined),
+    ('bucket', 30, 2),
+    ('bucket', 'NaN', undefined),
+    ('level', 5, 'mid'),
+    ('level', -1, 'low'),
+])
+def test_scale(name, value, expected):
+    assert scales[name](value) == pytest.approx(expected) if expected is not undefined else scales[name](value) is undefined
+
+
+def test_configuration():
+    assert scales['x'].domain == [0, 45]
+    assert scales['y'].domain == [1, 1000] and scales['y'].range == [100, 0]
+    assert scales['band'].domain == ['a', 'b']
+    assert scales['band'].bandwidth() == pytest.approx(85.71428571428571)
+    assert scales['point'].range == [10, 30, 50] and scales['point'].bandwidth() == 0
+    assert parse_scale({'type': 'linear', 'domain': [2, 8], 'range': [0, 1], 'reverse': True}).range == [1, 0]
+    with pytest.raises(ValueError):
+        parse_scale({'type': 'linear', 'domain': {'signal': 'extent'}, 'range': [0, 1]})
+    with pytest.raises(ValueError):
+        parse_scale({'type': 'sequential', 'domain': [0, 1], 'range': [0, 1]})
+
+
+def test_invert():
+    assert scales['x'].invert(100) == pytest.approx(22.5)
+    assert scales['y'].invert(0) == pytest.approx(1000)
+    assert scales['band'].invert(150) == 'b'
+    assert scales['band'].invert([0, 200]) == ['a', 'b']
+    assert scales['bucket'].invert(2) == [25, 50]
+    with pytest.raises(TypeError):
+        scales['color'].invert('red')
+
+
+def test_scale_functions():
+    functions = scale_functions(scales)
+    evaluate = compile_expression(translator.translate_expression('scale("x", datum.value) + bandwidth("band") / 2'), functions)
+    assert evaluate({'datum': {'value': 21}}) == pytest.approx(93.33333333333333 + 85.71428571428571 / 2)
+    evaluate = compile_expression(translator.translate_expression('invert("band", scale("band", datum.name))'), functions)
+    assert evaluate({'datum': {'name': 'a'}}) == 'a'
+
+    assert functions['scale']('missing', 3) is undefined
+    assert functions['range']('band') == [0, 200]
+    assert functions['panLinear']([0, 10], 0.5) == [-5, 5]
+    assert functions['zoomLog']([1, 100], None, 2) == pytest.approx([0.1, 1000])
+    assert functions['zoomPow']([0, 4], 0, 0.5, 2) == pytest.approx([0, 2 ** 0.5 * 2])
+    assert functions['bandspace'](3, 0.1, 0.1) == pytest.approx(3.1)
+
+
+def test_apply():
+    numpy = pytest.importorskip('numpy')
+    values = numpy.array([-5, 0, 3, 7.5, 25, 100, 400, numpy.nan])
+    for name in ('x', 'y', 'size', 'sym', 'steps', 'bucket', 'level'):
+        expected = [scales[name](value) for value in values.tolist()]
+        result = scales[name].apply(values)
+        for value, other in zip(result.tolist(), expected):
+            if other is undefined or other != other:
+                assert value is undefined or value != value
+            else:
+                assert value == other or value == pytest.approx(other)
+    assert scales['color'].apply(numpy.array(['a', 'b', 'a'])).tolist() == ['red', 'blue', 'red']
+    assert scales['band'].apply(numpy.array(['b', 'a', 'z'])).tolist()[:2] == [scales['band']('b'), scales['band']('a')]
+
+    for name, values in (('band', ['b', 'a', 'z']), ('point', ['c', 'c', 'a', 'b']), ('level', [-1, 5, 10, numpy.nan])):
+        expected = [scales[name](value) for value in values]
+        result = scales[name].apply(numpy.array(values)).tolist()
+        assert [undefined if value != value else value for value in result] == expected
+    numbers = parse_scale({'type': 'point', 'domain': [3, numpy.nan, 1], 'range': [0, 10]})
+    assert numbers.apply(numpy.array([1, 3, numpy.nan, 2])).tolist()[:3] == [10, 0, 5]
+    assert numbers.apply(numpy.array(['1'])).tolist()[0] != numbers.apply(numpy.array(['1'])).tolist()[0]
+
+    implicit = parse_scale({'type': 'ordinal', 'domain': [], 'range': [10, 20], 'domainImplicit': True})
+    assert implicit.apply(numpy.array(['y', 'x', 'y'])).tolist() == [10, 20, 10]
+    assert implicit.domain == ['y', 'x']
+
+
+def test_fused():
+    numpy = pytest.importorskip('numpy')
+    from py2vega.fused import FusedEvaluator, FusedUnsupportedError
+
+    columns = {'value': numpy.linspace(-10, 110, 1001)}
+    expr = translator.translate_expression('scale("x", datum.value) > scale("bucket", datum.value) * bandwidth("band")')
+    evaluate = compile_expression(expr, scale_functions(scales))
+    expected = [evaluate({'datum': {'value': value}}) for value in columns['value'].tolist()]
+    assert FusedEvaluator(expr, block_size=64, scales=scales).evaluate(columns).tolist() == expected
+
+    with pytest.raises(FusedUnsupportedError):
+        FusedEvaluator(translator.translate_expression('scale("level", datum.value) == 1'), scales=scales).evaluate(columns)
+
+
+def test_invert_array():
+    numpy = pytest.importorskip('numpy')
+    numbers = parse_scale({'type': 'band', 'domain': [10, 20, 30], 'range': [90, 0], 'paddingInner': 0.5})
+    values = [-1, 0, 14, 20, 50, 89, 95, numpy.nan]
+    expected = [numbers.invert(value) for value in values]
+    result = numbers.invert_array(numpy.array(values)).tolist()
+    assert [undefined if value != value else value for value in result] == expected
+
+    assert scales['bucket'].invert_array(numpy.array([2, 4, 5])).tolist()[:2] == [[25, 50], [75, 100]]
+    assert numpy.isnan(scales['bucket'].invert_array(numpy.array([5]))).all()
+    result = scales['level'].invert_array(numpy.array([['mid', 'high'], ['low', 'none']]))
+    assert result.shape == (2, 2, 2)
+    assert result[0].tolist()[0] == [0, 10] and result[0, 1, 0] == 10 and numpy.isnan(result[1]).sum() == 3
@@ -0,0 +1,57 @@
+import pytest
+
+from py2vega import Translator, Variable, py2vega
+
+whitelist = [Variable('datum', [
+    Variable('count', range=(1, 100)),
+    Variable('ratio', type='number', range=(0, 1)),
+    Variable('category', values=['a', 'b', 'c']),
+    Variable('optional', values=['x', None]),
+    Variable('offset', range=(-1, 1)),
+    Variable('size', range=(2, float('inf'))),
+    'other',
+])]
+
+
+@pytest.mark.parametrize('code, expected', [
+    ('bool(datum.count)', 'true'),
+    ('datum.count > 0 and datum.other', 'datum.other'),
+    ('datum.other > 3 and datum.count <= 100', '(datum.other > 3)'),
+    ('datum.other if datum.count >= 1 else 0', 'datum.other'),
+    ('"big" if datum.count > 200 else ("small" if datum.count < 50 else "medium")', "((datum.count < 50) ? 'small' : 'medium')"),
+    ('clamp(datum.ratio, 0, 1) * 2', '(datum.ratio * 2)'),
+    ('clamp(datum.ratio, 0.5, 1)', 'clamp(datum.ratio, 0.5, 1)'),
+    ('datum.category in ["a", "b", "c"]', 'true'),
+    ('datum.category == "z"', 'false'),
+    ('datum.category == "a"', "(datum.category == 'a')"),
+    ('isValid(datum.category) and datum.other > 3', '(datum.other > 3)'),
+    ('isValid(datum.optional) and datum.other > 3', '(isValid(datum.optional) && (datum.other > 3))'),
+    ('datum.other > 3 or PI * datum.ratio > 4', '(datum.other > 3)'),
+    # Zero times an infinity is NaN
+    ('isNaN(datum.offset * datum.size)', 'isNaN((datum.offset * datum.size))'),
+    ('isNaN(datum.count * datum.size)', 'false'),
+])
+def test_simplify(code, expected):
+    assert py2vega(code, whitelist) == expected
+
+
+def branches_func(datum):
+    if datum.count < 0:
+        return 'negative'
+    elif datum.category == 'z':
+        return 'unknown'
+    elif datum.ratio > 0.5:
+        return 'high'
+    else:
+        return 'low'
+
+
+def test_simplify_branches():
+    assert py2vega(branches_func, whitelist) == "if((datum.ratio > 0.5), 'high', 'low')"
+
+
+def test_no_domains():
+    translator = Translator([Variable('datum', [Variable('count', type='number')])])
+    assert not translator.whitelist.domains
+    assert translator.translate('datum.count > 0 and clamp(datum.count, 0, 1)') == \
+        '((datum.count > 0) && clamp(datum.count, 0, 1))'
@@ -0,0 +1,31 @@
+import inspect
+
+from py2vega import py2vega
+
+
+def color_func(value, lower):
+    double = value * 2
+    if double > 3:
+        return 'red'
+    else:
+        return lower(double)
+
+
+def test_source_map():
+    expression, source_map = py2vega('value + 1', whitelist=['value'], source_map=True)
+    assert expression == '(value + 1)'
+    assert [tuple(span) for span in source_map] == [(0, 11, 1, 0), (1, 6, 1, 0), (9, 10, 1, 8)]
+    assert source_map.lookup(9).column == 8
+    assert source_map.lookup(20) is None
+
+
+def test_function_source_map():
+    expression, source_map = py2vega(color_func, whitelist=['value'], source_map=True)
+    assert expression == 'if(((value * 2) > 3), \'red\', lower((value * 2)))'
+
+    # Lines are the lines of the file the function is defined in
+    first_line = inspect.getsourcelines(color_func)[1]
+    inlined = expression.rindex('value * 2')
+    assert source_map.lookup(inlined + 6).line == first_line + 1
+    assert source_map.lookup(expression.index('\'red\'')).line == first_line + 3
+    assert source_map.lookup(expression.index('lower')).line == first_line + 5
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from py2vega import Variable
+from py2vega.template import ExpressionTemplate
+
+whitelist = ['value', Variable('cell', ['value', 'x'])]
+
+
+def threshold_func(value, threshold, colors):
+    if value > threshold:
+        return colors[0]
+    elif cell.value in ('a', 'b'):  # noqa
+        return {'a': colors[1]}['a']
+    else:
+        return 'grey'
+
+
+def test_template():
+    template = ExpressionTemplate(threshold_func, ['threshold', 'colors'], whitelist)
+
+    for threshold, colors, expected in [
+        (3, ['red', 'blue'],
+         "if((value > 3), ['red', 'blue'][0], if((indexof(['a', 'b'], cell.value) != -1), {'a': ['red', 'blue'][1]}['a'], 'grey'))"),
+        (2.5, ('green', None),
+         "if((value > 2.5), ['green', null][0], if((indexof(['a', 'b'], cell.value) != -1), {'a': ['green', null][1]}['a'], 'grey'))"),
+        (-1, [True, {'a': 1}],
+         "if((value > (-1)), [true, {'a': 1}][0], if((indexof(['a', 'b'], cell.value) != -1), {'a': [true, {'a': 1}][1]}['a'], 'grey'))"),
+    ]:
+        assert template.instantiate(threshold, colors) == expected
+        assert template.instantiate(threshold, colors=colors) == expected
+        assert template.instantiate_many([(threshold, colors)]) == [expected]
+
+
+def test_template_values():
+    template = ExpressionTemplate('value > -threshold', ['threshold'], whitelist)
+
+    assert template.instantiate(-1) == '(value > -(-1))'
+    assert template.instantiate(float('nan')) == '(value > -NaN)'
+    assert template.instantiate(float('-inf')) == '(value > -(-1 / 0))'
+    assert template.instantiate([1.5, float('inf')]) == '(value > -[1.5, (1 / 0)])'
+
+
+def test_template_braces():
+    template = ExpressionTemplate('{"a": value, "b": {"c": param}}', ['param'], whitelist)
+
+    assert template.instantiate('}{') == "{'a': value, 'b': {'c': '}{'}}"
+
+
+def test_template_errors():
+    template = ExpressionTemplate('value > threshold', ['threshold'], whitelist)
+
+    with pytest.raises(TypeError):
+        template.instantiate(1, 2)
+
+    with pytest.raises(TypeError):
+        template.instantiate_many([(1, ), ()])
+
+    with pytest.raises(TypeError):
+        template.instantiate(1, bogus=1)
+
+    with pytest.raises(TypeError):
+        template.instantiate(threshold=1, bogus=1)
+
+    with pytest.raises(TypeError):
+        ExpressionTemplate(threshold_func, ['threshold', 'colors'], whitelist).instantiate(colors=[])
+
+    # Parameters are not whitelisted variables
+    with pytest.raises(NameError):
+        ExpressionTemplate('value > threshold', ['other'], whitelist)
+
+
+def test_template_many():
+    template = ExpressionTemplate(threshold_func, ['threshold', 'colors'], whitelist)
+    rows = [(idx, ['color{}'.format(idx), 'blue']) for idx in range(100000)]
+
+    start = time.time()
+    results = template.instantiate_many(rows)
+    assert time.time() - start < 5
+
+    assert len(results) == 100000
+    assert results[42] == template.instantiate(42, ['color42', 'blue'])
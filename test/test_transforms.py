@@ -0,0 +1,178 @@
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.expression import Identifier, Member
+from py2vega.transforms import _dependency_order, extract_lookups, py2vega_formulas, share_subexpressions
+
+whitelist = [Variable('datum', ['value', 'name', 'a'])]
+
+
+def test_share_subexpressions():
+    transforms, expressions = share_subexpressions({
+        'x': 'scale("x", datum.value) + 1',
+        'tooltip': 'upper(trim(datum.name)) + ": " + str(scale("x", datum.value))',
+        'filter': 'upper(trim(datum.name)) == "FOO"',
+    }, whitelist)
+
+    assert transforms == [
+        {'type': 'formula', 'expr': 'upper(trim(datum.name))', 'as': '_shared0'},
+        {'type': 'formula', 'expr': 'scale(\'x\', datum.value)', 'as': '_shared1'},
+    ]
+    assert expressions == {
+        'x': '(datum._shared1 + 1)',
+        'tooltip': '((datum._shared0 + \': \') + toString(datum._shared1))',
+        'filter': '(datum._shared0 == \'FOO\')',
+    }
+
+    # Translated expressions can be given, in a list
+    translator = Translator(whitelist)
+    transforms, expressions = share_subexpressions([
+        translator.translate_expression('lower(datum.name) + "a"'),
+        'lower(datum.name) + "b"'
+    ], whitelist, prefix='shared_')
+    assert transforms == [{'type': 'formula', 'expr': 'lower(datum.name)', 'as': 'shared_0'}]
+    assert expressions == ['(datum.shared_0 + \'a\')', '(datum.shared_0 + \'b\')']
+
+
+def test_share_nested_subexpressions():
+    transforms, expressions = share_subexpressions([
+        'sqrt(datum.value * datum.value) + 1',
+        'sqrt(datum.value * datum.value) + 2',
+        'datum.value * datum.value',
+    ], whitelist, min_cost=1)
+
+    assert transforms == [
+        {'type': 'formula', 'expr': 'datum.value * datum.value', 'as': '_shared0'},
+        {'type': 'formula', 'expr': 'sqrt(datum._shared0)', 'as': '_shared1'},
+    ]
+    assert expressions == ['(datum._shared1 + 1)', '(datum._shared1 + 2)', 'datum._shared0']
+
+    # Formulas come after the formulas they read
+    transforms, expressions = share_subexpressions([
+        'upper(lower(toString(datum.value * 2))) + "a"',
+        'upper(lower(toString(datum.value * 2))) + "b"',
+        'pow(datum.value * 2, 2)',
+        'pow(datum.value * 2, 3)',
+    ], whitelist, min_cost=1)
+    assert expressions[0] == '(datum._shared0 + \'a\')'
+    assert transforms[0] == {'type': 'formula', 'expr': 'datum.value * 2', 'as': '_shared1'}
+    fields = [transform['as'] for transform in transforms]
+    assert fields.index('_shared0') > fields.index('_shared1')
+
+
+def test_share_subexpressions_restrictions():
+    # Volatile and cheap subexpressions are not shared
+    transforms, expressions = share_subexpressions(['random() + datum.value', 'random() + datum.value', 'datum.value'], whitelist)
+    assert transforms == []
+    assert expressions == ['(random() + datum.value)', '(random() + datum.value)', 'datum.value']
+
+    # Subexpressions that may throw are not shared when guarded
+    transforms, expressions = share_subexpressions([
+        'lower(datum.a.name) if isObject(datum.a) else ""',
+        'lower(datum.a.name) if isObject(datum.a) else "a"',
+    ], whitelist)
+    assert transforms == [{'type': 'formula', 'expr': 'isObject(datum.a)', 'as': '_shared0'}]
+    assert expressions == [
+        '(datum._shared0 ? lower(datum.a.name) : \'\')',
+        '(datum._shared0 ? lower(datum.a.name) : \'a\')',
+    ]
+
+    # Subexpressions that never throw are
+    transforms, expressions = share_subexpressions([
+        'floor(datum.value / 2) if isNumber(datum.value) else 0',
+        'floor(datum.value / 2) if isNumber(datum.value) else 1',
+    ], whitelist)
+    assert {'type': 'formula', 'expr': 'floor((datum.value / 2))', 'as': '_shared0'} in transforms
+
+
+def label_func(datum, upper, trim, toString, sqrt, lower, pad):
+    norm = upper(trim(datum.name))
+    if datum.a > 3:
+        return norm + ' large ' + toString(sqrt(datum.a * datum.a + datum.b * datum.b))
+    elif datum.b > 10:
+        return norm + ' b ' + toString(round(datum.b / 10))
+    else:
+        return lower(datum.name.x) + pad(toString(datum.c), 10, '0', 'left')
+
+
+def test_py2vega_formulas():
+    formula_whitelist = [Variable('datum', ['a', 'b', 'c', 'name'])]
+
+    # Shared intermediates are computed once
+    assert py2vega_formulas(label_func, 'label', formula_whitelist) == [
+        {'type': 'formula', 'expr': 'upper(trim(datum.name))', 'as': '_label_0'},
+        {'type': 'formula', 'expr': (
+            'if((datum.a > 3), ((datum._label_0 + \' large \') + toString(sqrt(((datum.a * datum.a) + (datum.b * datum.b))))), '
+            'if((datum.b > 10), ((datum._label_0 + \' b \') + toString(round((datum.b / 10)))), '
+            '(lower(datum.name.x) + pad(toString(datum.c), 10, \'0\', \'left\'))))'
+        ), 'as': 'label'},
+    ]
+
+    # Oversized expressions are split in stages
+    transforms = py2vega_formulas(label_func, 'label', formula_whitelist, max_length=160, prefix='stage')
+    assert transforms == [
+        {'type': 'formula', 'expr': 'upper(trim(datum.name))', 'as': 'stage0'},
+        {'type': 'formula', 'expr': '(datum.stage0 + \' large \') + toString(sqrt(((datum.a * datum.a) + (datum.b * datum.b))))', 'as': 'stage1'},
+        {'type': 'formula', 'expr': (
+            'if((datum.a > 3), datum.stage1, '
+            'if((datum.b > 10), ((datum.stage0 + \' b \') + toString(round((datum.b / 10)))), '
+            '(lower(datum.name.x) + pad(toString(datum.c), 10, \'0\', \'left\'))))'
+        ), 'as': 'label'},
+    ]
+    assert all(len(transform['expr']) <= 160 for transform in transforms[:-1])
+
+    # Subexpressions that may throw are never moved out of their branch
+    transforms = py2vega_formulas('datum.a.b if isValid(datum.a) else 0', 'value', formula_whitelist, max_length=10)
+    assert transforms == [{'type': 'formula', 'expr': 'isValid(datum.a) ? datum.a.b : 0', 'as': 'value'}]
+
+    transforms = py2vega_formulas('datum.a * 2 + datum.b * 3', 'value', formula_whitelist, max_cost=4)
+    assert transforms == [
+        {'type': 'formula', 'expr': 'datum.a * 2', 'as': '_value_0'},
+        {'type': 'formula', 'expr': 'datum.b * 3', 'as': '_value_1'},
+        {'type': 'formula', 'expr': 'datum._value_0 + datum._value_1', 'as': 'value'},
+    ]
+
+
+def test_formulas_reading_their_field():
+    whitelist = [Variable('datum', ['value'])]
+    assert py2vega_formulas('datum.value * 2', 'value', whitelist) == [
+        {'type': 'formula', 'expr': 'datum.value * 2', 'as': 'value'}]
+    # Intermediates read the value of the field before it is overwritten
+    assert py2vega_formulas('datum.value * 2 + datum.value * 3', 'value', whitelist, max_cost=4) == [
+        {'type': 'formula', 'expr': 'datum.value * 2', 'as': '_value_0'},
+        {'type': 'formula', 'expr': 'datum.value * 3', 'as': '_value_1'},
+        {'type': 'formula', 'expr': 'datum._value_0 + datum._value_1', 'as': 'value'},
+    ]
+
+    with pytest.raises(ValueError):
+        _dependency_order([('a', Member(Identifier('datum'), 'b')), ('b', Member(Identifier('datum'), 'a'))], 'datum')
+
+
+def test_extract_lookups():
+    table = '{"a": 1, "b": 2, "c": 3}'
+    datasets, transforms, expressions = extract_lookups({
+        'size': table + '[datum.name] * 2',
+        'label': 'toString(' + table + '[lower(datum.name)])',
+        'small': '{"a": 1}[datum.name]',
+    }, whitelist, min_size=3)
+
+    assert datasets == [{'name': '_lookup_data0', 'values': [
+        {'key': 'a', 'value': 1}, {'key': 'b', 'value': 2}, {'key': 'c', 'value': 3}
+    ]}]
+    assert transforms == [
+        {'type': 'lookup', 'from': '_lookup_data0', 'key': 'key', 'fields': ['name'], 'as': ['_lookup0']},
+        {'type': 'formula', 'expr': 'lower(datum.name)', 'as': '_lookup1_key'},
+        {'type': 'lookup', 'from': '_lookup_data0', 'key': 'key', 'fields': ['_lookup1_key'], 'as': ['_lookup1']},
+    ]
+    assert expressions == {
+        'size': '((datum._lookup0 || {}).value * 2)',
+        'label': 'toString((datum._lookup1 || {}).value)',
+        'small': '{\'a\': 1}[datum.name]',
+    }
+
+    # Keys that may throw are not extracted when guarded, nor are volatile keys
+    datasets, transforms, expressions = extract_lookups([
+        '0 if isValid(datum.a) else ' + table + '[datum.a.name]',
+        table + '[toString(random())]',
+    ], whitelist, min_size=3)
+    assert datasets == [] and transforms == []
@@ -0,0 +1,84 @@
+import pytest
+
+from py2vega import Translator, Variable
+from py2vega.columns import ChunkedEvaluator, filter_rows
+from py2vega.zonemap import Interval, build_zone_map, column_interval, predicate_outcome
+
+translator = Translator(['threshold', Variable('datum', ['a', 'b', 'flag', 'name'])], lookup_threshold=4)
+
+statistics = {
+    'a': Interval(0.0, 10.0, False, False),
+    'b': Interval(-5.0, -1.0, True, False),
+    'flag': Interval(1.0, 1.0, False, True),
+}
+
+
+@pytest.mark.parametrize('code, outcome', [
+    ('datum.a > 20', False),
+    ('datum.a >= 0', True),
+    ('datum.a > 5', None),
+    ('datum.b < 0', None),
+    ('datum.b > 0', False),
+    ('datum.a * 2 + threshold > 0', True),
+    ('datum.a * 2 - datum.b > threshold', None),
+    ('datum.a / datum.b < 0', None),
+    ('datum.a % 3 <= 3', True),
+    ('clamp(datum.a, 20, 30) == 20', True),
+    ('inrange(datum.a, [-1, 11])', True),
+    ('inrange(datum.a, [11, 20])', False),
+    ('datum.a in [-3, -2, 11]', False),
+    ('datum.a in [-3, -2, -1, 11]', False),
+    ('datum.a not in [-2, 11]', True),
+    ('datum.a > 20 or datum.flag', True),
+    ('not datum.flag and datum.a > 5', False),
+    ('datum.flag == 1', True),
+    ('datum.flag is 1', False),
+    ('isNaN(datum.a)', False),
+    ('bool(datum.a + 1)', True),
+    ('datum.name == "x"', None),
+    ('datum.a > 5 if datum.flag else datum.a > 20', None),
+    ('datum.a > 20 if datum.flag else datum.a > 5', False),
+])
+def test_predicate_outcome(code, outcome):
+    assert predicate_outcome(translator.translate_expression(code), statistics, {'threshold': 1}) is outcome
+
+
+def test_column_interval():
+    assert column_interval([3, 1, 2, float('nan')], 0, 3) == Interval(1.0, 3.0, False, False)
+    assert column_interval([3, 1, 2, float('nan')], 1, 4) == Interval(1.0, 2.0, True, False)
+    assert column_interval([True, False], 0, 2) == Interval(0.0, 1.0, False, True)
+    assert column_interval([1, None], 0, 2) is None
+    assert column_interval(['a', 'b'], 0, 2) is None
+
+
+class ReadColumn(list):
+    """Column keeping track of the rows read."""
+
+    def __init__(self, values):
+        super(ReadColumn, self).__init__(values)
+        self.reads = []
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            self.reads.append((key.start, key.stop))
+        return super(ReadColumn, self).__getitem__(key)
+
+
+def test_filter_zone_map():
+    columns = {'a': list(range(100)), 'b': [idx % 7 for idx in range(100)]}
+    zone_map = build_zone_map(columns, chunk_size=10)
+    assert len(zone_map.zones) == 10
+    assert zone_map.zones[2]['a'] == Interval(20.0, 29.0, False, False)
+
+    expr = translator.translate_expression('datum.a >= 35 and datum.a < 62 and datum.b < 7')
+    expected = sum(filter_rows(expr, columns, chunk_size=10), [])
+
+    columns = {'a': ReadColumn(columns['a']), 'b': ReadColumn(columns['b'])}
+    evaluator = ChunkedEvaluator(expr, chunk_size=4)
+    assert sum(evaluator.filter(columns, zone_map=zone_map), []) == expected
+    # Only the chunks 30 to 40 and 60 to 70 are read, the chunks 40 to 60 are always true
+    assert columns['a'].reads == [(30, 34), (34, 38), (38, 40), (60, 64), (64, 68), (68, 70)]
+    assert columns['b'].reads == columns['a'].reads
+
+    assert sum(evaluator.filter(columns, start=45, stop=65, zone_map=zone_map), []) == \
+        [idx for idx in expected if 45 <= idx < 65]